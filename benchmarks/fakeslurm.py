@@ -0,0 +1,1000 @@
+"""
+A local stand-in for SLURM to benchmark and test slurmtools without a cluster.
+
+The stand-in simulates a cluster with a configurable number of jobs (from a handful
+to 100k) in a SQLite job table and provides executable `scontrol`, `squeue`, `sbatch`,
+`scancel`, `sacct`, and `srun` shims that read and modify this table. The shims
+understand the options slurmtools uses (and the most common others) and print their
+output in the format of the real commands. Each call can be slowed down by an artificial
+latency to mimic a busy controller.
+
+The simulated cluster contains pending, running, and finished jobs (some of which the
+"controller" has already forgotten, so that they are only known to `sacct`) and job arrays.
+The simulation only advances when asked to (`tick`), or on every call if the cluster
+was created with `--auto-tick`: then running jobs whose time is up complete and
+pending jobs (whose dependencies are satisfied) start.
+
+Usage
+-----
+    python benchmarks/fakeslurm.py init /tmp/cluster --jobs 10000 --latency 0.05
+
+    # either put the shims on the PATH
+    export PATH=/tmp/cluster/bin:$PATH
+    # or point slurmtools at them
+    export SLURMTOOLS_SLURM_BIN=/tmp/cluster/bin
+
+    slurmtools queue
+    python benchmarks/fakeslurm.py tick /tmp/cluster
+
+The latency of an existing cluster can be overridden with the `FAKESLURM_LATENCY` environment variable.
+"""
+
+import argparse
+import getpass
+import os
+import random
+import re
+import shlex
+import sqlite3
+import stat
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+commands = ( "scontrol", "squeue", "sbatch", "scancel", "sacct", "srun" )
+"""The SLURM commands provided by the stand-in"""
+
+active_states = ( "PENDING", "RUNNING" )
+"""The states of jobs that are still in the queue"""
+
+short_states = {
+    "PENDING" : "PD", "RUNNING" : "R", "COMPLETED" : "CD", "FAILED" : "F",
+    "CANCELLED" : "CA", "TIMEOUT" : "TO", "COMPLETING" : "CG",
+}
+"""The short state codes of squeue (%t)"""
+
+state_weights = { "RUNNING" : 0.5, "PENDING" : 0.3, "COMPLETED" : 0.1, "FAILED" : 0.05, "CANCELLED" : 0.05 }
+"""The distribution of job states of a new cluster"""
+
+partitions = ( "short", "main", "long", "gpu" )
+
+pending_reasons = ( "Priority", "Resources", "QOSMaxJobsPerUserLimit" )
+
+max_array_size = 1001
+
+_schema = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        array_job_id INTEGER,
+        array_task_id INTEGER,
+        name TEXT NOT NULL,
+        user TEXT NOT NULL,
+        state TEXT NOT NULL,
+        reason TEXT,
+        partition TEXT NOT NULL,
+        submit REAL NOT NULL,
+        start REAL,
+        end REAL,
+        duration INTEGER NOT NULL,
+        time_limit INTEGER NOT NULL,
+        nodes INTEGER NOT NULL,
+        nodelist TEXT,
+        cpus INTEGER NOT NULL,
+        mem INTEGER NOT NULL,
+        workdir TEXT NOT NULL,
+        command TEXT,
+        stdout TEXT,
+        stderr TEXT,
+        exit_code INTEGER NOT NULL DEFAULT 0,
+        max_rss INTEGER,
+        dependency TEXT,
+        purged INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS jobs_state ON jobs ( state );
+    CREATE INDEX IF NOT EXISTS jobs_array ON jobs ( array_job_id );
+    CREATE TABLE IF NOT EXISTS meta ( key TEXT PRIMARY KEY, value TEXT );
+"""
+
+# ----------------------------------------------------
+# The simulated cluster
+# ----------------------------------------------------
+
+class Cluster:
+    """
+    A simulated SLURM cluster.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the cluster (as created by `create`).
+    """
+    def __init__( self, directory : str ):
+        self.directory = os.path.abspath( directory )
+        self.db = sqlite3.connect( os.path.join( self.directory, "cluster.sqlite" ), timeout = 60, isolation_level = None )
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript( _schema )
+
+    def meta( self, key : str, default = None ) -> str:
+        """
+        Get a setting of the cluster.
+        """
+        row = self.db.execute( "SELECT value FROM meta WHERE key = ?", ( key, ) ).fetchone()
+        return row["value"] if row else default
+
+    def set_meta( self, **settings ):
+        """
+        Set settings of the cluster.
+        """
+        self.db.executemany( "INSERT OR REPLACE INTO meta ( key, value ) VALUES ( ?, ? )", [ ( k, str(v) ) for k, v in settings.items() ] )
+
+    @property
+    def latency( self ) -> float:
+        """
+        The artificial latency of each call in seconds.
+        """
+        return float( os.environ.get( "FAKESLURM_LATENCY", self.meta( "latency", 0 ) ) )
+
+    def jobs( self, where : str = "1", params : tuple = () ) -> list:
+        """
+        Get jobs from the job table (ordered by their ids).
+        """
+        return self.db.execute( f"SELECT * FROM jobs WHERE {where} ORDER BY id", params ).fetchall()
+
+    def resolve( self, jobid : str, where : str = "1" ) -> list:
+        """
+        Get the jobs of a job-id (`1234`), an array task (`1234_5`), or a whole array (`1234`).
+        """
+        if "_" in jobid:
+            array, task = jobid.split( "_", 1 )
+            if not array.isdigit() or not task.isdigit():
+                return []
+            return self.jobs( f"array_job_id = ? AND array_task_id = ? AND {where}", ( int(array), int(task) ) )
+        if not jobid.isdigit():
+            return []
+        return self.jobs( f"( id = ? OR array_job_id = ? ) AND {where}", ( int(jobid), int(jobid) ) )
+
+    def submit( self, jobs : list ) -> int:
+        """
+        Add new jobs with consecutive ids.
+
+        Parameters
+        ----------
+        jobs : list
+            The jobs as dicts of column values (without `id`).
+            If there is more than one job, they form a job array.
+
+        Returns
+        -------
+        jobid : int
+            The id of the (first) job.
+        """
+        self.db.execute( "BEGIN IMMEDIATE" )
+        try:
+            first = ( self.db.execute( "SELECT MAX( id ) FROM jobs" ).fetchone()[0] or 999999 ) + 1
+            for idx, job in enumerate( jobs ):
+                job = dict( job, id = first + idx )
+                if len(jobs) > 1 or job.get( "array_task_id" ) is not None:
+                    job["array_job_id"] = first
+                for key in ( "stdout", "stderr" ):
+                    job[key] = _expand( job[key], job )
+                columns = ", ".join( job )
+                self.db.execute( f"INSERT INTO jobs ( {columns} ) VALUES ( {', '.join( '?' * len(job) )} )", tuple( job.values() ) )
+            self.db.execute( "COMMIT" )
+        except BaseException:
+            self.db.execute( "ROLLBACK" )
+            raise
+        return first
+
+    def cancel( self, ids : list ):
+        """
+        Cancel jobs.
+        """
+        now = time.time()
+        self.db.execute( "BEGIN IMMEDIATE" )
+        self.db.executemany( """
+            UPDATE jobs SET state = 'CANCELLED', reason = NULL,
+                            end = ?, start = COALESCE( start, ? ), exit_code = 15
+            WHERE id = ?""", [ ( now, now, i ) for i in ids ] )
+        self.db.execute( "COMMIT" )
+
+    def tick( self, start_fraction : float = 0.1 ):
+        """
+        Advance the simulation: complete the running jobs whose time is up
+        and start a fraction of the pending jobs (whose dependencies are satisfied).
+        """
+        now = time.time()
+        self.db.execute( "BEGIN IMMEDIATE" )
+        try:
+            self.db.execute( "UPDATE jobs SET state = 'COMPLETED', max_rss = mem * 524288 WHERE state = 'RUNNING' AND end <= ?", ( now, ) )
+            self.db.execute( "UPDATE jobs SET state = 'TIMEOUT' WHERE state = 'COMPLETED' AND duration > time_limit" )
+
+            pending = self.jobs( "state = 'PENDING'" )
+            startable = []
+            for job in pending:
+                satisfied = self._dependency( job["dependency"] )
+                if satisfied is None:
+                    self.db.execute( "UPDATE jobs SET reason = 'DependencyNeverSatisfied' WHERE id = ?", ( job["id"], ) )
+                elif satisfied:
+                    startable.append( job )
+            startable = startable[ : max( 1, int( len(startable) * start_fraction ) ) ] if startable else []
+            self.db.executemany( """
+                UPDATE jobs SET state = 'RUNNING', reason = NULL, start = ?, end = ? + MIN( duration, time_limit ),
+                                nodelist = ?
+                WHERE id = ?""", [ ( now, now, _nodelist( job["id"], job["nodes"] ), job["id"] ) for job in startable ] )
+            self.db.execute( "COMMIT" )
+        except BaseException:
+            self.db.execute( "ROLLBACK" )
+            raise
+
+    def _dependency( self, dependency : str ):
+        """
+        Check a dependency (e.g. `afterok:12:13,afterany:14`).
+        Returns True if it is satisfied, False if not yet, and None if it never will be.
+        """
+        if not dependency:
+            return True
+        satisfied = True
+        for condition in re.split( "[,?]", dependency ):
+            kind, _, ids = condition.partition( ":" )
+            for jobid in ids.split( ":" ):
+                for job in self.resolve( jobid.split( "+" )[0] ):
+                    if kind == "after":
+                        satisfied &= job["state"] != "PENDING"
+                    elif kind == "afterany":
+                        satisfied &= job["state"] not in active_states
+                    elif kind in ( "afterok", "aftercorr" ):
+                        if job["state"] in active_states:
+                            satisfied = False
+                        elif job["state"] != "COMPLETED" or job["exit_code"] != 0:
+                            return None
+                    elif kind == "afternotok":
+                        if job["state"] in active_states:
+                            satisfied = False
+                        elif job["state"] == "COMPLETED" and job["exit_code"] == 0:
+                            return None
+        return satisfied
+
+def create( directory : str, jobs : int = 1000, latency : float = 0, arrays : float = 0.2, array_size : int = 100,
+            users : int = 20, mine : float = 0.5, purged : float = 0.5, auto_tick : bool = False, seed : int = 0,
+            max_submit : int = 0 ) -> str:
+    """
+    Create a simulated cluster.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the cluster (this is created and any existing cluster is replaced).
+    jobs : int
+        The number of jobs in the cluster.
+    latency : float
+        The artificial latency of each SLURM call in seconds.
+    arrays : float
+        The fraction of jobs that are tasks of job arrays.
+    array_size : int
+        The number of tasks per job array.
+    users : int
+        The number of other users.
+    mine : float
+        The fraction of jobs owned by the current user.
+    purged : float
+        The fraction of finished jobs that the controller has forgotten
+        (these are only reported by `sacct`).
+    auto_tick : bool
+        Advance the simulation on each call.
+    seed : int
+        The seed of the random job table.
+    max_submit : int
+        The maximal number of pending and running jobs (and array tasks) per user
+        (like SLURM's MaxSubmitJobs). 0 for no limit.
+
+    Returns
+    -------
+    bin : str
+        The directory of the SLURM shims.
+    """
+    directory = os.path.abspath( directory )
+    os.makedirs( directory, exist_ok = True )
+    database = os.path.join( directory, "cluster.sqlite" )
+    if os.path.exists( database ):
+        os.remove( database )
+
+    cluster = Cluster( directory )
+    cluster.set_meta( latency = latency, auto_tick = int( auto_tick ), max_array_size = max_array_size, max_submit = max_submit )
+    rows = _random_jobs( jobs, directory, arrays, array_size, users, mine, purged, random.Random( seed ) )
+    if rows:
+        cluster.db.execute( "BEGIN" )
+        cluster.db.executemany( f"INSERT INTO jobs ( {', '.join( rows[0] )} ) VALUES ( {', '.join( '?' * len(rows[0]) )} )", [ tuple( i.values() ) for i in rows ] )
+        cluster.db.execute( "COMMIT" )
+    return install( directory )
+
+def install( directory : str ) -> str:
+    """
+    Write the executable SLURM shims of a cluster.
+
+    Returns
+    -------
+    bin : str
+        The directory of the shims.
+    """
+    directory = os.path.abspath( directory )
+    bindir = os.path.join( directory, "bin" )
+    os.makedirs( bindir, exist_ok = True )
+    for command in commands:
+        path = os.path.join( bindir, command )
+        with open( path, "w" ) as f:
+            f.write( f"""#!/bin/sh\nexec {shlex.quote( sys.executable )} {shlex.quote( os.path.abspath( __file__ ) )} --cluster {shlex.quote( directory )} {command} "$@"\n""" )
+        os.chmod( path, os.stat( path ).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH )
+    return bindir
+
+def _random_jobs( n : int, directory : str, arrays : float, array_size : int, users : int, mine : float, purged : float, rng ) -> list:
+    """
+    Make the rows of a random job table.
+    """
+    now = time.time()
+    me = getpass.getuser()
+    others = [ f"user{i:03d}" for i in range( 1, users + 1 ) ] or [ me ]
+    states, weights = zip( *state_weights.items() )
+    workdir = os.path.join( directory, "work" )
+
+    rows = []
+    jobid = 1000000
+    while len(rows) < n:
+        is_array = rng.random() < arrays
+        size = min( array_size, n - len(rows) ) if is_array else 1
+        user = me if rng.random() < mine else rng.choice( others )
+        name = f"{'sweep' if is_array else 'job'}_{jobid}"
+        partition = rng.choice( partitions )
+        time_limit = rng.choice( ( 1800, 3600, 4 * 3600, 24 * 3600, 3 * 24 * 3600 ) )
+        submit = now - rng.uniform( 60, 3 * 24 * 3600 )
+        cpus, mem = rng.choice( ( ( 1, 1000 ), ( 4, 10000 ), ( 16, 64000 ) ) )
+        nodes = 1 if cpus < 16 else rng.choice( ( 1, 2 ) )
+        for task in range( size ):
+            state = rng.choices( states, weights )[0]
+            duration = int( rng.uniform( 0.05, 1.1 ) * time_limit )
+            start = end = nodelist = reason = max_rss = None
+            exit_code = 0
+            if state == "PENDING":
+                reason = rng.choice( pending_reasons )
+            else:
+                start = submit + rng.uniform( 0, now - submit )
+                nodelist = _nodelist( jobid + task, nodes )
+                if state == "RUNNING":
+                    # jobs that are "almost done" complete on the next ticks
+                    end = start + min( duration, time_limit ) if start + min( duration, time_limit ) > now else now + rng.uniform( 1, 600 )
+                else:
+                    end = min( start + min( duration, time_limit ), now )
+                    max_rss = int( mem * rng.uniform( 0.1, 0.9 ) ) << 20
+                    exit_code = { "COMPLETED" : 0, "FAILED" : 1, "CANCELLED" : 15 }[ state ]
+            job = {
+                "id" : jobid + task,
+                "array_job_id" : jobid if is_array else None,
+                "array_task_id" : task if is_array else None,
+                "name" : name, "user" : user, "state" : state, "reason" : reason, "partition" : partition,
+                "submit" : submit, "start" : start, "end" : end, "duration" : duration, "time_limit" : time_limit,
+                "nodes" : nodes, "nodelist" : nodelist, "cpus" : cpus, "mem" : mem, "workdir" : workdir,
+                "command" : os.path.join( workdir, f"{name}.slurm" ),
+                "stdout" : os.path.join( workdir, f"slurm-{jobid}_{task}.out" if is_array else f"slurm-{jobid}.out" ),
+                "exit_code" : exit_code, "max_rss" : max_rss, "dependency" : None,
+                "purged" : int( state not in active_states and rng.random() < purged ),
+            }
+            job["stderr"] = job["stdout"]
+            rows.append( job )
+        jobid += size
+    return rows[:n]
+
+# ----------------------------------------------------
+# Formatting
+# ----------------------------------------------------
+
+def _nodelist( jobid : int, nodes : int ) -> str:
+    """
+    Get the (deterministic) nodes of a job.
+    """
+    first = jobid % 500 + 1
+    return ",".join( f"node{first + i:04d}" for i in range( nodes ) )
+
+def _duration( seconds : float, squeue : bool = False ) -> str:
+    """
+    Format a duration as `D-HH:MM:SS` (or the shorter `M:SS` and `H:MM:SS` of squeue).
+    """
+    if seconds is None:
+        return "INVALID"
+    minutes, seconds = divmod( max( int(seconds), 0 ), 60 )
+    hours, minutes = divmod( minutes, 60 )
+    days, hours = divmod( hours, 24 )
+    if days:
+        return f"{days}-{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if squeue:
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+def _timestamp( value : float, unknown : str = "Unknown" ) -> str:
+    """
+    Format a timestamp the way SLURM does.
+    """
+    if value is None:
+        return unknown
+    return datetime.fromtimestamp( value ).strftime( "%Y-%m-%dT%H:%M:%S" )
+
+def _runtime( job, now : float ) -> float:
+    """
+    Get the time a job has been running for.
+    """
+    if job["start"] is None:
+        return 0
+    return ( job["end"] if job["state"] not in active_states else now ) - job["start"]
+
+def _display_id( job ) -> str:
+    """
+    Get the id of a job as SLURM displays it (`1234` or `1230_4` for array tasks).
+    """
+    if job["array_job_id"] is not None:
+        return f"{job['array_job_id']}_{job['array_task_id']}"
+    return str( job["id"] )
+
+def _expand( pattern : str, job : dict ) -> str:
+    """
+    Fill the replacement symbols of a SLURM filename pattern.
+    """
+    if not pattern:
+        return pattern
+    values = {
+        "j" : job["id"], "A" : job.get( "array_job_id" ) or job["id"],
+        "a" : job.get( "array_task_id" ) if job.get( "array_task_id" ) is not None else 4294967294,
+        "x" : job["name"], "u" : job["user"], "%" : "%",
+    }
+    expanded = re.sub( "%(\\d*)([jAaxu%])", lambda m: str( values[ m.group(2) ] ).zfill( int( m.group(1) or 0 ) ), pattern )
+    return os.path.join( job["workdir"], expanded )
+
+def _record( job, now : float, details : bool ) -> str:
+    """
+    Format a job as a record of `scontrol show job`.
+    """
+    array = f"ArrayJobId={job['array_job_id']} ArrayTaskId={job['array_task_id']} " if job["array_job_id"] is not None else ""
+    uid = 1000 + sum( map( ord, job["user"] ) ) % 1000
+    running = job["state"] == "RUNNING"
+    end = job["end"] if job["state"] != "PENDING" else None
+    lines = [
+        f"JobId={job['id']} {array}JobName={job['name']}",
+        f"   UserId={job['user']}({uid}) GroupId={job['user']}({uid}) MCS_label=N/A",
+        f"   Priority={max( 1, 100000 - job['id'] % 100000 )} Nice=0 Account={job['user']} QOS=normal",
+        f"   JobState={job['state']} Reason={job['reason'] or 'None'} Dependency={job['dependency'] or '(null)'}",
+        f"   Requeue=1 Restarts=0 BatchFlag=1 Reboot=0 ExitCode={job['exit_code']}:0",
+        f"   RunTime={_duration( _runtime( job, now ) )} TimeLimit={_duration( job['time_limit'] )} TimeMin=N/A",
+        f"   SubmitTime={_timestamp( job['submit'] )} EligibleTime={_timestamp( job['submit'] )}",
+        f"   StartTime={_timestamp( job['start'] )} EndTime={_timestamp( end )} Deadline=N/A",
+        f"   Partition={job['partition']} AllocNode:Sid=login01:4242",
+        f"   ReqNodeList=(null) ExcNodeList=(null)",
+        f"   NodeList={job['nodelist'] or '(null)'}",
+        f"   NumNodes={job['nodes']} NumCPUs={job['cpus']} NumTasks=1 CPUs/Task={job['cpus']} ReqB:S:C:T=0:0:*:*",
+        f"   TRES=cpu={job['cpus']},mem={job['mem']}M,node={job['nodes']},billing={job['cpus']}",
+    ]
+    if details and running:
+        lines += [ f"     Nodes={node} CPU_IDs=0-{job['cpus'] - 1} Mem={job['mem']} GRES=" for node in job["nodelist"].split( "," ) ]
+    lines += [
+        f"   MinCPUsNode={job['cpus']} MinMemoryNode={job['mem']}M MinTmpDiskNode=0",
+        f"   Command={job['command'] or '(null)'}",
+        f"   WorkDir={job['workdir']}",
+        f"   StdErr={job['stderr']}",
+        f"   StdIn=/dev/null",
+        f"   StdOut={job['stdout']}",
+        f"   Power=",
+    ]
+    return "\n".join( lines ) + "\n"
+
+# ----------------------------------------------------
+# Argument parsing
+# ----------------------------------------------------
+
+def _options( argv : list, takes_value : set, flags : dict = None, stop : bool = False ) -> tuple:
+    """
+    Parse SLURM style options (`--opt=value`, `--opt value`, `-o value`, and `-ovalue`).
+
+    Parameters
+    ----------
+    argv : list
+        The arguments.
+    takes_value : set
+        The options that take a value (long options without the dashes, short options with one dash).
+    flags : dict
+        Aliases of short options (e.g. `{ "-t" : "time" }`).
+    stop : bool
+        Stop parsing at the first positional argument (e.g. the script of sbatch).
+
+    Returns
+    -------
+    options : dict
+        The options by their (long) names. Flags have the value True.
+    positional : list
+        The positional arguments.
+    """
+    flags = flags or {}
+    options, positional = {}, []
+    idx = 0
+    while idx < len(argv):
+        arg = argv[idx]
+        if arg.startswith( "--" ) and len(arg) > 2:
+            name, eq, value = arg[2:].partition( "=" )
+            if not eq:
+                if name in takes_value and idx + 1 < len(argv):
+                    idx += 1
+                    value = argv[idx]
+                else:
+                    value = True
+            options[ name ] = value
+        elif arg.startswith( "-" ) and len(arg) > 1:
+            short = arg[:2]
+            name = flags.get( short, short )
+            if name in takes_value or short in takes_value:
+                value = arg[2:]
+                if not value and idx + 1 < len(argv):
+                    idx += 1
+                    value = argv[idx]
+                options[ name ] = value
+            else:
+                for char in arg[1:]:
+                    options[ flags.get( f"-{char}", f"-{char}" ) ] = True
+        else:
+            positional.append( arg )
+            if stop:
+                positional += argv[ idx + 1 : ]
+                break
+        idx += 1
+    return options, positional
+
+def _parse_limit( value : str ) -> int:
+    """
+    Parse a time limit (`MM`, `MM:SS`, `HH:MM:SS`, `D-HH`, `D-HH:MM`, `D-HH:MM:SS`) into seconds.
+    """
+    days = 0
+    if "-" in value:
+        days, value = value.split( "-", 1 )
+        parts = [ int(i) for i in value.split( ":" ) ] + [ 0, 0 ]
+        hours, minutes, seconds = parts[:3]
+    else:
+        parts = [ int(i) for i in value.split( ":" ) ]
+        if len(parts) == 1:
+            hours, minutes, seconds = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, ( minutes, seconds ) = 0, parts
+        else:
+            hours, minutes, seconds = parts[:3]
+    return ( ( int(days) * 24 + hours ) * 60 + minutes ) * 60 + seconds
+
+def _parse_memory( value : str ) -> int:
+    """
+    Parse a memory specification (e.g. `10M` or `4G`) into megabytes.
+    """
+    match = re.fullmatch( "([0-9.]+)([KMGT]?)B?", value.strip().upper() )
+    if not match:
+        raise ValueError( value )
+    number, unit = match.groups()
+    return max( 1, int( float( number ) * { "K" : 1 / 1024, "" : 1, "M" : 1, "G" : 1024, "T" : 1024 ** 2 }[ unit ] ) )
+
+def _parse_array( value : str ) -> list:
+    """
+    Parse an array specification (e.g. `0-9`, `1,3,5`, `0-20:2`, or `0-99%10`) into task ids.
+    """
+    value = value.split( "%" )[0]
+    tasks = []
+    for part in value.split( "," ):
+        bounds, _, step = part.partition( ":" )
+        first, _, last = bounds.partition( "-" )
+        tasks += list( range( int(first), int( last or first ) + 1, int( step or 1 ) ) )
+    return tasks
+
+def _parse_time( value : str ) -> float:
+    """
+    Parse a sacct time (`now`, `now-2days`, `now-3hours`, or an ISO timestamp) into a timestamp.
+    """
+    match = re.fullmatch( "now(?:-(\\d+)(days|hours|minutes|seconds))?", value )
+    if match:
+        offset = timedelta( **{ match.group(2) : int( match.group(1) ) } ) if match.group(1) else timedelta()
+        return ( datetime.now() - offset ).timestamp()
+    return datetime.fromisoformat( value ).timestamp()
+
+def _split( value ) -> set:
+    """
+    Split a comma separated option value.
+    """
+    return set( str( value ).split( "," ) ) if value not in ( None, True ) else None
+
+# ----------------------------------------------------
+# The commands
+# ----------------------------------------------------
+
+def scontrol( cluster : Cluster, argv : list ) -> tuple:
+    """
+    `scontrol show job [-dd] [ID]`, `scontrol show jobid [-dd] ID`, and `scontrol show config`.
+    """
+    details = any( i.startswith( "-d" ) for i in argv )
+    argv = [ i for i in argv if not i.startswith( "-" ) ]
+    if argv[:2] == [ "show", "config" ]:
+        return f"MaxArraySize            = {cluster.meta( 'max_array_size', max_array_size )}\n", "", 0
+    if argv[:1] != [ "show" ] or len(argv) < 2 or argv[1] not in ( "job", "jobs", "jobid" ):
+        return "", f"scontrol: error: unsupported command {' '.join( argv )}\n", 1
+
+    now = time.time()
+    if len(argv) > 2:
+        # a comma separated list of job-ids selects all of them
+        jobs = { job["id"] : job for jobid in argv[2].split( "," ) for job in cluster.resolve( jobid, "purged = 0" ) }
+        jobs = [ jobs[i] for i in sorted( jobs ) ]
+        if not jobs:
+            return "", "slurm_load_jobs error: Invalid job id specified\n", 1
+    else:
+        jobs = cluster.jobs( "purged = 0" )
+        if not jobs:
+            return "No jobs in the system\n", "", 0
+    return "\n".join( _record( job, now, details ) for job in jobs ), "", 0
+
+_squeue_headers = {
+    "A" : "JOBID", "i" : "JOBID", "P" : "PARTITION", "u" : "USER", "a" : "ACCOUNT", "T" : "STATE", "t" : "ST",
+    "M" : "TIME", "l" : "TIME_LIMIT", "D" : "NODES", "R" : "NODELIST(REASON)", "j" : "NAME", "N" : "NODELIST",
+    "r" : "REASON", "C" : "CPUS", "m" : "MIN_MEMORY", "S" : "START_TIME", "e" : "END_TIME", "V" : "SUBMIT_TIME",
+    "Z" : "WORK_DIR", "o" : "COMMAND", "E" : "DEPENDENCY",
+}
+
+def _squeue_field( job, field : str, now : float ) -> str:
+    """
+    Get a field of a job for the squeue output.
+    """
+    if field == "A": return str( job["id"] )
+    if field == "i": return _display_id( job )
+    if field == "P": return job["partition"]
+    if field in "ua": return job["user"]
+    if field == "T": return job["state"]
+    if field == "t": return short_states.get( job["state"], job["state"][:2] )
+    if field == "M": return _duration( _runtime( job, now ), squeue = True )
+    if field == "l": return _duration( job["time_limit"], squeue = True )
+    if field == "D": return str( job["nodes"] )
+    if field == "R": return job["nodelist"] if job["state"] == "RUNNING" else f"({job['reason'] or 'None'})"
+    if field == "j": return job["name"]
+    if field == "N": return job["nodelist"] or ""
+    if field == "r": return job["reason"] or "None"
+    if field == "C": return str( job["cpus"] )
+    if field == "m": return f"{job['mem']}M"
+    if field == "S": return _timestamp( job["start"], "N/A" )
+    if field == "e": return _timestamp( job["end"], "N/A" )
+    if field == "V": return _timestamp( job["submit"] )
+    if field == "Z": return job["workdir"]
+    if field == "o": return job["command"] or ""
+    if field == "E": return job["dependency"] or "(null)"
+    return ""
+
+def squeue( cluster : Cluster, argv : list ) -> tuple:
+    """
+    `squeue` with the `--format`, `--noheader`, `--account`, `--user`, `--me`, `--states`,
+    `--partition`, `--name`, and `--jobs` options.
+    """
+    options, _ = _options( argv,
+                            { "format", "account", "user", "states", "partition", "name", "jobs", "-o", "-A", "-u", "-t", "-p", "-n", "-j" },
+                            { "-o" : "format", "-A" : "account", "-u" : "user", "-t" : "states", "-p" : "partition", "-n" : "name", "-j" : "jobs", "-h" : "noheader" } )
+    fmt = options.get( "format" ) or "%.18i %.9P %.8j %.8u %.2t %.10M %.6D %R"
+
+    states = _split( options.get( "states" ) )
+    if states is None:
+        states = set( active_states )
+    elif "all" in { i.lower() for i in states }:
+        states = set( short_states )
+    else:
+        long_states = { v : k for k, v in short_states.items() }
+        states = { long_states.get( i.upper(), i.upper() ) for i in states }
+
+    users = _split( options.get( "user" ) ) or _split( options.get( "account" ) )
+    if options.get( "me" ):
+        users = { getpass.getuser() }
+    partitions_ = _split( options.get( "partition" ) )
+    names = _split( options.get( "name" ) )
+    jobids = _split( options.get( "jobs" ) )
+
+    # like scontrol, squeue only knows the jobs still held by the controller
+    where, params = [ "purged = 0", f"state IN ( {', '.join( '?' * len(states) )} )" ], list( states )
+    for column, values in ( ( "user", users ), ( "partition", partitions_ ), ( "name", names ) ):
+        if values:
+            where.append( f"{column} IN ( {', '.join( '?' * len(values) )} )" )
+            params += list( values )
+    jobs = cluster.jobs( " AND ".join( where ), tuple( params ) )
+    if jobids:
+        jobs = [ job for job in jobs if str( job["id"] ) in jobids or _display_id( job ) in jobids or str( job["array_job_id"] ) in jobids ]
+
+    specs = list( re.finditer( "%(\\.?)(\\d*)([A-Za-z])", fmt ) )
+    def render( values : list ) -> str:
+        out, last = [], 0
+        for spec, value in zip( specs, values ):
+            out.append( fmt[ last : spec.start() ] )
+            right, width = spec.group(1), spec.group(2)
+            if width:
+                value = value[ : int(width) ]
+                value = value.rjust( int(width) ) if right else value.ljust( int(width) )
+            out.append( value )
+            last = spec.end()
+        out.append( fmt[ last: ] )
+        return "".join( out )
+
+    now = time.time()
+    fields = [ spec.group(3) for spec in specs ]
+    lines = [ render( [ _squeue_field( job, f, now ) for f in fields ] ) for job in jobs ]
+    if not options.get( "noheader" ):
+        lines.insert( 0, render( [ _squeue_headers.get( f, f ) for f in fields ] ) )
+    return "".join( f"{i}\n" for i in lines ), "", 0
+
+def sbatch( cluster : Cluster, argv : list ) -> tuple:
+    """
+    `sbatch [options] script [args]` (including the `#SBATCH` directives of the script).
+    """
+    takes_value = {
+                    "time", "cpus-per-task", "mem", "partition", "nodes", "job-name", "output", "error", "array",
+                    "dependency", "chdir", "ntasks", "account", "qos", "mail-type", "mail-user",
+                    "-t", "-c", "-p", "-N", "-J", "-o", "-e", "-a", "-d", "-D", "-n", "-A", "-q",
+                }
+    flags = {
+                "-t" : "time", "-c" : "cpus-per-task", "-p" : "partition", "-N" : "nodes", "-J" : "job-name",
+                "-o" : "output", "-e" : "error", "-a" : "array", "-d" : "dependency", "-D" : "chdir",
+                "-n" : "ntasks", "-A" : "account", "-q" : "qos",
+            }
+    options, positional = _options( argv, takes_value, flags, stop = True )
+    if not positional:
+        return "", "sbatch: error: Batch script is empty!\n", 1
+    script = positional[0]
+    if not os.path.exists( script ):
+        return "", f"sbatch: error: Unable to open file {script}\n", 1
+
+    # the directives are overridden by the command line options
+    directives = {}
+    with open( script, "r" ) as f:
+        for line in f:
+            if line.startswith( "#SBATCH" ):
+                directives.update( _options( shlex.split( line )[1:], takes_value, flags )[0] )
+            elif line.strip() and not line.startswith( "#" ):
+                break
+    options = dict( directives, **options )
+
+    try:
+        time_limit = _parse_limit( options.get( "time", "1:00:00" ) )
+        mem = _parse_memory( options.get( "mem", "1000M" ) )
+        cpus = int( options.get( "cpus-per-task", 1 ) )
+        nodes = int( options.get( "nodes", 1 ) )
+        tasks = _parse_array( options["array"] ) if "array" in options else [ None ]
+    except ValueError as e:
+        return "", f"sbatch: error: Invalid option value: {e}\n", 1
+    limit = int( cluster.meta( "max_array_size", max_array_size ) )
+    if any( i is not None and i >= limit for i in tasks ):
+        return "", "sbatch: error: Batch job submission failed: Invalid job array specification\n", 1
+
+    max_submit = int( cluster.meta( "max_submit", 0 ) )
+    if max_submit:
+        queued = len( cluster.jobs( "user = ? AND state IN ( 'PENDING', 'RUNNING' )", ( getpass.getuser(), ) ) )
+        if queued + len( tasks ) > max_submit:
+            return "", "sbatch: error: QOSMaxSubmitJobPerUserLimit\nsbatch: error: Batch job submission failed: Job violates accounting/QOS policy (job submit limit, user's size and/or time limits)\n", 1
+
+    workdir = os.path.abspath( options.get( "chdir", os.getcwd() ) )
+    array = tasks != [ None ]
+    default_output = "slurm-%A_%a.out" if array else "slurm-%j.out"
+    dependency = options.get( "dependency" )
+    job = {
+        "name" : options.get( "job-name", os.path.basename( script ) ).strip( "'\"" ),
+        "user" : getpass.getuser(), "state" : "PENDING", "reason" : "Dependency" if dependency else "Priority",
+        "partition" : options.get( "partition", "main" ), "submit" : time.time(),
+        "duration" : max( 1, int( time_limit * 0.5 ) ), "time_limit" : time_limit,
+        "nodes" : nodes, "cpus" : cpus, "mem" : mem, "workdir" : workdir,
+        "command" : os.path.abspath( script ), "dependency" : dependency,
+        "stdout" : options.get( "output", default_output ),
+        "stderr" : options.get( "error", options.get( "output", default_output ) ),
+    }
+    jobid = cluster.submit( [ dict( job, array_task_id = task ) for task in tasks ] )
+    if options.get( "parsable" ):
+        return f"{jobid}\n", "", 0
+    return f"Submitted batch job {jobid}\n", "", 0
+
+def scancel( cluster : Cluster, argv : list ) -> tuple:
+    """
+    `scancel [--account|--user|--state|--name|--partition] [ids]`.
+    """
+    options, ids = _options( argv,
+                                { "account", "user", "state", "name", "partition", "-A", "-u", "-t", "-n", "-p" },
+                                { "-A" : "account", "-u" : "user", "-t" : "state", "-n" : "name", "-p" : "partition" } )
+    where, params = [ "state IN ( 'PENDING', 'RUNNING' )" ], []
+    users = _split( options.get( "user" ) ) or _split( options.get( "account" ) )
+    states = _split( options.get( "state" ) )
+    if states:
+        long_states = { v : k for k, v in short_states.items() }
+        states = { long_states.get( i.upper(), i.upper() ) for i in states }
+    for column, values in ( ( "user", users ), ( "state", states ), ( "name", _split( options.get( "name" ) ) ), ( "partition", _split( options.get( "partition" ) ) ) ):
+        if values:
+            where.append( f"{column} IN ( {', '.join( '?' * len(values) )} )" )
+            params += list( values )
+    where = " AND ".join( where )
+
+    if not ids:
+        if not ( users or states or options.get( "name" ) or options.get( "partition" ) ):
+            return "", "scancel: error: No job identification provided\n", 1
+        cluster.cancel( [ job["id"] for job in cluster.jobs( where, tuple( params ) ) ] )
+        return "", "", 0
+
+    # the filters restrict which of the given jobs are cancelled
+    matching = { job["id"] for job in cluster.jobs( where, tuple( params ) ) } if params else None
+    errors, cancel = [], []
+    for jobid in ids:
+        jobs = cluster.resolve( jobid )
+        if not jobs:
+            errors.append( f"scancel: error: Kill job error on job id {jobid}: Invalid job id specified\n" )
+            continue
+        if all( job["state"] not in active_states for job in jobs ):
+            errors.append( f"scancel: error: Kill job error on job id {jobid}: Job/step already completing or completed\n" )
+            continue
+        cancel += [ job["id"] for job in jobs if job["state"] in active_states and ( matching is None or job["id"] in matching ) ]
+    cluster.cancel( cancel )
+    return "", "".join( errors ), 1 if errors else 0
+
+def _sacct_field( job, field : str, step : str = None ) -> str:
+    """
+    Get a field of a job (or one of its steps) for the sacct output.
+    """
+    field = field.lower()
+    now = time.time()
+    if field == "jobidraw": return f"{job['id']}.{step}" if step else str( job["id"] )
+    if field == "jobid": return f"{_display_id( job )}.{step}" if step else _display_id( job )
+    if field == "jobname": return step if step else job["name"]
+    if field == "user": return "" if step else job["user"]
+    if field == "account": return job["user"]
+    if field == "state":
+        if job["state"] == "CANCELLED" and not step:
+            return f"CANCELLED by {1000 + sum( map( ord, job['user'] ) ) % 1000}"
+        return job["state"]
+    if field == "reason": return "" if step else ( job["reason"] or "None" )
+    if field == "partition": return "" if step else job["partition"]
+    if field == "elapsed": return _duration( _runtime( job, now ) )
+    if field == "timelimit": return "" if step else _duration( job["time_limit"] )
+    if field == "submit": return _timestamp( job["submit"] )
+    if field == "start": return _timestamp( job["start"] )
+    if field == "end": return _timestamp( job["end"] ) if job["state"] not in active_states else "Unknown"
+    if field == "nodelist": return job["nodelist"] or "None assigned"
+    if field == "nnodes": return str( job["nodes"] )
+    if field in ( "alloccpus", "ncpus" ): return str( job["cpus"] )
+    if field == "reqmem": return "" if step else f"{job['mem']}M"
+    if field == "maxrss": return f"{job['max_rss'] >> 10}K" if step and job["max_rss"] else ""
+    if field == "exitcode": return f"0:{job['exit_code']}" if job["state"] == "CANCELLED" else f"{job['exit_code']}:0"
+    if field == "workdir": return "" if step else job["workdir"]
+    return ""
+
+def sacct( cluster : Cluster, argv : list ) -> tuple:
+    """
+    `sacct` with the `--parsable2`, `--parsable`, `--noheader`, `--format`, `--jobs`, `--starttime`,
+    `--endtime`, `--allusers`, `--user`, `--state`, and `--allocations` options.
+    """
+    options, _ = _options( argv,
+                            { "format", "jobs", "starttime", "endtime", "user", "state", "-o", "-j", "-S", "-E", "-u", "-s" },
+                            { "-o" : "format", "-j" : "jobs", "-S" : "starttime", "-E" : "endtime", "-u" : "user", "-s" : "state",
+                              "-P" : "parsable2", "-p" : "parsable", "-n" : "noheader", "-a" : "allusers", "-X" : "allocations" } )
+    fields = ( options.get( "format" ) or "JobID,JobName,Partition,Account,AllocCPUS,State,ExitCode" ).split( "," )
+    fields = [ i.split( "%" )[0] for i in fields ]
+
+    jobids = _split( options.get( "jobs" ) )
+    if jobids:
+        jobs = []
+        for jobid in jobids:
+            jobs += cluster.resolve( jobid )
+        jobs = sorted( { job["id"] : job for job in jobs }.values(), key = lambda job: job["id"] )
+    else:
+        try:
+            start = _parse_time( options["starttime"] ) if "starttime" in options else datetime.combine( datetime.now().date(), datetime.min.time() ).timestamp()
+            end = _parse_time( options["endtime"] ) if "endtime" in options else time.time()
+        except ValueError as e:
+            return "", f"sacct: error: Invalid time specification: {e}\n", 1
+        where, params = [ "submit <= ? AND ( end IS NULL OR end >= ? )" ], [ end, start ]
+        users = _split( options.get( "user" ) ) or ( None if options.get( "allusers" ) else { getpass.getuser() } )
+        if users:
+            where.append( f"user IN ( {', '.join( '?' * len(users) )} )" )
+            params += list( users )
+        jobs = cluster.jobs( " AND ".join( where ), tuple( params ) )
+    states = _split( options.get( "state" ) )
+    if states:
+        long_states = { v : k for k, v in short_states.items() }
+        states = { long_states.get( i.upper(), i.upper() ) for i in states }
+        jobs = [ job for job in jobs if job["state"] in states ]
+
+    rows = []
+    for job in jobs:
+        rows.append( [ _sacct_field( job, f ) for f in fields ] )
+        if job["start"] is not None and not options.get( "allocations" ):
+            rows.append( [ _sacct_field( job, f, "batch" ) for f in fields ] )
+
+    if options.get( "parsable2" ) or options.get( "parsable" ):
+        end = "|" if options.get( "parsable" ) and not options.get( "parsable2" ) else ""
+        lines = [ "|".join( i ) + end for i in rows ]
+        if not options.get( "noheader" ):
+            lines.insert( 0, "|".join( fields ) + end )
+    else:
+        lines = [ " ".join( v[:10].rjust(10) for v in i ) for i in rows ]
+        if not options.get( "noheader" ):
+            lines[0:0] = [ " ".join( f[:10].rjust(10) for f in fields ), " ".join( "-" * 10 for _ in fields ) ]
+    return "".join( f"{i}\n" for i in lines ), "", 0
+
+def srun( cluster : Cluster, argv : list ) -> tuple:
+    """
+    `srun [options] command` runs the command locally (as a running job in the simulated queue).
+    """
+    options, command = _options( argv,
+                                    { "job-name", "time", "cpus-per-task", "mem", "partition", "nodes", "ntasks",
+                                      "-J", "-t", "-c", "-p", "-N", "-n" },
+                                    { "-J" : "job-name", "-t" : "time", "-c" : "cpus-per-task", "-p" : "partition", "-N" : "nodes", "-n" : "ntasks" },
+                                    stop = True )
+    if not command:
+        return "", "srun: fatal: No command given to execute.\n", 1
+    time_limit = _parse_limit( options.get( "time", "1:00:00" ) )
+    now = time.time()
+    jobid = cluster.submit( [ {
+        "name" : options.get( "job-name", command[0] ).strip( "'\"" ), "user" : getpass.getuser(), "state" : "RUNNING",
+        "partition" : options.get( "partition", "main" ), "submit" : now, "start" : now, "end" : now + time_limit,
+        "duration" : time_limit, "time_limit" : time_limit, "nodes" : int( options.get( "nodes", 1 ) ),
+        "nodelist" : "node0001", "cpus" : int( options.get( "cpus-per-task", 1 ) ), "mem" : _parse_memory( options.get( "mem", "1000M" ) ),
+        "workdir" : os.getcwd(), "command" : " ".join( command ), "stdout" : None, "stderr" : None,
+    } ] )
+    code = subprocess.run( command ).returncode
+    cluster.db.execute( "UPDATE jobs SET state = ?, end = ?, exit_code = ? WHERE id = ?", ( "COMPLETED" if code == 0 else "FAILED", time.time(), code, jobid ) )
+    return "", "", code
+
+def dispatch( directory : str, command : str, argv : list ) -> int:
+    """
+    Run a SLURM command against a simulated cluster.
+
+    Returns
+    -------
+    code : int
+        The exit code of the command.
+    """
+    cluster = Cluster( directory )
+    if cluster.latency > 0:
+        time.sleep( cluster.latency )
+    if cluster.meta( "auto_tick" ) == "1" and command != "srun":
+        cluster.tick()
+    stdout, stderr, code = globals()[ command ]( cluster, argv )
+    sys.stdout.write( stdout )
+    sys.stderr.write( stderr )
+    return code
+
+def main( argv : list = None ):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # the shims call: fakeslurm.py --cluster DIR <command> [args]
+    if len(argv) >= 2 and argv[0] == "--cluster":
+        if len(argv) < 3 or argv[2] not in commands:
+            sys.exit( f"fakeslurm: unknown command {argv[2:3]}" )
+        sys.exit( dispatch( argv[1], argv[2], argv[3:] ) )
+
+    parser = argparse.ArgumentParser( description = "A local stand-in for SLURM to benchmark and test slurmtools without a cluster." )
+    _command = parser.add_subparsers( dest = "command" )
+
+    _init = _command.add_parser( "init", help = "Create a simulated cluster and its SLURM shims." )
+    _init.add_argument( "directory", help = "The directory of the cluster." )
+    _init.add_argument( "-j", "--jobs", type = int, default = 1000, help = "The number of jobs (default 1000)." )
+    _init.add_argument( "-l", "--latency", type = float, default = 0, help = "The artificial latency of each SLURM call in seconds (default 0)." )
+    _init.add_argument( "--arrays", type = float, default = 0.2, help = "The fraction of jobs that are array tasks (default 0.2)." )
+    _init.add_argument( "--array-size", type = int, default = 100, help = "The number of tasks per job array (default 100)." )
+    _init.add_argument( "--users", type = int, default = 20, help = "The number of other users (default 20)." )
+    _init.add_argument( "--mine", type = float, default = 0.5, help = "The fraction of jobs of the current user (default 0.5)." )
+    _init.add_argument( "--purged", type = float, default = 0.5, help = "The fraction of finished jobs only known to sacct (default 0.5)." )
+    _init.add_argument( "--auto-tick", action = "store_true", help = "Advance the simulation on every SLURM call." )
+    _init.add_argument( "--seed", type = int, default = 0, help = "The seed of the random job table." )
+    _init.add_argument( "--max-submit", type = int, default = 0, help = "The maximal number of queued jobs per user, like MaxSubmitJobs (default 0, no limit)." )
+
+    _tick = _command.add_parser( "tick", help = "Advance the simulation (complete finished and start pending jobs)." )
+    _tick.add_argument( "directory", help = "The directory of the cluster." )
+    _tick.add_argument( "-n", "--times", type = int, default = 1, help = "The number of steps." )
+
+    args = parser.parse_args( argv )
+    if args.command == "init":
+        bindir = create( args.directory, jobs = args.jobs, latency = args.latency, arrays = args.arrays, array_size = args.array_size,
+                         users = args.users, mine = args.mine, purged = args.purged, auto_tick = args.auto_tick, seed = args.seed,
+                         max_submit = args.max_submit )
+        print( f"Created a cluster with {args.jobs} jobs. Use it via:\n    export PATH={bindir}:$PATH" )
+    elif args.command == "tick":
+        cluster = Cluster( args.directory )
+        for _ in range( args.times ):
+            cluster.tick()
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark the startup latency of the CLI shortcuts (`myq`, `vmyq`, `qrun`, ...).
+
+For each shortcut this compares the previous dispatch (the shortcut spawning
+`/bin/sh` which in turn starts `slurmtools` in a second interpreter) with the
+current in-process dispatch to `slurmtools.main.main`. Each shortcut is called
+with `--help` so that no SLURM installation is required.
+
+Usage
+-----
+    python benchmarks/shortcut_startup.py [--repeats N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+shortcuts = {
+    "viewmyqueue" : ( "viewmyqueue", "queue --view" ),
+    "myqueue" : ( "myqueue", "queue" ),
+    "qrun" : ( "qrun", "session" ),
+    "qrunpy" : ( "qrun_py", "session --python" ),
+    "qrunipy" : ( "qrun_ipy", "session --ipython" ),
+    "qrunR" : ( "qrun_R", "session --R" ),
+}
+"""The shortcuts as (function in slurmtools._cli_shortcuts, subcommand)"""
+
+root = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+def _legacy( name : str, func : str, subcommand : str ) -> list:
+    """
+    The command emulating the previous shortcut dispatch via a shell and second interpreter.
+    """
+    code = f"""
+import subprocess, sys
+sys.argv = [ "{name}", "--help" ]
+cmd = "{sys.executable} -m slurmtools.main {subcommand} " + " ".join( sys.argv[1:] )
+subprocess.run( cmd, shell = True, stdout = subprocess.DEVNULL )
+"""
+    return [ sys.executable, "-c", code ]
+
+def _current( name : str, func : str, subcommand : str ) -> list:
+    """
+    The command calling the shortcut as installed (in-process dispatch).
+    """
+    code = f"""
+import sys
+sys.argv = [ "{name}", "--help" ]
+from slurmtools._cli_shortcuts import {func}
+{func}()
+"""
+    return [ sys.executable, "-c", code ]
+
+def _time( cmd : list, repeats : int ) -> float:
+    """
+    Get the median wall time of a command in milliseconds.
+    """
+    env = dict( os.environ, PYTHONPATH = os.pathsep.join( [ root, os.environ.get( "PYTHONPATH", "" ) ] ) )
+    times = []
+    for _ in range( repeats ):
+        start = time.perf_counter()
+        subprocess.run( cmd, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
+        times.append( ( time.perf_counter() - start ) * 1000 )
+    return statistics.median( times )
+
+def main():
+    parser = argparse.ArgumentParser( description = "Benchmark the startup latency of the CLI shortcuts." )
+    parser.add_argument( "-r", "--repeats", type = int, default = 10, help = "The number of calls per shortcut (default 10)." )
+    args = parser.parse_args()
+
+    print( f"{'shortcut':<12} {'before [ms]':>12} {'after [ms]':>12} {'speedup':>8}" )
+    for name, ( func, subcommand ) in shortcuts.items():
+        before = _time( _legacy( name, func, subcommand ), args.repeats )
+        after = _time( _current( name, func, subcommand ), args.repeats )
+        print( f"{name:<12} {before:>12.1f} {after:>12.1f} {before / after:>7.2f}x" )
+
+if __name__ == "__main__":
+    main()
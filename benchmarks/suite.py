@@ -0,0 +1,220 @@
+"""
+Benchmark the hot paths of slurmtools at realistic queue sizes.
+
+Each benchmark runs against a simulated cluster (see `fakeslurm.py`) of 10, 1k, 10k,
+and 50k jobs and reports the wall time (median over the repeats), the number of
+subprocesses spawned (e.g. SLURM calls), and the peak (Python) memory. The results
+are written to a JSON file so that releases can be compared.
+
+The benchmarks are
+
+- `show_all`: `show_all( raw = False )`
+- `info_by_pattern`: `info_by_pattern` for the job names of an array
+- `summary`: `SlurmJob._make_summary` for all jobs of the user
+- `queue`: `queue()` (calling and parsing squeue)
+- `viewer_frame`: a `SlurmQueueViewer` frame (reading and drawing the queue on a headless screen)
+- `read_stdout`: `read_stdout` of the last 100 lines and of the whole of a large log (20 lines per job in the cluster)
+- `kill_by_pattern`: `kill_by_pattern` for the jobs of an array (the cluster is recreated for each repeat)
+
+Usage
+-----
+    python benchmarks/suite.py [--sizes 10,1000,10000,50000] [--repeats 3] [--output results.json]
+"""
+
+import argparse
+import contextlib
+import getpass
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+root = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+sys.path.insert( 0, root )
+sys.path.insert( 0, os.path.dirname( os.path.abspath( __file__ ) ) )
+
+import fakeslurm
+
+_subprocesses = [ 0 ]
+"""The number of subprocesses spawned (counted via an audit hook)"""
+
+def _count_subprocesses( event : str, args ):
+    if event == "subprocess.Popen":
+        _subprocesses[0] += 1
+
+sys.addaudithook( _count_subprocesses )
+
+class _Screen:
+    """
+    A headless stand-in for the curses window of the queue viewer.
+    """
+    def __init__( self, key : str = "r" ):
+        self.key = key
+    def addstr( self, *args ): pass
+    def move( self, *args ): pass
+    def clrtoeol( self ): pass
+    def refresh( self ): pass
+    def getmaxyx( self ): return ( 50, 120 )
+    def getch( self ):
+        # pressing "r" makes the viewer read the queue on every frame
+        return ord( self.key )
+
+def measure( func, repeats : int, setup = None ) -> dict:
+    """
+    Measure a benchmark.
+
+    Parameters
+    ----------
+    func : callable
+        The benchmark (called with the result of `setup`).
+    repeats : int
+        The number of runs.
+    setup : callable
+        A function preparing each run (this is not measured).
+
+    Returns
+    -------
+    result : dict
+        The median, minimum, and maximum wall time (in seconds), the number of
+        subprocesses of the first run, and the peak memory (in bytes) of an extra run.
+    """
+    times, calls = [], None
+    for idx in range( repeats ):
+        arg = setup() if setup else None
+        spawned = _subprocesses[0]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout( io.StringIO() ):
+            func( arg )
+        times.append( time.perf_counter() - start )
+        if idx == 0:
+            calls = _subprocesses[0] - spawned
+
+    # tracing the allocations slows the code down, so the memory is measured in a separate run
+    arg = setup() if setup else None
+    tracemalloc.start()
+    with contextlib.redirect_stdout( io.StringIO() ):
+        func( arg )
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return { "wall_time" : statistics.median( times ), "min" : min( times ), "max" : max( times ), "subprocesses" : calls, "peak_memory" : peak }
+
+def run_size( slurmtools, directory : str, size : int, repeats : int, latency : float, only : set = None ) -> dict:
+    """
+    Run all benchmarks at one cluster size.
+    """
+    api = slurmtools.func_api
+    queue_module = sys.modules["slurmtools.func_api.queue"]
+
+    def make_cluster():
+        fakeslurm.create( directory, jobs = size, latency = latency, seed = size )
+        os.makedirs( os.path.join( directory, "work" ), exist_ok = True )
+        api.cache.invalidate()
+
+    make_cluster()
+    cluster = fakeslurm.Cluster( directory )
+    me = getpass.getuser()
+    mine = cluster.jobs( "user = ? AND purged = 0", ( me, ) )
+    arrays = [ job for job in mine if job["array_job_id"] is not None ]
+    pattern = f"^{arrays[0]['name']}$" if arrays else f"^{mine[0]['name']}$" if mine else "^$"
+
+    # a large log of a running job of the user
+    running = [ job for job in mine if job["state"] == "RUNNING" ]
+    log_job = running[0] if running else None
+    if log_job:
+        line = "step 0000000: loss=0.123456 accuracy=0.987654 elapsed=00:00:01\n"
+        with open( log_job["stdout"], "w" ) as f:
+            for _ in range( max( 1, size * 20 ) // 1000 ):
+                f.write( line * 1000 )
+
+    def viewer_frame( viewer ):
+        viewer.contents()
+
+    def new_viewer():
+        viewer = queue_module.SlurmQueueViewer( all = True )
+        viewer.window = _Screen()
+        viewer.colors = { "yellow" : 1, "green" : 2, "cyan" : 3 }
+        viewer.set_scroll_range( 20 )
+        # draw the first frame so that the measured frame is an update
+        viewer.contents()
+        return viewer
+
+    benchmarks = {
+        "show_all" : ( lambda _: api.show_all( raw = False ), None ),
+        "info_by_pattern" : ( lambda _: api.info_by_pattern( pattern ), None ),
+        "summary" : ( lambda jobs: [ job._make_summary() for job in jobs ], lambda: api.show_all() ),
+        "queue" : ( lambda _: api.queue( all = True ), None ),
+        "viewer_frame" : ( viewer_frame, new_viewer ),
+    }
+    if log_job:
+        benchmarks["read_stdout_tail"] = ( lambda _: api.read_stdout( log_job["id"], tail = 100 ), None )
+        benchmarks["read_stdout"] = ( lambda _: api.read_stdout( log_job["id"] ), None )
+    benchmarks["kill_by_pattern"] = ( lambda _: api.kill_by_pattern( pattern ), make_cluster )
+
+    results = {}
+    for name, ( func, setup ) in benchmarks.items():
+        if only and name not in only:
+            continue
+        results[ name ] = measure( func, repeats, setup )
+        print( f"{size:>7} jobs  {name:<18} {results[name]['wall_time'] * 1000:>10.1f} ms  {results[name]['subprocesses']:>5} calls  {results[name]['peak_memory'] / 2**20:>8.1f} MiB", flush = True )
+    return results
+
+def _git_commit() -> str:
+    """
+    Get the current commit of the repository (if any).
+    """
+    result = subprocess.run( [ "git", "-C", root, "rev-parse", "HEAD" ], capture_output = True, text = True )
+    return result.stdout.strip() or None
+
+def main():
+    parser = argparse.ArgumentParser( description = "Benchmark the hot paths of slurmtools against a simulated cluster." )
+    parser.add_argument( "-s", "--sizes", default = "10,1000,10000,50000", help = "The comma separated numbers of jobs in the cluster (default 10,1000,10000,50000)." )
+    parser.add_argument( "-r", "--repeats", type = int, default = 3, help = "The number of runs per benchmark (default 3)." )
+    parser.add_argument( "-l", "--latency", type = float, default = 0, help = "The artificial latency of each SLURM call in seconds (default 0)." )
+    parser.add_argument( "-b", "--only", default = None, help = "Only run these (comma separated) benchmarks." )
+    parser.add_argument( "-o", "--output", default = None, help = "The JSON file to write the results to (default benchmarks/results/<timestamp>.json)." )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp( prefix = "slurmtools-bench-" )
+    directory = os.path.join( workdir, "cluster" )
+
+    # an isolated slurmtools environment using the simulated cluster
+    os.environ["SLURMTOOLS_SLURM_BIN"] = os.path.join( directory, "bin" )
+    os.environ["SLURMTOOLS_DATA_DIR"] = os.path.join( workdir, "data" )
+    os.environ["SLURMTOOLS_RUNTIME_DIR"] = os.path.join( workdir, "runtime" )
+    os.environ.pop( "SLURMTOOLS_CACHE_TTL", None )
+    os.environ.setdefault( "USER", getpass.getuser() )
+    import slurmtools
+    import slurmtools.func_api
+    logging.getLogger( "slurmtools" ).setLevel( logging.ERROR )
+
+    only = set( args.only.split( "," ) ) if args.only else None
+    results = {
+        "date" : datetime.now().isoformat( timespec = "seconds" ),
+        "commit" : _git_commit(),
+        "python" : platform.python_version(),
+        "platform" : platform.platform(),
+        "repeats" : args.repeats,
+        "latency" : args.latency,
+        "sizes" : {},
+    }
+    for size in ( int(i) for i in args.sizes.split( "," ) ):
+        results["sizes"][ str(size) ] = run_size( slurmtools, directory, size, args.repeats, args.latency, only )
+
+    output = args.output or os.path.join( root, "benchmarks", "results", f"{datetime.now().strftime( '%Y%m%d-%H%M%S' )}.json" )
+    os.makedirs( os.path.dirname( os.path.abspath( output ) ), exist_ok = True )
+    with open( output, "w" ) as f:
+        json.dump( results, f, indent = 2 )
+    print( f"Results written to {output}" )
+    shutil.rmtree( workdir, ignore_errors = True )
+
+if __name__ == "__main__":
+    main()
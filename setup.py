@@ -42,5 +42,14 @@ setuptools.setup(
         ],
     },
 
-    python_requires='>=3.6',
+    extras_require={
+        # only needed for the vectorized bulk conversion of job times
+        "pandas": [ "pandas", "numpy" ],
+        # only needed to export jobs to Arrow tables or Parquet files
+        "arrow": [ "pyarrow", "pandas", "numpy" ],
+        # only needed to load workflow specs from YAML (or TOML on python < 3.11)
+        "workflow": [ "pyyaml", "tomli; python_version < '3.11'" ],
+    },
+
+    python_requires='>=3.8',
 )
\ No newline at end of file
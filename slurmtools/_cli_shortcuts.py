@@ -1,37 +1,34 @@
 """
 Defines CLI shortcut functions to run the main CLI with subcommands.
+
+The shortcuts call the main CLI directly within the same process 
+(rather than spawning a shell and a second interpreter for `slurmtools`).
 """
 
-import subprocess
 import sys
+from .main import main
+
+def _run( *subcommand ):
+    """
+    Run the main CLI with a subcommand (and its fixed options) 
+    followed by the arguments passed to the shortcut.
+    """
+    main( [ *subcommand, *sys.argv[1:] ] )
 
 def viewmyqueue():
-    cmd = "slurmtools queue --view "
-    cmd += " ".join( sys.argv[1:] )
-    subprocess.run( cmd, shell = True )
+    _run( "queue", "--view" )
 
 def myqueue():
-    cmd = "slurmtools queue "
-    cmd += " ".join( sys.argv[1:] )
-    subprocess.run( cmd, shell = True )
+    _run( "queue" )
 
 def qrun():
-    cmd = "slurmtools session "
-    cmd += " ".join( sys.argv[1:] )
-    subprocess.run( cmd, shell = True )
+    _run( "session" )
 
 def qrun_py():
-    cmd = "slurmtools session --python "
-    cmd += " ".join( sys.argv[1:] )
-    subprocess.run( cmd, shell = True )
+    _run( "session", "--python" )
 
 def qrun_ipy():
-    cmd = "slurmtools session --ipython "
-    cmd += " ".join( sys.argv[1:] )
-    subprocess.run( cmd, shell = True )
+    _run( "session", "--ipython" )
 
 def qrun_R():
-    cmd = "slurmtools session --R "
-    cmd += " ".join( sys.argv[1:] )
-    subprocess.run( cmd, shell = True )
-
+    _run( "session", "--R" )
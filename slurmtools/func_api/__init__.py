@@ -2,10 +2,23 @@
 The main API
 """
 
+from .config import use_slurm_bin
+use_slurm_bin()
+
+from .runner import profile, Profile
 from .last_submit import last_submit, reset_last_submit
-from .info import raw_job_info, job_info, show_all, info_by_pattern, SlurmJob
-from .kill import kill_last, kill_all, kill_job, kill_by_pattern
-from .queue import queue, view_queue
+from .ledger import ledger, Ledger
+from .info import raw_job_info, job_info, job_infos, show_all, info_by_pattern, runtimes, end_times, SlurmJob
+from .history import history
+from .query import compile_query, Query
+from .timeparse import parse_duration, parse_timestamp, span_seconds, to_timedeltas, to_datetimes
+from .kill import kill_last, kill_all, kill_job, kill_jobs, kill_by_pattern
+from .queue import queue, snapshot, view_queue, Queue
+from .clean import clean
+from .export import job_table, to_frame, to_csv, to_arrow, to_parquet, export
 from .session import session, scales
-from .submit import submit, CmdArgs
-from .read import read_stdout, read_stderr
+from .submit import submit, submit_many, submit_template, render_template, CmdArgs
+from .feeder import Feeder
+from .workflow import Workflow, Step, submit_workflow, workflow_jobs, workflow_status, cancel_workflow
+from .aio import AsyncSlurmClient
+from .read import read_stdout, read_stderr, iter_stdout, iter_stderr, iter_output
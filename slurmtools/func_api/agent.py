@@ -0,0 +1,345 @@
+"""
+An optional per-user background agent that polls SLURM once for all slurmtools processes.
+
+The agent keeps the SLURM snapshots that slurmtools needs (the `scontrol` job dump and the
+`squeue` views that clients asked for) and refreshes them periodically (and right after jobs
+were submitted or killed via slurmtools). It answers the queries of the CLI and API over a
+Unix domain socket in the per-user runtime directory (see `cache.runtime_dir`):
+
+- `output`: the (fresh) output of a snapshot command, e.g. `squeue ... --user=alice`
+- `job`: the record(s) of a single job from the parsed job dump
+- `match`: the records matching a query (see `slurmtools.func_api.query`)
+- `ledger`: the most recent submissions
+
+Clients use the agent automatically whenever it is running and otherwise call SLURM directly.
+Setting `SLURMTOOLS_AGENT=0` disables the agent for a process.
+
+Example
+-------
+    slurmtools agent start --interval 10
+    slurmtools agent status
+    slurmtools agent stop
+"""
+
+import json
+import os
+import shlex
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import logging
+
+from . import cache, runner
+
+logger = logging.getLogger( "slurmtools" )
+
+_jobs_cmd = "scontrol show job -dd"
+"""The job dump every client query is answered from"""
+
+def socket_path() -> str:
+    """
+    Get the path of the agent's socket.
+    """
+    return os.path.join( cache.runtime_dir(), "agent.sock" )
+
+class Snapshots:
+    """
+    The snapshots held by the agent.
+
+    Parameters
+    ----------
+    interval : float
+        The number of seconds after which a snapshot is refreshed.
+    keep : float
+        The number of seconds a snapshot is kept (and refreshed) after it was last requested.
+    """
+    def __init__( self, interval : float = 5, keep : float = 300 ):
+        self.interval = interval
+        self.keep = keep
+        self._entries = {}
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def get( self, cmd : str ) -> str:
+        """
+        Get the output of a snapshot command (its arguments joined by `shlex.join`).
+        The snapshot is fetched if it is not fresh.
+        """
+        with self._lock:
+            entry = self._entries.get( cmd )
+            if entry is not None:
+                entry["used"] = time.time()
+                if self._fresh( entry ):
+                    return entry["output"]
+        return self._fetch( cmd )
+
+    def records( self, mine : bool = True ) -> list:
+        """
+        Get the parsed job records (see `info.all_records`).
+        The records are only split and filtered once per refresh of the job dump.
+        """
+        from .info import split_records
+        output = self.get( _jobs_cmd )
+        parsed = self._parsed.get( mine )
+        if parsed is None or parsed[0] is not output:
+            records = split_records( output )
+            if mine:
+                username = f"UserId={runner.user()}("
+                records = [ i for i in records if username in i ]
+            parsed = self._parsed[ mine ] = ( output, records )
+        return parsed[1]
+
+    def refresh( self ):
+        """
+        Refresh all snapshots that are due and drop the ones no longer requested.
+        """
+        now = time.time()
+        with self._lock:
+            for cmd, entry in list( self._entries.items() ):
+                if now - entry["used"] > self.keep:
+                    del self._entries[ cmd ]
+            due = [ cmd for cmd, entry in self._entries.items() if not self._fresh( entry ) ]
+        for cmd in due:
+            self._fetch( cmd )
+
+    def _fresh( self, entry : dict ) -> bool:
+        return time.time() - entry["fetched"] < self.interval and entry["fetched"] >= cache.last_change()
+
+    def _fetch( self, cmd : str ) -> str:
+        # SLURM is called outside the lock, so clients are not blocked by a slow refresh
+        fetched = time.time()
+        output = runner.output( shlex.split( cmd ) )
+        with self._lock:
+            entry = self._entries.setdefault( cmd, { "used" : fetched, "fetched" : 0 } )
+            if fetched >= entry["fetched"]:
+                entry["output"], entry["fetched"] = output, fetched
+        return output
+
+class _Handler( socketserver.StreamRequestHandler ):
+    """
+    Answers a single JSON request (one line) with a single JSON response.
+    """
+    def handle( self ):
+        try:
+            request = json.loads( self.rfile.readline() )
+            response = { "ok" : True, "result" : self.server.agent.answer( request ) }
+        except Exception as e:
+            response = { "ok" : False, "error" : f"{e.__class__.__name__}: {e}" }
+        self.wfile.write( json.dumps( response ).encode( "utf-8" ) + b"\n" )
+
+class _Server( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+    daemon_threads = True
+
+class Agent:
+    """
+    The background agent.
+
+    Parameters
+    ----------
+    interval : float
+        The number of seconds between two polls of SLURM.
+    keep : float
+        The number of seconds a snapshot is kept polling after it was last requested.
+    """
+    def __init__( self, interval : float = 5, keep : float = 300 ):
+        self.snapshots = Snapshots( interval, keep )
+        self.started = time.time()
+        self._server = None
+
+    def answer( self, request : dict ):
+        """
+        Answer a client request.
+        """
+        op = request.get( "op" )
+        if op == "ping":
+            return { "pid" : os.getpid(), "started" : self.started, "interval" : self.snapshots.interval, "snapshots" : len( self.snapshots._entries ) }
+        if op == "output":
+            return self.snapshots.get( request["cmd"] )
+        if op == "job":
+            records = self._job( str( request["jobid"] ) )
+            return "\n\n".join( records ) if records else None
+        if op == "match":
+            return self._match( request )
+        if op == "ledger":
+            from .ledger import ledger
+            script, n = request.get( "script" ), request.get( "n", 10 )
+            submissions = ledger().by_script( script )[ :n ] if script else ledger().last_n( n )
+            return [ { key : getattr( i, key ) for key in ( "entry", "jobid", "array_id", "script", "resources", "submitted", "cancelled" ) } for i in submissions ]
+        if op == "stop":
+            threading.Thread( target = self._server.shutdown ).start()
+            return True
+        raise ValueError( f"Unknown request '{op}'" )
+
+    def _match( self, request : dict ) -> list:
+        """
+        Get the records matching a query and the state and partition filters (from the job dump).
+        """
+        from .pushdown import split_values
+        from .query import compile_query
+        records = self.snapshots.records( request.get( "mine", True ) )
+        filters = [ request.get( "query" ) ]
+        if request.get( "states" ):
+            filters.append( f"JobState={','.join( split_values( request['states'] ) )}" )
+        if request.get( "partition" ):
+            filters.append( f"Partition={','.join( split_values( request['partition'] ) )}" )
+        for query in filters:
+            if query is not None:
+                records = compile_query( query ).filter_records( records )
+        return records
+
+    def _job( self, jobid : str ) -> list:
+        """
+        Get the records of a job (or all tasks of an array job) from the job dump.
+        """
+        if "_" in jobid:
+            array, task = jobid.split( "_", 1 )
+            needles = ( f"ArrayJobId={array} ", f"ArrayTaskId={task} " )
+        else:
+            needles = None
+        records = []
+        for record in self.snapshots.records( mine = False ):
+            if needles is not None:
+                if all( i in record for i in needles ):
+                    records.append( record )
+            elif record.startswith( f"JobId={jobid} " ) or f"ArrayJobId={jobid} " in record:
+                records.append( record )
+        return records
+
+    def serve( self ):
+        """
+        Serve the clients until the agent is stopped.
+        """
+        global _local
+        path = socket_path()
+        if request( "ping" ) is not None:
+            raise RuntimeError( f"An agent is already running at {path}" )
+        if os.path.exists( path ):
+            os.remove( path )
+
+        # the agent answers its own lookups (e.g. in `all_records`) from its snapshots
+        _local = self
+        self._server = _Server( path, _Handler )
+        self._server.agent = self
+        os.chmod( path, 0o600 )
+
+        poller = threading.Thread( target = self._poll, daemon = True )
+        poller.start()
+        logger.info( f"slurmtools agent serving at {path}" )
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            _local = None
+            if os.path.exists( path ):
+                os.remove( path )
+
+    def _poll( self ):
+        while True:
+            time.sleep( min( 1, self.snapshots.interval ) )
+            try:
+                self.snapshots.refresh()
+            except Exception as e:
+                logger.warning( f"Could not refresh the agent's snapshots: {e}" )
+
+_local = None
+"""The agent of this process (if this process is the agent)"""
+
+def enabled() -> bool:
+    """
+    Check if clients should use the agent (unless `SLURMTOOLS_AGENT=0` is set).
+    """
+    return os.environ.get( "SLURMTOOLS_AGENT", "1" ) not in ( "0", "false", "no" )
+
+def request( op : str, timeout : float = 5, **params ):
+    """
+    Send a request to the agent.
+
+    Parameters
+    ----------
+    op : str
+        The request (`ping`, `output`, `job`, `match`, `ledger`, or `stop`).
+    timeout : float
+        The timeout in seconds.
+    **params
+        The parameters of the request.
+
+    Returns
+    -------
+    result
+        The answer of the agent, or None if no agent is running (or it failed to answer).
+    """
+    if _local is not None and op != "ping":
+        return _local.answer( dict( params, op = op ) )
+    if not enabled():
+        return None
+    path = socket_path()
+    if not os.path.exists( path ):
+        return None
+    try:
+        with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as client:
+            client.settimeout( timeout )
+            client.connect( path )
+            client.sendall( json.dumps( dict( params, op = op ) ).encode( "utf-8" ) + b"\n" )
+            with client.makefile( "rb" ) as f:
+                response = json.loads( f.readline() )
+    except ( OSError, ValueError ):
+        return None
+    if not response.get( "ok" ):
+        logger.warning( f"The slurmtools agent failed to answer: {response.get( 'error' )}" )
+        return None
+    return response["result"]
+
+def output( cmd : str ) -> str:
+    """
+    Get the output of a snapshot command from the agent (or None if no agent is running).
+    """
+    return request( "output", cmd = cmd )
+
+def start( interval : float = 5, keep : float = 300 ) -> bool:
+    """
+    Start the agent in the background.
+
+    Parameters
+    ----------
+    interval : float
+        The number of seconds between two polls of SLURM.
+    keep : float
+        The number of seconds a snapshot is kept polling after it was last requested.
+
+    Returns
+    -------
+    started : bool
+        True if the agent was started, False if it was already running.
+    """
+    if request( "ping" ) is not None:
+        return False
+    cmd = [ sys.executable, "-m", "slurmtools.main", "agent", "run", "--interval", str( interval ), "--keep", str( keep ) ]
+    subprocess.Popen( cmd, stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, start_new_session = True )
+
+    # wait until the agent answers
+    for _ in range( 50 ):
+        if request( "ping" ) is not None:
+            return True
+        time.sleep( 0.1 )
+    raise RuntimeError( "The slurmtools agent did not start." )
+
+def stop() -> bool:
+    """
+    Stop the agent.
+
+    Returns
+    -------
+    stopped : bool
+        True if an agent was stopped, False if none was running.
+    """
+    return request( "stop" ) is not None
+
+def status() -> dict:
+    """
+    Get the status of the agent (or None if none is running).
+    """
+    return request( "ping" )
@@ -0,0 +1,246 @@
+"""
+An asyncio client to SLURM.
+
+The `AsyncSlurmClient` runs the SLURM commands (`scontrol`, `squeue`, `sbatch`, `scancel`)
+as subprocesses via `asyncio.create_subprocess_exec`, with a bounded number of concurrent calls,
+per-call timeouts and cancellation. This allows to inspect, submit, or kill hundreds of jobs
+concurrently without spawning one thread per call.
+
+Example
+-------
+>>> import asyncio
+>>> from slurmtools import AsyncSlurmClient
+>>> client = AsyncSlurmClient( max_concurrency = 8 )
+>>> jobs = asyncio.run( client.job_infos( [ 1234, 1235, 1236 ] ) )
+"""
+
+import asyncio
+import subprocess
+import time
+import weakref
+
+from . import cache, runner
+from .info import SlurmJob, split_records
+from .pushdown import Selection, scontrol_batches, select_records
+from .last_submit import last_submit
+from .submit import sbatch_options, extract_jobid, resources
+
+class AsyncSlurmClient:
+    """
+    An asyncio client to SLURM.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        The maximal number of SLURM commands running at the same time.
+    timeout : float
+        The default timeout of each SLURM command in seconds (None for no timeout).
+    """
+    def __init__( self, max_concurrency : int = 16, timeout : float = 60 ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def run( self, *argv, timeout : float = None ) -> subprocess.CompletedProcess:
+        """
+        Run a command.
+
+        Note
+        ----
+        If the call times out or is cancelled the subprocess is killed.
+
+        Parameters
+        ----------
+        *argv
+            The command and its arguments (these are not interpreted by a shell).
+        timeout : float
+            The timeout in seconds. By default the client's timeout is used.
+
+        Returns
+        -------
+        result : CompletedProcess
+            The finished process with decoded `stdout` and `stderr`.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            If the command did not finish within the timeout.
+        """
+        argv = [ str(i) for i in argv ]
+        timeout = self.timeout if timeout is None else timeout
+        async with self._get_semaphore():
+            start, begin = time.time(), time.perf_counter()
+            process = await asyncio.create_subprocess_exec( *argv, stdout = asyncio.subprocess.PIPE, stderr = asyncio.subprocess.PIPE )
+            try:
+                stdout, stderr = await asyncio.wait_for( process.communicate(), timeout )
+            except BaseException:
+                # this covers both timeouts and cancellation
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                runner.record( runner.Call( argv, start, time.perf_counter() - begin, process.returncode ) )
+                raise
+            runner.record( runner.Call( argv, start, time.perf_counter() - begin, process.returncode, len(stdout), len(stderr) ) )
+        return subprocess.CompletedProcess( argv, process.returncode, stdout.decode("utf-8"), stderr.decode("utf-8") )
+
+    async def raw_job_info( self, jobid : int ) -> str:
+        """
+        Get the raw job info from scontrol.
+
+        Parameters
+        ----------
+        jobid : int
+            The job-id whose info to get.
+
+        Returns
+        -------
+        jobinfo : str
+            The job info as a raw string (empty if scontrol does not know the job).
+        """
+        result = await self.run( "scontrol", "show", "jobid", "-dd", jobid )
+        return result.stdout
+
+    async def job_info( self, jobid : int ) -> SlurmJob:
+        """
+        Get job info
+
+        Parameters
+        ----------
+        jobid : int
+            The job-id whose info to get.
+
+        Returns
+        -------
+        jobinfo : SlurmJob or None
+            The job info as a `SlurmJob` object or None if scontrol does not know the job.
+        """
+        info = await self.raw_job_info( jobid )
+        if not info.strip():
+            return None
+        return SlurmJob.from_record( info )
+
+    async def job_infos( self, jobids : list ) -> list:
+        """
+        Get the job info of many jobs concurrently.
+
+        Parameters
+        ----------
+        jobids : list
+            The job-ids whose info to get.
+
+        Returns
+        -------
+        jobinfos : list
+            The `SlurmJob` objects (or None for unknown jobs) in the order of the job-ids.
+        """
+        return await asyncio.gather( *( self.job_info( i ) for i in jobids ) )
+
+    async def show_all( self, mine : bool = True, raw : bool = False ):
+        """
+        Show all jobs
+
+        Parameters
+        ----------
+        mine : bool
+            Only include jobs owned by the current user.
+        raw : bool
+            Show raw job info. This will be detailed.
+
+        Returns
+        -------
+        jobs : list or str
+            Either the raw string containing the entire info
+            or a list of `SlurmJob` objects.
+        """
+        # like the sync API, squeue selects the user's jobs and only their records are fetched
+        selection = Selection( mine = mine )
+        if selection.flags:
+            result = await self.run( "squeue", "--noheader", "--format=%A", *selection.squeue_args() )
+            jobids = result.stdout.split()
+            outputs = await asyncio.gather( *( self.run( *argv ) for argv in scontrol_batches( jobids ) ) )
+            info = select_records( [ i for output in outputs for i in split_records( output.stdout ) ], jobids )
+        else:
+            result = await self.run( "scontrol", "show", "job", "-dd" )
+            info = split_records( result.stdout )
+        if raw:
+            return "\n\n".join( info )
+        return [ SlurmJob.from_record( i ) for i in info ]
+
+    async def submit( self, filename : str, args = None ) -> int:
+        """
+        Submit a new slurm job
+
+        Parameters
+        ----------
+        filename : str
+            The name of the job file.
+        args : CmdArgs
+            The arguments to pass to the job.
+            This can have attributes for `time`,
+            `nodes`, `cores`, `memory`, and `partition`.
+
+        Returns
+        -------
+        jobid : int
+            The job-id of the submitted job.
+        """
+        result = await self.run( "sbatch", *sbatch_options( args ), filename )
+        if result.returncode != 0:
+            raise RuntimeError( f"Could not submit {filename}: {result.stderr.strip()}" )
+        jobid = extract_jobid( result )
+        last_submit( jobid, script = filename, resources = resources( args ) )
+        cache.invalidate()
+        return jobid
+
+    async def submit_many( self, filenames : list, args = None ) -> list:
+        """
+        Submit many job files concurrently.
+
+        Parameters
+        ----------
+        filenames : list
+            The names of the job files.
+        args : CmdArgs
+            The arguments to pass to all of the jobs.
+
+        Returns
+        -------
+        jobids : list
+            The job-ids of the submitted jobs in the order of the files.
+        """
+        return await asyncio.gather( *( self.submit( i, args ) for i in filenames ) )
+
+    async def kill_job( self, jobid : int ):
+        """
+        Kill a slurm job.
+
+        Parameters
+        ----------
+        jobid : int
+            The job-id to kill.
+        """
+        await self.run( "scancel", "--user", runner.user(), jobid )
+        cache.invalidate()
+
+    async def kill_jobs( self, jobids : list ):
+        """
+        Kill many slurm jobs concurrently.
+
+        Parameters
+        ----------
+        jobids : list
+            The job-ids to kill.
+        """
+        await asyncio.gather( *( self.kill_job( i ) for i in jobids ) )
+
+    def _get_semaphore( self ) -> asyncio.Semaphore:
+        """
+        Get the semaphore bounding the concurrent calls of the running event loop.
+        (Semaphores are bound to the loop they are first used in before python 3.10,
+        so each loop, e.g. of consecutive `asyncio.run` calls, gets its own.)
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get( loop )
+        if semaphore is None:
+            semaphore = self._semaphores[ loop ] = asyncio.Semaphore( self.max_concurrency )
+        return semaphore
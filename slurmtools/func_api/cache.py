@@ -0,0 +1,177 @@
+"""
+A cross-process cache for SLURM snapshots (the outputs of `scontrol` and `squeue`).
+
+The cache is opt-in. It is enabled by setting the environment variable
+`SLURMTOOLS_CACHE_TTL` to the number of seconds a snapshot remains fresh.
+All slurmtools processes of a user share the cache in a per-user runtime directory
+(`$XDG_RUNTIME_DIR/slurmtools` or `/tmp/slurmtools-<uid>`, configurable via `SLURMTOOLS_RUNTIME_DIR`),
+so that several open queue views or scripts calling slurmtools in a loop only poll SLURM once per TTL.
+
+Entries are written atomically and refreshed under a file lock, so only one process
+calls SLURM for an expired entry while the others wait for (and then reuse) its result.
+
+If the background agent is running (see `slurmtools.func_api.agent`), snapshots are
+taken from the agent instead, regardless of the TTL.
+"""
+
+import fcntl
+import hashlib
+import os
+import shlex
+import tempfile
+import time
+
+import logging
+
+logger = logging.getLogger( "slurmtools" )
+
+def runtime_dir() -> str:
+    """
+    Get the per-user runtime directory of slurmtools (it is created if necessary).
+    """
+    directory = os.environ.get( "SLURMTOOLS_RUNTIME_DIR" )
+    if not directory:
+        base = os.environ.get( "XDG_RUNTIME_DIR" )
+        directory = os.path.join( base, "slurmtools" ) if base else os.path.join( tempfile.gettempdir(), f"slurmtools-{os.getuid()}" )
+    os.makedirs( directory, mode = 0o700, exist_ok = True )
+    return directory
+
+def ttl() -> float:
+    """
+    Get the time (in seconds) for which a cached snapshot is fresh.
+    This is 0 (i.e. caching is disabled) unless `SLURMTOOLS_CACHE_TTL` is set.
+    """
+    try:
+        return float( os.environ.get( "SLURMTOOLS_CACHE_TTL", 0 ) )
+    except ValueError:
+        logger.warning( "SLURMTOOLS_CACHE_TTL must be a number of seconds. The cache is disabled." )
+        return 0
+
+def cached( key, fetch ) -> str:
+    """
+    Get a snapshot from the cache or fetch (and cache) a new one.
+
+    Parameters
+    ----------
+    key : list or str
+        The key of the snapshot. This should be the command (arguments) used to
+        fetch it including all filters (e.g. `[ "squeue", "--user=alice" ]`).
+    fetch : callable
+        A function without arguments that returns the fresh snapshot as a string.
+        This is called if there is no fresh snapshot in the cache (or caching is disabled).
+
+    Returns
+    -------
+    snapshot : str
+        The (cached or fresh) snapshot.
+    """
+    if not isinstance( key, str ):
+        key = shlex.join( str(i) for i in key )
+
+    # a running agent holds fresh snapshots for all processes of the user
+    from . import agent
+    snapshot = agent.output( key )
+    if snapshot is not None:
+        return snapshot
+
+    max_age = ttl()
+    if max_age <= 0:
+        return fetch()
+
+    path = _path( key )
+    snapshot = _read( path, max_age )
+    if snapshot is not None:
+        return snapshot
+
+    # only one process refreshes an entry, the others wait for the lock
+    # and then reuse the snapshot that was just written
+    with open( f"{path}.lock", "w" ) as lock:
+        fcntl.flock( lock, fcntl.LOCK_EX )
+        try:
+            snapshot = _read( path, max_age )
+            if snapshot is None:
+                started = time.time()
+                snapshot = fetch()
+                _write( path, snapshot, started )
+        finally:
+            fcntl.flock( lock, fcntl.LOCK_UN )
+    return snapshot
+
+def invalidate():
+    """
+    Invalidate all cached snapshots.
+    This should be called whenever the queue was changed (e.g. after submitting or killing jobs).
+    """
+    # the change marker lets long-lived processes (e.g. queue viewers and the agent) notice the change
+    path = marker()
+    with open( path, "a" ):
+        os.utime( path )
+
+    if ttl() <= 0:
+        return
+    directory = os.path.dirname( path )
+    for name in os.listdir( directory ):
+        if name.endswith( ".snapshot" ):
+            try:
+                os.remove( os.path.join( directory, name ) )
+            except FileNotFoundError:
+                pass
+
+def marker() -> str:
+    """
+    Get the path of the change marker (which is touched by `invalidate`).
+    """
+    return os.path.join( runtime_dir(), "changed" )
+
+def last_change( path : str = None ) -> float:
+    """
+    Get the time of the last change of the queue made via slurmtools (i.e. the last `invalidate`).
+    This is 0 if no change was registered yet.
+
+    Parameters
+    ----------
+    path : str
+        The path of the change marker (see `marker`). Long-lived processes that check
+        for changes repeatedly can pass it to avoid resolving the runtime directory each time.
+    """
+    try:
+        return os.path.getmtime( path or marker() )
+    except FileNotFoundError:
+        return 0
+
+def _path( key : str ) -> str:
+    """
+    Get the file path of a cache entry.
+    """
+    name = hashlib.sha1( key.encode( "utf-8" ) ).hexdigest()
+    return os.path.join( runtime_dir(), f"{name}.snapshot" )
+
+def _read( path : str, max_age : float ) -> str:
+    """
+    Read a cache entry if it exists and is not older than max_age seconds.
+    """
+    try:
+        if time.time() - os.path.getmtime( path ) > max_age:
+            return None
+        with open( path, "r" ) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write( path : str, snapshot : str, started : float = None ):
+    """
+    Atomically write a cache entry.
+    The entry is dropped if the snapshot was fetched before the queue was last changed
+    (i.e. its fetch started before the last `invalidate`), since it may already be outdated.
+    """
+    if started is not None and started < last_change():
+        logger.debug( f"Dropping the snapshot {path} since the queue changed while it was fetched" )
+        return
+    fd, tmp = tempfile.mkstemp( dir = os.path.dirname( path ), suffix = ".tmp" )
+    try:
+        with os.fdopen( fd, "w" ) as f:
+            f.write( snapshot )
+        os.replace( tmp, path )
+    except BaseException:
+        os.remove( tmp )
+        raise
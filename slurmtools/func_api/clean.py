@@ -0,0 +1,217 @@
+"""
+Remove the stdout and stderr files of many finished jobs at once.
+
+The output files of the jobs are resolved in bulk: the records of the finished jobs that
+the controller still knows are selected with a single `squeue` (and `scontrol`) call and all
+other jobs are looked up with a single (chunked) `sacct` call, whose records already contain
+the resolved output paths (see `history.output_paths`). The files are then removed on a thread
+pool, since deleting files on a parallel network filesystem is bound by the latency of each
+metadata operation rather than by bandwidth.
+
+Since sacct does not know the output files of a job, the paths of the jobs that scontrol forgot
+are derived from the current `#SBATCH` directives of their job files, which may have changed since.
+These paths are therefore only removed if they contain the job-id, and no file that is not owned
+by the current user is ever removed.
+
+Example
+-------
+>>> from slurmtools import clean
+>>> clean( older_than = "7d", states = "COMPLETED", dry_run = True )
+{'jobs': 1234, 'files': 2468, 'bytes': 73400320, 'missing': 0, 'failed': {}, 'removed': [...]}
+"""
+
+import os
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+logger = logging.getLogger( "slurmtools" )
+
+from .info import parse_record
+from .pushdown import Selection, split_values
+from .query import compile_query
+from .timeparse import span_seconds
+
+finished_states = ( "COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL", "PREEMPTED", "BOOT_FAIL", "DEADLINE" )
+"""The states of finished jobs (whose outputs are cleaned by default)"""
+
+def clean( jobids : list = None, query = None, older_than = None, states = None, since = None,
+           stdout : bool = True, stderr : bool = True, dry_run : bool = False, workers : int = 32 ) -> dict:
+    """
+    Remove the output files of finished jobs.
+
+    Parameters
+    ----------
+    jobids : list
+        The job-ids whose outputs to remove. By default all finished jobs (of the user) are selected.
+    query : str or Query
+        Only select the jobs matching a query (see `slurmtools.func_api.query`).
+    older_than : str or int
+        Only select the jobs that ended at least this long ago (e.g. `7d`, `12h`, or seconds).
+    states : str or list
+        Only select the jobs in these states (by default all finished states).
+    since : datetime or str
+        The start of the time window that is searched in the accounting database (any time format `sacct`
+        understands). By default the 30 days before the `older_than` cutoff are searched.
+    stdout : bool
+        Remove the stdout files.
+    stderr : bool
+        Remove the stderr files.
+    dry_run : bool
+        Only report the files that would be removed.
+    workers : int
+        The number of files removed in parallel.
+
+    Returns
+    -------
+    report : dict
+        The number of selected `jobs`, the number of removed `files` and the freed `bytes`
+        (or the files and bytes that would be removed on a dry run), the number of `missing`
+        files (that did not exist anymore), the `failed` files with their error messages,
+        and the `removed` files.
+    """
+    live, archived = finished_records( jobids, query, older_than, states, since )
+    paths = output_files( live, stdout, stderr ) + output_files( archived, stdout, stderr, archived = True )
+    report = remove_files( list( dict.fromkeys( paths ) ), dry_run, workers )
+    report["jobs"] = len( live ) + len( archived )
+    return report
+
+def finished_records( jobids : list = None, query = None, older_than = None, states = None, since = None ) -> tuple:
+    """
+    Get the records of finished jobs of the current user (see `clean` for the parameters).
+
+    Returns
+    -------
+    live : list
+        The raw job records of the jobs that scontrol still knows.
+    archived : list
+        The raw job records of the other jobs (from sacct).
+    """
+    from .history import history_records
+
+    conditions = [ f"state={','.join( split_values( states ) if states else finished_states )}" ]
+    cutoff = datetime.now()
+    if older_than is not None:
+        seconds = span_seconds( older_than )
+        if seconds is None:
+            raise ValueError( f"Invalid duration '{older_than}'. Use e.g. 7d, 12h, 30m, or D-HH:MM:SS." )
+        conditions.append( f"end<now-{seconds:g}s" )
+        cutoff -= timedelta( seconds = seconds )
+    if jobids:
+        conditions.append( f"id={','.join( str(i) for i in jobids )}" )
+    conditions = compile_query( " ".join( conditions ) )
+
+    # the state (and id) filters are pushed down to squeue
+    live = Selection( conditions, mine = not jobids ).records()
+    known = { i[ len("JobId=") : ].split( maxsplit = 1 )[0] for i in live }
+
+    if since is None and not jobids:
+        since = cutoff - timedelta( days = 30 )
+    archived = {}
+    for record in conditions.filter_records( history_records( jobids, start = since ) ):
+        jobid = record[ len("JobId=") : ].split( maxsplit = 1 )[0]
+        if jobid not in known:
+            archived.setdefault( jobid, record )
+    archived = list( archived.values() )
+
+    if query is not None:
+        query = compile_query( query )
+        live, archived = query.filter_records( live ), query.filter_records( archived )
+    return live, archived
+
+def output_files( records : list, stdout : bool = True, stderr : bool = True, archived : bool = False ) -> list:
+    """
+    Get the output files of jobs.
+
+    Parameters
+    ----------
+    records : list
+        The raw job records (or `SlurmJob` objects).
+    stdout : bool
+        Include the stdout files.
+    stderr : bool
+        Include the stderr files.
+    archived : bool
+        Whether the records are from the accounting database. Their output files are derived
+        from the current directives of the job files (see `history.output_paths`), so only
+        the files whose path contains the job-id (or the array job-id) are included.
+
+    Returns
+    -------
+    paths : list
+        The (unique) output files.
+    """
+    keys = [ key for key, include in ( ( "StdOut", stdout ), ( "StdErr", stderr ) ) if include ]
+    paths = {}
+    for record in records:
+        fields = record.fields if hasattr( record, "fields" ) else parse_record( record )
+        ids = { str( fields.get( i ) ) for i in ( "JobId", "ArrayJobId" ) if fields.get( i ) is not None }
+        for key in keys:
+            path = fields.get( key )
+            if not path or path == "/dev/null":
+                continue
+            if archived and not any( jobid in path for jobid in ids ):
+                logger.debug( f"Not removing {path} since it may not belong to job {fields.get( 'JobId' )}" )
+                continue
+            paths[ path ] = None
+    return list( paths )
+
+def remove_files( paths : list, dry_run : bool = False, workers : int = 32 ) -> dict:
+    """
+    Remove files in parallel.
+    Files that are not owned by the current user are not removed (but reported as failed).
+
+    Parameters
+    ----------
+    paths : list
+        The files to remove.
+    dry_run : bool
+        Only report the files that would be removed.
+    workers : int
+        The number of files removed in parallel.
+
+    Returns
+    -------
+    report : dict
+        The number of removed `files`, the freed `bytes`, the number of `missing` files,
+        the `failed` files with their error messages, and the `removed` files.
+    """
+    uid = os.getuid()
+    def remove( path ):
+        try:
+            stat = os.lstat( path )
+            if stat.st_uid != uid:
+                return None, "not owned by the current user"
+            if not dry_run:
+                os.remove( path )
+            return stat.st_size, None
+        except FileNotFoundError:
+            return None, None
+        except OSError as e:
+            return None, str(e)
+
+    report = { "files" : 0, "bytes" : 0, "missing" : 0, "failed" : {}, "removed" : [] }
+    if not paths:
+        return report
+    with ThreadPoolExecutor( max_workers = min( workers, len(paths) ) ) as pool:
+        for path, ( size, error ) in zip( paths, pool.map( remove, paths ) ):
+            if error is not None:
+                logger.debug( f"Could not remove {path}: {error}" )
+                report["failed"][ path ] = error
+            elif size is None:
+                report["missing"] += 1
+            else:
+                report["files"] += 1
+                report["bytes"] += size
+                report["removed"].append( path )
+    return report
+
+def format_bytes( size : int ) -> str:
+    """
+    Format a number of bytes (e.g. `1.5 GB`).
+    """
+    for unit in ( "B", "KB", "MB", "GB", "TB" ):
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
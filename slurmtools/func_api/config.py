@@ -0,0 +1,29 @@
+"""
+Configure how slurmtools reaches SLURM.
+
+By default the SLURM commands (`scontrol`, `squeue`, `sbatch`, ...) are looked up on the PATH.
+The environment variable `SLURMTOOLS_SLURM_BIN` can point slurmtools at a different directory
+of SLURM executables instead (e.g. a specific SLURM installation, or the stand-in of
+`benchmarks/fakeslurm.py`).
+"""
+
+import os
+
+def slurm_bin() -> str:
+    """
+    Get the directory of the SLURM executables set via `SLURMTOOLS_SLURM_BIN`
+    (or None if the SLURM executables are looked up on the PATH).
+    """
+    return os.environ.get( "SLURMTOOLS_SLURM_BIN" ) or None
+
+def use_slurm_bin():
+    """
+    Put the configured directory of SLURM executables first on the PATH
+    (of slurmtools and all SLURM commands it runs).
+    """
+    directory = slurm_bin()
+    if not directory:
+        return
+    path = os.environ.get( "PATH", "" ).split( os.pathsep )
+    if path[0] != directory:
+        os.environ["PATH"] = os.pathsep.join( [ directory ] + path )
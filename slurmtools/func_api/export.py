@@ -0,0 +1,239 @@
+"""
+Export job listings column-wise to a pandas DataFrame, CSV, or an Arrow table (and Parquet file).
+
+Any listing of jobs can be exported: the `SlurmJob` objects of `show_all` or `history`,
+their raw records (e.g. `show_all( raw = True )`), or a `Queue` snapshot. The jobs are
+parsed once into columns and durations and timestamps are converted column-wise
+(vectorized via pandas) rather than job by job.
+
+Note
+----
+`to_frame` requires pandas and `to_arrow` and `to_parquet` additionally require pyarrow
+(`pip install slurmtools[arrow]`). `to_csv` works without any additional packages.
+
+Example
+-------
+>>> from slurmtools import show_all, snapshot, to_frame, to_csv
+>>> jobs = to_frame( show_all( mine = False ) )
+>>> jobs.groupby( "Partition" )["RunTime"].sum()
+>>> to_csv( snapshot( all = True ), "queue.csv" )
+"""
+
+import csv
+import io
+
+from .info import SlurmJob, parse_record, split_records
+from .queue import Queue
+from .timeparse import to_timedeltas, to_datetimes
+
+default_columns = (
+            "JobId", "ArrayJobId", "ArrayTaskId", "JobName", "Account", "UserId", "JobState", "Reason",
+            "Partition", "RunTime", "TimeLimit", "SubmitTime", "StartTime", "EndTime", "NodeList",
+            "NumNodes", "NumCPUs", "Mem", "MaxRSS", "ExitCode", "WorkDir", "Command", "StdOut", "StdErr",
+        )
+"""The default columns of exported jobs (the keys of the scontrol records)"""
+
+_queue_columns = {
+                    "JobId" : "ids", "JobName" : "names", "UserId" : "users", "JobState" : "states",
+                    "Partition" : "partitions", "RunTime" : "times", "TimeLimit" : "time_limits", "NumNodes" : "nodes",
+                }
+"""The scontrol keys of the `Queue` columns that are exported as they are"""
+
+_durations = { "RunTime", "TimeLimit", "TimeMin" }
+
+_timestamps = { "SubmitTime", "EligibleTime", "AccrueTime", "StartTime", "EndTime" }
+
+_integers = { "JobId", "ArrayJobId", "ArrayTaskId", "NumNodes", "NumCPUs", "Mem", "ExitCode" }
+
+def job_table( jobs, columns : tuple = None ) -> dict:
+    """
+    Get the columns of a job listing (with the raw SLURM values).
+
+    Parameters
+    ----------
+    jobs : list or str or Queue
+        The jobs. This can be a list of `SlurmJob` objects or raw job records,
+        the raw output of `scontrol show job`, or a `Queue` snapshot.
+    columns : tuple
+        The columns to get (scontrol keys). By default the `default_columns` are used
+        and `"all"` selects all keys of the records. This is ignored for queue snapshots,
+        which are exported with the scontrol keys of the columns squeue reports.
+
+    Returns
+    -------
+    table : dict
+        The columns by their names. Durations and timestamps are the raw SLURM strings
+        (for queue snapshots durations are seconds, with -1 for undefined durations).
+    """
+    if isinstance( jobs, Queue ):
+        return _queue_table( jobs )
+
+    if isinstance( jobs, str ):
+        jobs = split_records( jobs )
+    fields = [ job.fields if isinstance( job, SlurmJob ) else parse_record( job ) for job in jobs ]
+
+    if columns == "all":
+        columns = list( dict.fromkeys( key for i in fields for key in i ) )
+    columns = columns or default_columns
+    return { column : [ i.get( column ) for i in fields ] for column in columns }
+
+def _queue_table( queue : Queue ) -> dict:
+    """
+    Get the columns of a `Queue` snapshot under the scontrol keys (in the order of the `default_columns`).
+
+    Note
+    ----
+    squeue reports the array task of a job as a label (`<array>_<task>`) and the nodes of running
+    jobs or the reason of pending jobs in a single column, which are split into the corresponding keys.
+    """
+    columns = { name : list( queue.column( column ) ) for name, column in _queue_columns.items() }
+    arrays = [ label.split( "_", 1 ) if "_" in label else ( None, None ) for label in queue.labels ]
+    columns["ArrayJobId"] = [ i[0] for i in arrays ]
+    columns["ArrayTaskId"] = [ i[1].strip( "[]" ) if i[1] else None for i in arrays ]
+    pending = [ i.startswith( "(" ) for i in queue.reasons ]
+    columns["Reason"] = [ i[1:-1] if p else "None" for i, p in zip( queue.reasons, pending ) ]
+    columns["NodeList"] = [ None if p else i for i, p in zip( queue.reasons, pending ) ]
+    return { column : columns[ column ] for column in default_columns if column in columns }
+
+def to_frame( jobs, columns : tuple = None ):
+    """
+    Export jobs to a pandas DataFrame.
+
+    Parameters
+    ----------
+    jobs : list or str or Queue
+        The jobs (see `job_table`).
+    columns : tuple
+        The columns to export (see `job_table`).
+
+    Returns
+    -------
+    frame : pandas.DataFrame
+        The jobs with one row per job. Durations are `timedelta64`, timestamps `datetime64`
+        (with `NaT` for undefined values), and integer fields nullable integers.
+    """
+    import pandas as pd
+
+    table = job_table( jobs, columns )
+    frame = pd.DataFrame( table )
+    for column in frame.columns:
+        if column in _durations:
+            if isinstance( jobs, Queue ):
+                seconds = frame[ column ].where( frame[ column ] >= 0 )
+                frame[ column ] = pd.to_timedelta( seconds, unit = "s" )
+            else:
+                frame[ column ] = to_timedeltas( table[ column ] )
+        elif column in _timestamps:
+            frame[ column ] = to_datetimes( table[ column ] )
+        elif column in _integers:
+            frame[ column ] = pd.to_numeric( frame[ column ], errors = "coerce" ).astype( "Int64" )
+    return frame
+
+def to_csv( jobs, path = None, columns : tuple = None ):
+    """
+    Export jobs to CSV.
+
+    Note
+    ----
+    This does not require pandas. The values are written as SLURM reports them
+    (e.g. durations as `D-HH:MM:SS` and timestamps in ISO format).
+
+    Parameters
+    ----------
+    jobs : list or str or Queue
+        The jobs (see `job_table`).
+    path : str or file
+        The file (or an open file object) to write to. If not provided, the CSV is returned as a string.
+    columns : tuple
+        The columns to export (see `job_table`).
+
+    Returns
+    -------
+    csv : str or None
+        The CSV if no path was given.
+    """
+    table = job_table( jobs, columns )
+    if isinstance( jobs, Queue ):
+        table["RunTime"] = [ i if i >= 0 else None for i in table["RunTime"] ]
+        table["TimeLimit"] = [ i if i >= 0 else None for i in table["TimeLimit"] ]
+
+    if path is None:
+        out = io.StringIO()
+    elif isinstance( path, str ):
+        out = open( path, "w", newline = "" )
+    else:
+        out = path
+    try:
+        writer = csv.writer( out )
+        writer.writerow( table.keys() )
+        writer.writerows( zip( *table.values() ) )
+        if path is None:
+            return out.getvalue()
+    finally:
+        if isinstance( path, str ):
+            out.close()
+
+def to_arrow( jobs, columns : tuple = None ):
+    """
+    Export jobs to an Arrow table.
+
+    Parameters
+    ----------
+    jobs : list or str or Queue
+        The jobs (see `job_table`).
+    columns : tuple
+        The columns to export (see `job_table`).
+
+    Returns
+    -------
+    table : pyarrow.Table
+        The jobs with the column types of `to_frame`.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError( "Exporting to Arrow or Parquet requires pyarrow. Install it via 'pip install slurmtools[arrow]'." )
+    return pa.Table.from_pandas( to_frame( jobs, columns ), preserve_index = False )
+
+def to_parquet( jobs, path : str, columns : tuple = None ):
+    """
+    Export jobs to a Parquet file.
+
+    Parameters
+    ----------
+    jobs : list or str or Queue
+        The jobs (see `job_table`).
+    path : str
+        The Parquet file to write.
+    columns : tuple
+        The columns to export (see `job_table`).
+    """
+    table = to_arrow( jobs, columns )
+    import pyarrow.parquet as pq
+    pq.write_table( table, path )
+
+def export( jobs, format : str, path = None ):
+    """
+    Export jobs to a file format.
+
+    Parameters
+    ----------
+    jobs : list or str or Queue
+        The jobs (see `job_table`).
+    format : str
+        The format, either `csv` or `parquet`.
+    path : str
+        The file to write to. CSV is returned as a string if not provided.
+
+    Returns
+    -------
+    csv : str or None
+        The CSV if no path was given.
+    """
+    if format == "csv":
+        return to_csv( jobs, path )
+    if format == "parquet":
+        if path is None:
+            raise ValueError( "Exporting to Parquet requires a file to write to." )
+        return to_parquet( jobs, path )
+    raise ValueError( f"Unknown export format '{format}'. Use either 'csv' or 'parquet'." )
@@ -0,0 +1,339 @@
+"""
+Feed campaigns of more jobs than the cluster allows to queue at once.
+
+Clusters usually cap the number of jobs (and array tasks) a user may have queued
+(SLURM's `MaxSubmitJobs`), so submitting a campaign of 100k jobs at once fails. A `Feeder`
+keeps at most `limit` jobs of the user queued instead: it polls the user's queue with a single
+`squeue` call, submits as many of the remaining jobs as there are free slots (as job arrays
+if possible, see `submit_many`), and waits for the queue to drain before submitting more.
+
+The progress is checkpointed to disk after every submission (in the slurmtools data
+directory, see `ledger.data_dir`) and every job is recorded in the ledger as soon as its
+`sbatch` call returns, so a feeder that was interrupted (e.g. by a reboot of the login node)
+resumes where it stopped. Only the jobs whose `sbatch` call was in flight at the moment the
+feeder was killed may be submitted twice, since there is no record of their job-ids.
+
+Example
+-------
+>>> from slurmtools import Feeder, render_template
+>>> files = render_template( "task.slurm", params )
+>>> feeder = Feeder( "campaign", files, limit = 2000 )
+>>> feeder.run( interval = 60 )
+
+and after an interruption
+
+>>> Feeder( "campaign" ).run()
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import logging
+
+logger = logging.getLogger( "slurmtools" )
+
+from . import cache, runner
+from .ledger import data_dir, ledger
+from .poll import AdaptivePoll
+from .submit import CmdArgs, sbatch_options, resources, can_submit_array, submit_array, parsable_jobid, max_array_size
+
+_limit_errors = re.compile( "MaxSubmitJob|job submit limit|Job violates accounting/QOS policy" )
+"""Matches the sbatch errors of exceeded submission limits"""
+
+def feeder_path( name : str ) -> str:
+    """
+    Get the checkpoint file of a feeder (in the slurmtools data directory).
+    """
+    directory = os.path.join( data_dir(), "feeders" )
+    os.makedirs( directory, exist_ok = True )
+    return os.path.join( directory, f"{name}.json" )
+
+class Feeder:
+    """
+    Feeds jobs to SLURM while keeping at most `limit` jobs of the user queued.
+
+    Parameters
+    ----------
+    name : str
+        The name of the feeder (its checkpoint is stored under this name).
+    files : list
+        The job files to submit. If not provided, the feeder is resumed from its checkpoint.
+    limit : int
+        The maximal number of queued (pending and running) jobs and array tasks of the user,
+        including the jobs that were not submitted by the feeder.
+    chunk : int
+        The maximal number of jobs submitted at once (by default as many as there are free slots).
+    args : CmdArgs
+        The arguments to pass to the jobs.
+    array : bool
+        Submit the jobs of each chunk as a job array if possible.
+    throttle : int
+        The maximal number of array tasks running at the same time.
+    workers : int
+        The number of parallel sbatch calls if the jobs are not submitted as an array.
+    """
+    def __init__( self, name : str, files : list = None, limit : int = 1000, chunk : int = None, args = None,
+                  array : bool = True, throttle : int = None, workers : int = 8 ):
+        self.name = name
+        self.path = feeder_path( name )
+        self.workers = workers
+        self._max_array_size = None
+
+        if files is None:
+            if not os.path.exists( self.path ):
+                raise FileNotFoundError( f"There is no feeder '{name}' to resume." )
+            self._load()
+            return
+        if os.path.exists( self.path ):
+            raise FileExistsError( f"A feeder '{name}' already exists. Resume it via Feeder( '{name}' ) or remove {self.path}." )
+
+        self.files = [ os.path.abspath( i ) for i in files ]
+        self.limit = limit
+        self.chunk = chunk
+        self.resources = resources( args )
+        self.array = array
+        self.throttle = throttle
+
+        self.next = 0
+        """The index of the next file that was never submitted"""
+        self.retry = []
+        """The indices of the files whose submission was refused (due to the submission limit)"""
+        self.errors = {}
+        """The error messages of the files that could not be submitted for other reasons"""
+        self.submitted = 0
+        self.inflight = None
+        """The indices of the chunk that is being submitted (and the time the submission started)"""
+
+        with open( self._tasks, "w" ) as f:
+            f.write( "\n".join( self.files ) + "\n" )
+        self.checkpoint()
+
+    @property
+    def done( self ) -> bool:
+        """
+        Whether all jobs were submitted (or failed).
+        """
+        return self.next >= len( self.files ) and not self.retry
+
+    @property
+    def remaining( self ) -> int:
+        """
+        The number of jobs that remain to be submitted.
+        """
+        return len( self.files ) - self.next + len( self.retry )
+
+    @property
+    def max_array_size( self ) -> int:
+        """
+        The cluster's MaxArraySize (looked up once per feeder).
+        """
+        if self._max_array_size is None:
+            self._max_array_size = max_array_size()
+        return self._max_array_size
+
+    def queued( self ) -> int:
+        """
+        Get the number of queued (pending and running) jobs and array tasks of the user.
+        """
+        argv = [ "squeue", "--noheader", "--array", "--format=%i", f"--user={runner.user()}" ]
+        return len( cache.cached( argv, lambda: runner.output( argv ) ).split() )
+
+    def feed( self, n : int ) -> int:
+        """
+        Submit up to n of the remaining jobs.
+
+        Returns
+        -------
+        submitted : int
+            The number of jobs that were submitted.
+        """
+        if self.chunk:
+            n = min( n, self.chunk )
+        retried = self.retry[ :n ]
+        fresh = list( range( self.next, min( self.next + n - len(retried), len( self.files ) ) ) )
+        indices = retried + fresh
+        if not indices:
+            return 0
+
+        # record the chunk before submitting it, so a resumed feeder can tell if it was submitted
+        self.retry = self.retry[ len(retried): ]
+        self.next += len(fresh)
+        self.inflight = { "indices" : indices, "since" : time.time() }
+        self.checkpoint()
+
+        submitted, refused, interrupted = self._submit( indices )
+        self.submitted += len( submitted )
+        self.retry = refused + self.retry
+        self.inflight = None
+        self.checkpoint()
+        if submitted:
+            cache.invalidate()
+        if interrupted:
+            raise KeyboardInterrupt()
+        return len( submitted )
+
+    def run( self, interval : float = 60, max_interval : float = None, verbose : bool = False ) -> dict:
+        """
+        Feed the jobs until all of them are submitted.
+
+        Parameters
+        ----------
+        interval : float
+            The minimal number of seconds between two polls of the queue.
+        max_interval : float
+            The maximal number of seconds between two polls while the queue is full
+            (by default five times the interval).
+        verbose : bool
+            Print the progress after each submission.
+
+        Returns
+        -------
+        status : dict
+            The final status (see `status`).
+        """
+        poll = AdaptivePoll( interval, max_interval or 5 * interval )
+        while not self.done:
+            free = self.limit - self.queued()
+            submitted = self.feed( free ) if free > 0 else 0
+            if submitted:
+                msg = f"Feeder '{self.name}' submitted {submitted} jobs ({self.submitted} of {len( self.files )} submitted, {self.remaining} remaining)"
+                if verbose:
+                    print( msg )
+                else:
+                    logger.info( msg )
+            if self.done:
+                break
+            poll.polled( changed = submitted > 0 )
+            time.sleep( poll.remaining )
+        return self.status()
+
+    def status( self ) -> dict:
+        """
+        Get the progress of the feeder.
+
+        Returns
+        -------
+        status : dict
+            The `total` number of jobs, the number of `submitted`, `remaining`, and `failed` jobs.
+        """
+        return { "total" : len( self.files ), "submitted" : self.submitted, "remaining" : self.remaining, "failed" : len( self.errors ) }
+
+    def checkpoint( self ):
+        """
+        Write the progress to the checkpoint file (atomically).
+        """
+        state = {
+                    "limit" : self.limit, "chunk" : self.chunk, "resources" : self.resources, "array" : self.array,
+                    "throttle" : self.throttle, "next" : self.next, "retry" : self.retry, "errors" : self.errors,
+                    "submitted" : self.submitted, "inflight" : self.inflight,
+                }
+        tmp = f"{self.path}.tmp"
+        with open( tmp, "w" ) as f:
+            json.dump( state, f )
+            f.flush()
+            os.fsync( f.fileno() )
+        os.replace( tmp, self.path )
+
+    @property
+    def _tasks( self ) -> str:
+        """
+        The file listing the job files (written once, next to the checkpoint).
+        """
+        return f"{os.path.splitext( self.path )[0]}.tasks"
+
+    def _load( self ):
+        """
+        Load the feeder from its checkpoint.
+        """
+        with open( self.path, "r" ) as f:
+            state = json.load( f )
+        with open( self._tasks, "r" ) as f:
+            self.files = f.read().split( "\n" )[ :-1 ]
+        for key, value in state.items():
+            setattr( self, key, value )
+        self.errors = { int( k ) : v for k, v in self.errors.items() }
+        if self.inflight is not None:
+            self._reconcile()
+
+    def _reconcile( self ):
+        """
+        Find out which jobs of an interrupted submission were submitted (from the ledger).
+        """
+        since = self.inflight["since"]
+        refused = []
+        for idx in self.inflight["indices"]:
+            if any( i.submitted >= since for i in ledger().by_script( self.files[ idx ] ) ):
+                self.submitted += 1
+            else:
+                refused.append( idx )
+        self.retry = refused + self.retry
+        self.inflight = None
+        self.checkpoint()
+
+    def _submit( self, indices : list ) -> tuple:
+        """
+        Submit the jobs of a chunk.
+
+        Returns
+        -------
+        submitted : list
+            The job-ids of the submitted jobs.
+        refused : list
+            The indices of the jobs that were refused due to the submission limit
+            (or not submitted because the feeder was interrupted).
+        interrupted : bool
+            Whether the feeder was interrupted (the sbatch calls that already started are completed).
+        """
+        files = [ self.files[i] for i in indices ]
+        args = CmdArgs( **self.resources )
+        # each job is recorded in the ledger as soon as its sbatch call returns, so a resumed
+        # feeder knows about it even if the feeder was killed before the chunk was completed
+        if self.array and len( files ) > 1 and can_submit_array( files, max_size = len( files ) ):
+            # chunks larger than the cluster allows for a single array are split into several arrays
+            size = self.max_array_size
+            groups = [ indices[ i : i + size ] for i in range( 0, len( indices ), size ) ]
+            def sbatch( group ):
+                array_id = submit_array( [ self.files[i] for i in group ], args, self.throttle )
+                jobids = [ f"{array_id}_{idx}" for idx in range( len(group) ) ]
+                ledger().record_many( jobids, [ self.files[i] for i in group ], self.resources, array_id = array_id )
+                return jobids
+        else:
+            groups = [ [i] for i in indices ]
+            def sbatch( group ):
+                jobid = parsable_jobid( runner.run( [ "sbatch", "--parsable", *sbatch_options( args ), self.files[ group[0] ] ] ) )
+                ledger().record( jobid, self.files[ group[0] ], self.resources )
+                return [ jobid ]
+
+        # the sbatch calls that already started are completed even on an interrupt, so that
+        # their jobs are recorded and a resumed feeder does not submit them again
+        interrupted = False
+        with ThreadPoolExecutor( max_workers = self.workers ) as pool:
+            futures = [ pool.submit( sbatch, group ) for group in groups ]
+            try:
+                wait( futures )
+            except KeyboardInterrupt:
+                interrupted = True
+                for future in futures:
+                    future.cancel()
+                wait( futures )
+
+        jobids, refused = [], []
+        for group, future in zip( groups, futures ):
+            if future.cancelled():
+                refused += group
+            elif future.exception() is None:
+                jobids += future.result()
+            elif _limit_errors.search( str( future.exception() ) ):
+                refused += group
+            else:
+                # jobs that failed for other reasons (or may have been submitted after a timeout) are not retried
+                for idx in group:
+                    logger.warning( f"Feeder '{self.name}' could not submit {self.files[ idx ]}: {future.exception()}" )
+                    self.errors[ idx ] = str( future.exception() )
+        return jobids, refused, interrupted
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}({self.name}, {self.submitted} of {len( self.files )} submitted, limit={self.limit})"
@@ -0,0 +1,277 @@
+"""
+Job info for finished jobs from the SLURM accounting database.
+
+Once a job has finished, `scontrol` forgets about it after a while (`MinJobAge`).
+The accounting database still knows it, however. This module fetches finished jobs
+with a single `sacct` call (for a whole list of job-ids or a time window) and converts
+the accounting rows into the same `Key=Value` records that `scontrol` produces, so that
+they can be used as `SlurmJob` objects just like live jobs.
+
+Note
+----
+`sacct` does not report the stdout and stderr files of a job. These are resolved
+from the `#SBATCH --output` and `--error` directives of the submitted job file
+(if the job was submitted via slurmtools) or else SLURM's default `slurm-%j.out`
+in the working directory of the job.
+"""
+
+import os
+import re
+import shlex
+from datetime import datetime
+
+import logging
+
+logger = logging.getLogger( "slurmtools" )
+
+from . import cache, runner
+from .info import SlurmJob
+from .ledger import ledger
+from .submit import directives
+
+_sacct_format = (
+                    "JobIDRaw", "JobID", "JobName", "User", "Account", "State", "Reason", "Partition",
+                    "Elapsed", "Timelimit", "Submit", "Start", "End", "NodeList", "NNodes",
+                    "AllocCPUS", "ReqMem", "MaxRSS", "ExitCode", "WorkDir",
+                )
+"""The sacct fields of a job (in the order of the `--format` option)"""
+
+_record_keys = {
+                    "JobName" : "JobName", "User" : "UserId", "Account" : "Account", "Reason" : "Reason",
+                    "Partition" : "Partition", "Elapsed" : "RunTime", "Timelimit" : "TimeLimit",
+                    "Submit" : "SubmitTime", "Start" : "StartTime", "End" : "EndTime",
+                    "NodeList" : "NodeList", "NNodes" : "NumNodes", "AllocCPUS" : "NumCPUs",
+                    "MaxRSS" : "MaxRSS", "ExitCode" : "ExitCode", "WorkDir" : "WorkDir",
+                }
+"""The scontrol keys of the sacct fields that are copied as they are"""
+
+_chunk_size = 1000
+"""The maximal number of job-ids passed to a single sacct call"""
+
+_units = { "K" : 1 << 10, "M" : 1 << 20, "G" : 1 << 30, "T" : 1 << 40 }
+
+_filename_pattern = re.compile( "%(\\d*)([jAaxuN%])" )
+"""Matches the replacement symbols of SLURM's filename patterns"""
+
+def history( jobids : list = None, start = None, end = None, mine : bool = True, raw : bool = False ):
+    """
+    Get finished (and running) jobs from the SLURM accounting database.
+
+    Parameters
+    ----------
+    jobids : list
+        The job-ids to get. If not provided, all jobs in the time window are returned.
+    start : datetime or str
+        The start of the time window (either a datetime or any time format `sacct` understands, e.g. `now-2days`).
+        By default sacct only reports the jobs of the current day (unless job-ids are given).
+    end : datetime or str
+        The end of the time window.
+    mine : bool
+        Only include jobs owned by the current user (this is ignored if job-ids are given).
+    raw : bool
+        Return the raw (scontrol-style) job records.
+
+    Returns
+    -------
+    jobs : list or str
+        Either the raw string containing the records of all jobs
+        or a list of `SlurmJob` objects.
+    """
+    records = history_records( jobids = jobids, start = start, end = end, mine = mine )
+    if raw:
+        return "\n\n".join( records )
+    return [ SlurmJob.from_record( i ) for i in records ]
+
+def history_records( jobids : list = None, start = None, end = None, mine : bool = True ) -> list:
+    """
+    Get the raw (scontrol-style) job records of jobs from the SLURM accounting database.
+
+    Parameters
+    ----------
+    See `history`.
+
+    Returns
+    -------
+    records : list
+        The job records, each starting with `JobId=`.
+    """
+    if jobids is not None:
+        jobids = [ str(i) for i in jobids ]
+        rows = {}
+        for idx in range( 0, len(jobids), _chunk_size ):
+            rows.update( _sacct( jobids[ idx : idx + _chunk_size ], start, end, mine ) )
+    else:
+        rows = _sacct( None, start, end, mine )
+
+    submissions = ledger().by_jobids( [ row["JobID"] for row in rows.values() ] + list( rows.keys() ) )
+    records = []
+    for jobid, row in rows.items():
+        submission = submissions.get( row["JobID"] ) or submissions.get( jobid )
+        records.append( _make_record( row, submission.script if submission else None ) )
+    return records
+
+def output_paths( fields : dict, script : str = None ) -> tuple:
+    """
+    Resolve the stdin, stdout and stderr files of a job.
+
+    Parameters
+    ----------
+    fields : dict
+        The (scontrol-style) fields of the job. This needs `JobId` and `WorkDir` and
+        uses `ArrayJobId`, `ArrayTaskId`, `JobName`, `UserId`, and `NodeList` for the filename patterns.
+    script : str
+        The submitted job file whose `#SBATCH` directives specify the files.
+
+    Returns
+    -------
+    stdin, stdout, stderr : str
+        The absolute paths of the files.
+    """
+    options = {}
+    if script and os.path.exists( script ):
+        for directive in directives( script )[1]:
+            try:
+                options.update( _io_options( shlex.split( directive )[1:] ) )
+            except ValueError as e:
+                logger.debug( e )
+
+    array = fields.get( "ArrayTaskId" ) is not None
+    stdin = options.get( "input", "/dev/null" )
+    stdout = options.get( "output", "slurm-%A_%a.out" if array else "slurm-%j.out" )
+    stderr = options.get( "error", stdout )
+
+    workdir = options.get( "chdir" ) or fields.get( "WorkDir" ) or ""
+    return tuple( os.path.join( workdir, _expand( i, fields ) ) for i in ( stdin, stdout, stderr ) )
+
+def _sacct( jobids : list, start, end, mine : bool ) -> dict:
+    """
+    Run a single sacct call.
+
+    Returns
+    -------
+    rows : dict
+        The rows of the jobs (without their steps) by their raw job-ids.
+    """
+    argv = [ "sacct", "--parsable2", "--noheader", f"--format={','.join( _sacct_format )}" ]
+    if jobids:
+        argv += [ "-j", ",".join( jobids ) ]
+    elif not mine:
+        argv.append( "--allusers" )
+    if start is not None:
+        argv += [ "-S", _sacct_time( start ) ]
+    if end is not None:
+        argv += [ "-E", _sacct_time( end ) ]
+    output = cache.cached( argv, lambda: runner.output( argv ) )
+    return _parse_sacct( output )
+
+def _parse_sacct( output : str ) -> dict:
+    """
+    Parse the output of sacct into one row per job.
+    The steps of a job (e.g. `1234.batch`) only contribute their maximal memory usage (MaxRSS).
+    """
+    rows = {}
+    for line in output.splitlines():
+        values = line.split( "|" )
+        if len(values) != len(_sacct_format):
+            continue
+        row = dict( zip( _sacct_format, values ) )
+        jobid = row["JobIDRaw"]
+        if "." in jobid:
+            job = rows.get( jobid.split( "." )[0] )
+            if job is not None and _bytes( row["MaxRSS"] ) > _bytes( job["MaxRSS"] ):
+                job["MaxRSS"] = row["MaxRSS"]
+            continue
+        rows[ jobid ] = row
+    return rows
+
+def _make_record( row : dict, script : str = None ) -> str:
+    """
+    Convert a sacct row into a scontrol-style job record.
+    """
+    fields = { "JobId" : row["JobIDRaw"] }
+    array = re.fullmatch( "(\\d+)_(\\d+)", row["JobID"] )
+    if array:
+        fields["ArrayJobId"], fields["ArrayTaskId"] = array.groups()
+
+    # e.g. "CANCELLED by 1234"
+    fields["JobState"] = row["State"].split()[0] if row["State"] else None
+    for key, name in _record_keys.items():
+        fields[ name ] = row[ key ]
+    fields["Mem"] = _megabytes( row["ReqMem"], row["AllocCPUS"] )
+    fields["Command"] = script
+    fields["StdIn"], fields["StdOut"], fields["StdErr"] = output_paths( fields, script )
+
+    return " ".join( f"{key}={value}" for key, value in fields.items() if value not in ( None, "" ) )
+
+def _io_options( argv : list ) -> dict:
+    """
+    Get the input, output, error and working directory options of the arguments of an `#SBATCH` directive.
+    """
+    names = { "-i" : "input", "-o" : "output", "-e" : "error", "-D" : "chdir" }
+    options = {}
+    args = iter( argv )
+    for arg in args:
+        if arg.startswith( "--" ) and "=" in arg:
+            name, value = arg[2:].split( "=", 1 )
+        elif arg.startswith( "--" ):
+            name, value = arg[2:], next( args, None )
+        elif arg[:2] in names:
+            name, value = names[ arg[:2] ], arg[2:] or next( args, None )
+        else:
+            continue
+        if name in names.values() and value:
+            options[ name ] = value
+    return options
+
+def _expand( pattern : str, fields : dict ) -> str:
+    """
+    Fill the replacement symbols of a SLURM filename pattern (e.g. `%j` or `%A_%a`).
+    """
+    array_job = fields.get( "ArrayJobId" )
+    values = {
+                "j" : fields.get( "JobId" ),
+                "A" : array_job or fields.get( "JobId" ),
+                # this is what SLURM uses for %a if the job is not an array task
+                "a" : fields.get( "ArrayTaskId" ) if array_job else "4294967294",
+                "x" : fields.get( "JobName" ),
+                "u" : fields.get( "UserId" ),
+                "N" : ( fields.get( "NodeList" ) or "" ).split( "," )[0],
+                "%" : "%",
+            }
+    def replace( match ):
+        width, symbol = match.groups()
+        value = str( values[ symbol ] or "" )
+        return value.zfill( int(width) ) if width and value.isdigit() else value
+    return _filename_pattern.sub( replace, pattern )
+
+def _sacct_time( value ) -> str:
+    """
+    Format a start or end time for sacct.
+    """
+    if isinstance( value, datetime ):
+        return value.isoformat( timespec = "seconds" )
+    return str( value )
+
+def _bytes( value : str ) -> float:
+    """
+    Convert a sacct memory value (e.g. `123456K`) into bytes (0 if the value is empty).
+    """
+    match = re.fullmatch( "([0-9.]+)([KMGT]?)", value.strip() )
+    if not match:
+        return 0
+    number, unit = match.groups()
+    return float( number ) * _units.get( unit, 1 )
+
+def _megabytes( value : str, cpus : str ) -> int:
+    """
+    Convert a requested memory (e.g. `4G`, or `4000Mc` per cpu in older SLURM versions) into megabytes.
+    """
+    match = re.fullmatch( "([0-9.]+)([KMGT]?)([nc]?)", value.strip() )
+    if not match:
+        return None
+    number, unit, per = match.groups()
+    # sacct reports plain numbers in megabytes
+    megabytes = float( number ) * _units.get( unit, _units["M"] ) / _units["M"]
+    if per == "c" and cpus.isdigit():
+        megabytes *= int( cpus )
+    return int( megabytes )
@@ -2,20 +2,19 @@
 Show job info
 """
 
-import glob
 import os
-import subprocess
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timedelta
 import re
 
 import logging
 
 logger = logging.getLogger( "slurmtools" )
 
+from . import cache, runner
 from .last_submit import last_submit
+from .timeparse import parse_duration, parse_timestamp, to_timedeltas, to_datetimes
 
-def show_all( mine : bool = True, raw : bool = False ): 
+def show_all( mine : bool = True, raw : bool = False, states = None, partition = None ): 
     """
     Show all jobs
 
@@ -27,6 +26,12 @@ def show_all( mine : bool = True, raw : bool = False ):
 
     raw : bool
         Show raw job info. This will be detailed.
+
+    states : str or list
+        Only include jobs in these states (e.g. `PENDING`).
+
+    partition : str or list
+        Only include jobs on these partitions.
     
     Returns
     -------
@@ -34,59 +39,235 @@ def show_all( mine : bool = True, raw : bool = False ):
         Either the raw string containing the entire info
         or a list of `SlurmJob` objects.
     """
-    cmd = "scontrol show job"
-    info = subprocess.run( cmd, shell = True, capture_output = True )
-    info = info.stdout.decode("utf-8")
-    
-    # split by JobId=
-    info = info.split( "JobId=" )
-
-    # extract all jobs of the users
-    if mine:
-        username = subprocess.run( "whoami", shell = True, capture_output = True ).stdout.decode("utf-8")
-        username = f"Account={username}".strip()
-        info = [ i for i in info if username in i ]
+    info = all_records( mine = mine, states = states, partition = partition )
     
     # now convert to SlurmJob objects
     if not raw:
-
-        # now split by space and get the jobid
-        info = [ int( i.split(" ")[0] ) for i in info ]
-
-        # now assemble the SlurmJob objects
-        info = [ SlurmJob( id ) for id in info ]
+        info = [ SlurmJob.from_record( i ) for i in info ]
     
     # or re-assemble the string
     else:
-        info = [ f"JobId={i}" for i in info ]
         info = "\n\n".join( info )
     
     return info
 
-def info_by_pattern( pattern : str, mine : bool = True, raw : bool = False ):
+def all_records( mine : bool = True, states = None, partition = None ) -> list:
     """
-    Show job info for jobs matching a certain pattern in their names or ids.
+    Get the raw records of all jobs known to scontrol.
+
+    Parameters
+    ----------
+    mine : bool
+        Only include jobs owned by the current user.
+    states : str or list
+        Only include jobs in these states.
+    partition : str or list
+        Only include jobs on these partitions.
     
+    Returns
+    -------
+    records : list
+        A list of raw job records, each starting with `JobId=`.
+    """
+    return matching_records( None, mine = mine, states = states, partition = partition )
+
+def matching_records( pattern : str, mine : bool = True, states = None, partition = None ) -> list:
+    """
+    Get the raw records of all jobs matching a query or a regex pattern (see `info_by_pattern`).
+
+    Note
+    ----
+    The user, state, and partition filters (and the exact conditions of the query that squeue
+    can evaluate) are pushed down to squeue, and only the records of the selected jobs are
+    fetched from scontrol (see `slurmtools.func_api.pushdown`). If the agent is running,
+    the selection is evaluated by the agent and only the matching records are transferred.
+
     Parameters
     ----------
     pattern : str
-        The regex pattern to match.
+        The query or regex pattern (or None to select all jobs).
+    mine : bool
+        Only include jobs owned by the current user.
+    states : str or list
+        Only include jobs in these states.
+    partition : str or list
+        Only include jobs on these partitions.
+
+    Returns
+    -------
+    records : list
+        A list of raw job records, each starting with `JobId=`.
+    """
+    from . import agent
+    from .pushdown import Selection
+    from .query import Query
+    if not isinstance( pattern, Query ):
+        records = agent.request( "match", query = pattern, mine = mine, states = states, partition = partition )
+        if records is not None:
+            return records
+    return Selection( pattern, mine = mine, states = states, partition = partition ).records()
+
+def split_records( info : str ) -> list:
+    """
+    Split the output of `scontrol show job` into the records of the individual jobs.
+
+    Parameters
+    ----------
+    info : str
+        The raw output of `scontrol show job`.
+    
+    Returns
+    -------
+    records : list
+        A list of raw job records, each starting with `JobId=`.
+    """
+    # records start with JobId= at the beginning of a line 
+    # (splitting on any JobId= would also split at ArrayJobId= etc.)
+    records = re.split( "^\\s*JobId=", info, flags = re.MULTILINE )
+    records = [ f"JobId={i.strip()}" for i in records if i.strip() ]
+    return records
+
+_field_key = re.compile( "(?:^|(?<=\\s))([A-Za-z][A-Za-z0-9_/:]*)=" )
+"""Matches the keys of the `Key=Value` pairs in a scontrol record"""
+
+_int_fields = { 
+                "JobId", "ArrayJobId", "ArrayTaskId", "HetJobId", "HetJobOffset",
+                "Priority", "Nice", "Restarts", "BatchFlag", "Reboot", 
+                "NumNodes", "NumCPUs", "NumTasks", "CPUs/Task", "Mem", 
+            }
+"""Fields of a scontrol record that are converted to integers"""
+
+def parse_record( record : str ) -> dict:
+    """
+    Parse a raw scontrol job record into a dictionary of its `Key=Value` fields.
+
+    Note
+    ----
+    Values may contain spaces (e.g. job names or command paths), 
+    a value therefore extends until the next key. If a key appears multiple
+    times (e.g. `Nodes=` of the detailed per-node lines) only the first value is kept.
+
+    Parameters
+    ----------
+    record : str
+        The raw job record of a single job.
+    
+    Returns
+    -------
+    fields : dict
+        The parsed fields. Integer fields are converted to `int`, 
+        the exit code to the `int` exit status, and `(null)` values to `None`.
+    """
+    fields = {}
+    # splitting at the keys yields [ prefix, key, value, key, value, ... ] in a single pass
+    parts = _field_key.split( record )
+    for name, value in zip( parts[1::2], parts[2::2] ):
+        if name not in fields:
+            fields[ name ] = convert_value( name, value )
+    return fields
+
+def convert_value( name : str, value : str ):
+    """
+    Convert the raw value of a field of a scontrol record (see `parse_record`).
+
+    Parameters
+    ----------
+    name : str
+        The key of the field.
+    value : str
+        The raw value.
+    
+    Returns
+    -------
+    value : str or int or None
+        The converted value.
+    """
+    value = value.strip()
+    if value == "(null)":
+        return None
+    if name in _int_fields:
+        try: 
+            return int( value )
+        except ValueError:
+            return value
+    if name == "ExitCode":
+        return int( value.split(":")[0] )
+    return value
+
+def info_by_pattern( pattern : str, mine : bool = True, raw : bool = False, states = None, partition = None ):
+    """
+    Show job info for jobs matching a query or a regex pattern in their names or ids.
+
+    Note
+    ----
+    The exact conditions of the query are evaluated by squeue (see `matching_records`)
+    and the remaining ones on the raw job records, so `SlurmJob` objects
+    are only created for the matching jobs.
+    
+    Parameters
+    ----------
+    pattern : str or Query
+        The query (e.g. `state=PENDING name~^sweep_ runtime>2h`, see `slurmtools.func_api.query`)
+        or a regex pattern to match against the job names and ids.
     mine : bool
         Only include jobs owned by the current user.
     raw : bool
         Show raw job info. This will be detailed.
+    states : str or list
+        Only include jobs in these states.
+    partition : str or list
+        Only include jobs on these partitions.
     
     Returns
     -------
     jobs : list or str
         Either the raw string containing the entire info or a list of `SlurmJob` objects.
     """
-    jobs = show_all( mine = mine )
-    jobs = [ job for job in jobs if re.search( pattern, str(job.id) ) or re.search( pattern, job.name ) ]
+    records = matching_records( pattern, mine = mine, states = states, partition = partition )
 
     if raw:
-        jobs = "\n\n".join( [ job.info for job in jobs ] )
-    return jobs
+        return "\n\n".join( records )
+    return [ SlurmJob.from_record( i ) for i in records ]
+
+def runtimes( jobs : list ):
+    """
+    Get the runtimes of many jobs at once.
+
+    Note
+    ----
+    This converts the whole column in one vectorized call if pandas is installed.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of `SlurmJob` objects.
+    
+    Returns
+    -------
+    runtimes : pandas.Series or list
+        The runtimes of the jobs (see `timeparse.to_timedeltas`).
+    """
+    return to_timedeltas( [ job.fields.get( "RunTime" ) for job in jobs ] )
+
+def end_times( jobs : list ):
+    """
+    Get the end times of many jobs at once.
+
+    Note
+    ----
+    This converts the whole column in one vectorized call if pandas is installed.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of `SlurmJob` objects.
+    
+    Returns
+    -------
+    end_times : pandas.Series or list
+        The end times of the jobs (see `timeparse.to_datetimes`).
+    """
+    return to_datetimes( [ job.fields.get( "EndTime" ) for job in jobs ] )
 
 def job_info( jobid : int ):
     """
@@ -124,25 +305,67 @@ def raw_job_info( jobid : int ):
     """
     if jobid is None:
         return None
-    cmd = f"scontrol show jobid -dd {jobid}"
-    jobinfo = subprocess.run( cmd, shell = True, capture_output = True )
-    jobinfo = jobinfo.stdout.decode("utf-8")
-
-    # if we don't get anything from scontrol, then perhaps there is a 
-    # file with the jobid in its name.
-    if jobinfo == "":
-        jobinfo = glob.glob( f"*{jobid}*" )
-        if jobinfo != []:
-            if len(jobinfo) > 1:
-                logger.warning( f"Found multiple files with jobid {jobid}. Reading only the first match ({jobinfo[0]})." )
-            jobinfo = jobinfo[0]
-            jobinfo = subprocess.run( f"cat {jobinfo}", shell = True, capture_output = True )
-            jobinfo = jobinfo.stdout.decode("utf-8")
+    # a running agent knows all live jobs from its job dump
+    from . import agent
+    jobinfo = agent.request( "job", jobid = str( jobid ) )
+    if jobinfo is None:
+        argv = [ "scontrol", "show", "jobid", "-dd", jobid ]
+        jobinfo = cache.cached( argv, lambda: runner.output( argv ) )
+
+    # scontrol forgets finished jobs after a while, 
+    # but the accounting database still knows them
+    if jobinfo.strip() == "":
+        from .history import history_records
+        records = history_records( [ jobid ] )
+        if records:
+            jobinfo = records[0]
         else:
-            jobinfo = "No stdout file for the job could be found. This can happen if the job is no longer accessible via scontrol and used a non-default stdout file..."
+            logger.warning( f"Job {jobid} is known neither to scontrol nor to sacct." )
 
     return jobinfo
 
+def job_infos( jobids : list ) -> list:
+    """
+    Get the job info of many jobs at once.
+
+    Note
+    ----
+    Only the records of the given jobs are fetched from scontrol (see `pushdown.Selection`),
+    and a single (chunked) `sacct` call is used for all jobs that scontrol no longer knows.
+
+    Parameters
+    ----------
+    jobids : list
+        The job-ids (or array task-ids such as `1234_5`) whose info to get.
+    
+    Returns
+    -------
+    jobinfos : list
+        The `SlurmJob` objects (or None for unknown jobs) in the order of the job-ids.
+    """
+    from .pushdown import Selection
+    jobids = [ str(i) for i in jobids ]
+    if not jobids:
+        return []
+
+    def add( jobs ):
+        for job in jobs:
+            known[ str(job.id) ] = job
+            if job.fields.get( "ArrayTaskId" ) is not None:
+                known[ f"{job.fields.get( 'ArrayJobId' )}_{job.fields.get( 'ArrayTaskId' )}" ] = job
+
+    # array tasks are selected via their array job (which selects all of its tasks)
+    known = {}
+    selected = sorted( { i.split( "_" )[0] for i in jobids } )
+    add( SlurmJob.from_record( i ) for i in Selection( f"id={','.join( selected )}", mine = False ).records() )
+
+    missing = [ i for i in jobids if i not in known ]
+    if missing:
+        from .history import history
+        add( history( missing ) )
+    
+    return [ known.get( i ) for i in jobids ]
+
 def job_summary( jobid : int ):
     """
     Show job summary
@@ -175,13 +398,17 @@ class SlurmJob:
     ----------
     id : int
         The job-id of the job to be represented.
+    info : str
+        The raw job info (as returned by `scontrol show job`). 
+        If not provided, it is fetched from scontrol.
     """
-    def __init__( self, id ):
+    def __init__( self, id, info : str = None ):
+        if id == "last":
+            id = last_submit()
+            if id is None:
+                raise ValueError( "No last job was found" )
         if isinstance( id, str ):
-            if id == "last":
-                id = last_submit()
-            else:
-                id = int( id )
+            id = int( id )
         elif isinstance( id, float ):
             id = int( id )
     
@@ -189,7 +416,31 @@ class SlurmJob:
             raise ValueError( "id must be an int or a str that can be converted to int" )
 
         self.id = id
-        self.info = self.get_info()
+        self._fields = None
+        self.info = info if info is not None else self.get_info()
+
+    @classmethod
+    def from_record( cls, record : str ) -> "SlurmJob":
+        """
+        Create a `SlurmJob` from an already fetched raw job record
+        without calling scontrol again.
+
+        Parameters
+        ----------
+        record : str
+            The raw job record of a single job as part of 
+            the output of `scontrol show job`.
+        
+        Returns
+        -------
+        job : SlurmJob
+            The job represented by the record.
+        """
+        record = record.strip()
+        if not record.startswith( "JobId=" ):
+            record = f"JobId={record}"
+        jobid = int( record[ len("JobId=") : ].split( maxsplit = 1 )[0] )
+        return cls( jobid, info = record )
     
     def kill(self):
         """
@@ -224,11 +475,36 @@ class SlurmJob:
         stderr : bool
             Remove the stderr file.
         """
-        if stdout and os.path.exists( self.stdout ):
+        if stdout and self.stdout and os.path.exists( self.stdout ):
             os.remove( self.stdout )
-        if stderr and os.path.exists( self.stderr ):
+        if stderr and self.stderr and os.path.exists( self.stderr ):
             os.remove( self.stderr )
 
+    @property
+    def info( self ) -> str:
+        """
+        Get the raw job info
+        """
+        return self._info
+    
+    @info.setter
+    def info( self, info : str ):
+        """
+        Set the raw job info (this resets the parsed fields)
+        """
+        self._info = info
+        self._fields = None
+
+    @property
+    def fields( self ) -> dict:
+        """
+        Get the parsed `Key=Value` fields of the job info.
+        The raw info is only parsed once and then cached.
+        """
+        if self._fields is None:
+            self._fields = parse_record( self._info )
+        return self._fields
+
     @property
     def jobid( self ) -> int:
         """
@@ -241,96 +517,67 @@ class SlurmJob:
         """
         Get user who submitted the job
         """
-        pattern = "Account=([a-zA-Z0-9/_\.\\\-]*)"
-        user = re.search( pattern, self.info ).group(1)
-        return user
+        return self.fields.get( "Account" )
 
     @property
     def name( self ) -> str:
         """
         Get job name
         """
-        pattern = "JobName=([a-zA-Z0-9/_\. \\\-]*)"
-        name = re.search( pattern, self.info ).group(1)
-        return name
+        return self.fields.get( "JobName" )
     
     @property
     def state( self ):
         """
         Get job state
         """
-        pattern = "JobState=([A-Z]*)"
-        state = re.search( pattern, self.info )
-        if state: 
-            state = state.group(1)
-        return state
+        return self.fields.get( "JobState" )
     
     @property
     def state_reason( self ) -> str:
         """
         Get job state reason
         """
-        pattern = "Reason=([A-Z0-9a-z()\-_\.,]*)"
-        state = re.search( pattern, self.info )
-        if state:
-            state = state.group(1)
+        state = self.fields.get( "Reason" )
         if state == "None":
             state = None
         return state
 
     @property
-    def time( self ) -> pd.Timedelta:
+    def time( self ) -> timedelta:
         """
         Get job runtime
         """
-        pattern = "RunTime=([0-9 \- :]*)"
-        time = re.search( pattern, self.info ).group(1)
-        try: 
-            days = 0
-            if "-" in time:
-                days, time = time.split("-")
-                days = int(days)
-            hours, minutes, seconds = tuple( map( int, time.split(":") ) ) 
-            time = pd.Timedelta( days=days, hours=hours, minutes=minutes, seconds=seconds )
-                
-        except Exception as e:
-            logger.debug( e )
-        return time
+        time = self.fields.get( "RunTime" )
+        parsed = parse_duration( time )
+        return parsed if parsed is not None else time
     
     @property
-    def start( self ) -> pd.Timestamp:
+    def start( self ) -> datetime:
         """
         Get job start time
         """
-        pattern = "StartTime=([0-9T \- :]*)"
-        time = re.search( pattern, self.info ).group(1)
-        try: 
-            time = pd.to_datetime( time )
-        except Exception as e:
-            logger.debug( e )
-        return time
+        time = self.fields.get( "StartTime" )
+        parsed = parse_timestamp( time )
+        return parsed if parsed is not None else time
     
     @property
-    def end( self ) -> pd.Timestamp:
+    def end( self ) -> datetime:
         """
         Get job end time
         """
-        pattern = "EndTime=([0-9T \- :]*)"
-        time = re.search( pattern, self.info ).group(1)
-        try: 
-            time = pd.to_datetime( time )
-        except Exception as e:
-            logger.debug( e )
-        return time
+        time = self.fields.get( "EndTime" )
+        parsed = parse_timestamp( time )
+        return parsed if parsed is not None else time
 
     @property
-    def time_remaining( self ) -> pd.Timedelta:
+    def time_remaining( self ) -> timedelta:
         """
         Get job's time remaining to finish
         """
         try:
             remaining = self.end - datetime.now()
-            remaining = remaining.round( "S" )
+            remaining = timedelta( seconds = round( remaining.total_seconds() ) )
             return remaining
         except Exception as e:
             logger.debug( e )
@@ -341,10 +588,9 @@ class SlurmJob:
         """
         Get job nodes
         """
-        pattern = "Nodes=([a-zA-Z0-9/_\.\\\-]*)"
-        nodes = re.search( pattern, self.info )
-        if nodes:
-            nodes = nodes.group(1)
+        nodes = self.fields.get( "NodeList" )
+        if nodes is None:
+            nodes = self.fields.get( "Nodes" )
         return nodes
     
     @property
@@ -352,98 +598,70 @@ class SlurmJob:
         """
         Get the number of cores
         """
-        pattern = "NumCPUs=([0-9]*)"
-        cores = re.search( pattern, self.info )
-        if cores:
-            cores = cores.group(1)
-            cores = int( cores )
-        return cores
+        return self.fields.get( "NumCPUs" )
     
     @property
     def memory( self ) -> int:
         """
         Get the memory assignment
         """
-        pattern = "Mem=([0-9]*)"
-        memory = re.search( pattern, self.info )
-        if memory: 
-            memory = memory.group(1)
-            memory = int( memory )
-        return memory
+        return self.fields.get( "Mem" )
 
     @property
     def partition( self ) -> str:
         """
         Get the partition
         """
-        pattern = "Partition=([a-zA-Z0-9/_\.\\\-]*)"
-        partition = re.search( pattern, self.info )
-        if partition:
-            partition = partition.group(1)
-        return partition
+        return self.fields.get( "Partition" )
     
     @property
     def command( self ) -> str:
         """
         Get the command
         """
-        pattern = "Command=([a-zA-Z0-9 / _ \. \\ \-]*)"
-        command = re.search( pattern, self.info ).group(1)
-        return command
+        return self.fields.get( "Command" )
     
     @property
     def exit_code( self ) -> int:
         """
         Get the exit code
         """
-        pattern = "ExitCode=([0-9])"
-        exit_code = re.search( pattern, self.info ).group(1)
-        exit_code = int( exit_code )
-        return exit_code
+        return self.fields.get( "ExitCode" )
     
     @property
     def stdin( self ) -> str:
         """
         Get the stdin
         """
-        pattern = "StdIn=([a-zA-Z0-9 / _ \. \\ \-]*)"
-        stdin = re.search( pattern, self.info )
-        if stdin:
-            stdin = stdin.group(1)
-        return stdin
+        return self.fields.get( "StdIn" )
     
     @property
     def stdout( self ) -> str:
         """
         Get the stdout
         """
-        pattern = "StdOut=([a-zA-Z0-9 / _ \. \\ \-]*)"
-        stdout = re.search( pattern, self.info )
-        if stdout:
-            stdout = stdout.group(1)
-        return stdout
+        return self.fields.get( "StdOut" )
     
     @property
     def stderr( self ) -> str:
         """
         Get the stderr
         """
-        pattern = "StdErr=([a-zA-Z0-9 / _ \. \\ \-]*)"
-        stderr = re.search( pattern, self.info )
-        if stderr:
-            stderr = stderr.group(1)
-        return stderr
+        return self.fields.get( "StdErr" )
     
+    @property
+    def max_rss( self ) -> str:
+        """
+        Get the maximal memory usage (only known for jobs from the accounting database)
+        """
+        return self.fields.get( "MaxRSS" )
+
     @property
     def workdir( self ) -> str:
         """
         Get the working directory
         """
-        pattern = "WorkDir=([a-zA-Z0-9 / _ \. \\ \-]*)"
-        workdir = re.search( pattern, self.info )
-        if workdir:
-            workdir = workdir.group(1)
-        return workdir
+        return self.fields.get( "WorkDir" )
 
     def _make_summary( self ) -> str:
         """
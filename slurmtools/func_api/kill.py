@@ -3,11 +3,18 @@ Kill a slurm job
 """
 
 import os
-import subprocess
 import re 
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
+import logging
+
+logger = logging.getLogger( "slurmtools" )
+
+from . import cache, runner
 from .last_submit import last_submit, reset_last_submit
-from .info import show_all, SlurmJob
+from .info import show_all, matching_records, job_infos, SlurmJob
+from .pushdown import Selection
 
 
 def clear_output( jobid : (int or SlurmJob or list), stdout : bool = True, stderr : bool = True ):
@@ -25,7 +32,17 @@ def clear_output( jobid : (int or SlurmJob or list), stdout : bool = True, stder
         Clear the stderr of the job.
     """
     if isinstance( jobid, (list, tuple) ):
-        [ clear_output( jobid = j, stdout = stdout, stderr = stderr ) for j in jobid ]
+        # resolve all jobs at once rather than one scontrol (or sacct) call per job
+        # and remove their outputs in parallel
+        from .clean import output_files, remove_files
+        ids = [ j for j in jobid if not isinstance( j, SlurmJob ) ]
+        resolved = dict( zip( ids, job_infos( ids ) ) )
+        jobs = [ j if isinstance( j, SlurmJob ) else resolved[ j ] for j in jobid ]
+        jobs = [ j for j in jobs if j is not None ]
+        report = remove_files( output_files( jobs, stdout = stdout, stderr = stderr ) )
+        for path, msg in report["failed"].items():
+            logger.warning( f"Could not remove {path}: {msg}" )
+        print( f"Output of {len(jobs)} jobs cleared" + ( f" ({len( report['failed'] )} files could not be removed)" if report["failed"] else "" ) )
         return 
     if not isinstance( jobid, SlurmJob ):
         jobid = SlurmJob( jobid )
@@ -45,7 +62,7 @@ def kill_last( clear_stdout : bool = False, clear_stderr : bool = False ):
     """
     kill_job( last = True, clear_stdout = clear_stdout, clear_stderr = clear_stderr )
 
-def kill_all( clear_stdout : bool = False, clear_stderr : bool = False ):
+def kill_all( clear_stdout : bool = False, clear_stderr : bool = False, state : str = None ):
     """
     Kill all jobs
 
@@ -55,30 +72,152 @@ def kill_all( clear_stdout : bool = False, clear_stderr : bool = False ):
         Remove the stdout of the job.
     clear_stderr : bool
         Remove the stderr of the job.
+    state : str
+        Only kill jobs in this state (e.g. `PENDING`).
     """
-    kill_job( all = True, clear_stdout = clear_stdout, clear_stderr = clear_stderr )
+    kill_job( all = True, clear_stdout = clear_stdout, clear_stderr = clear_stderr, state = state )
 
-def kill_by_pattern( pattern : str, clear_stdout : bool = False, clear_stderr : bool = False ):
+def kill_by_pattern( pattern : str, clear_stdout : bool = False, clear_stderr : bool = False, states = None, partition = None ):
     """
-    Kill all jobs matching a pattern either in their id or name.
+    Kill all jobs matching a query or a regex pattern in their id or name.
+
+    Note
+    ----
+    The exact conditions of the query are evaluated by squeue. If the query has no other
+    conditions (and the outputs are kept) the jobs are selected by squeue alone. Otherwise 
+    the remaining conditions are evaluated on the raw job records, so `SlurmJob` objects are only
+    created for the matching jobs (and only if their outputs are cleared).
 
     Parameters
     ----------
-    pattern : str
-        The regex pattern to match.
+    pattern : str or Query
+        The query (e.g. `state=PENDING name~^sweep_`, see `slurmtools.func_api.query`)
+        or a regex pattern to match against the job names and ids.
     clear_stdout : bool
         Remove the stdout of the job.
     clear_stderr : bool
         Remove the stderr of the job.
+    states : str or list
+        Only kill jobs in these states.
+    partition : str or list
+        Only kill jobs on these partitions.
+    """
+    selection = Selection( pattern, states = states, partition = partition )
+    if selection.residual is None and not ( clear_stdout or clear_stderr ):
+        # only pending and running jobs can be killed
+        kill_jobs( selection.jobids( all_states = False ) )
+        return
+
+    records = matching_records( pattern, states = states, partition = partition )
+    if clear_stdout or clear_stderr:
+        jobs = [ SlurmJob.from_record( i ) for i in records ]
+    else:
+        jobs = [ i[ len("JobId=") : ].split( maxsplit = 1 )[0] for i in records ]
+    kill_jobs( jobs, clear_stdout = clear_stdout, clear_stderr = clear_stderr )
+
+def kill_jobs( jobs : list, clear_stdout : bool = False, clear_stderr : bool = False, chunk_size : int = 500 ) -> tuple:
     """
-    jobs = show_all()
-    jobs = [ job for job in jobs if re.search( pattern, str(job.id) ) or re.search( pattern, job.name ) ]
-    print( f"Killing jobs: {jobs}" )
-    [ job.kill() for job in jobs ]
+    Kill many jobs at once. 
+    
+    The jobs are cancelled via chunked multi-id `scancel` calls 
+    and their outputs are removed in parallel.
+
+    Parameters
+    ----------
+    jobs : list
+        The job-ids or `SlurmJob` objects to kill.
+    clear_stdout : bool
+        Remove the stdout of the jobs.
+    clear_stderr : bool
+        Remove the stderr of the jobs.
+    chunk_size : int
+        The maximal number of job-ids passed to a single `scancel` call.
+
+    Returns
+    -------
+    killed : list
+        The ids of the jobs that were killed.
+    failed : dict
+        The ids of the jobs that could not be killed and the corresponding error messages.
+    """
+    ids = [ str( job.id if isinstance( job, SlurmJob ) else job ) for job in jobs ]
+    failed = {}
+    for start in range( 0, len(ids), chunk_size ):
+        chunk = ids[ start : start + chunk_size ]
+        result = runner.run( [ "scancel", "--user", runner.user(), *chunk ] )
+        failed.update( _scancel_failures( result.stderr.decode("utf-8"), chunk ) )
+    if ids:
+        cache.invalidate()
+    killed = [ i for i in ids if i not in failed ]
+
+    cleared, not_cleared = 0, {}
     if clear_stdout or clear_stderr:
-        [ job.clear( stdout = clear_stdout, stderr = clear_stderr ) for job in jobs ]
+        jobs = [ job for job in jobs if str( job.id if isinstance( job, SlurmJob ) else job ) in killed ]
+        cleared, not_cleared = _clear_many( jobs, stdout = clear_stdout, stderr = clear_stderr )
 
-def kill_job( jobid : int = None, all : bool = False, last : bool = False, clear_stdout : bool = False, clear_stderr : bool = False ):
+    summary = f"Killed {len(killed)} of {len(ids)} jobs"
+    if clear_stdout or clear_stderr:
+        summary += f", cleared the outputs of {cleared}"
+    print( summary )
+    for jobid, msg in failed.items():
+        print( f"Could not kill job {jobid}: {msg}" )
+    for jobid, msg in not_cleared.items():
+        print( f"Could not clear the output of job {jobid}: {msg}" )
+    return killed, failed
+
+def _scancel( argv : list ):
+    """
+    Run scancel and pass its error messages on to the user.
+    (The output is captured so that transient controller errors can be retried.)
+    """
+    result = runner.run( argv )
+    if result.stderr:
+        sys.stderr.write( result.stderr.decode("utf-8") )
+
+def _scancel_failures( stderr : str, ids : list ) -> dict:
+    """
+    Get the job-ids (and error messages) that scancel reported errors for.
+    """
+    failed = {}
+    ids = set( ids )
+    for line in stderr.splitlines():
+        jobid = re.search( "job id ([0-9_]+)", line )
+        if jobid and jobid.group(1) in ids:
+            failed[ jobid.group(1) ] = line.split( ":", 2 )[-1].strip()
+    return failed
+
+def _clear_many( jobs : list, stdout : bool = True, stderr : bool = True, workers : int = 16 ) -> tuple:
+    """
+    Clear the outputs of many jobs in parallel.
+
+    Returns
+    -------
+    cleared : int
+        The number of jobs whose outputs were cleared.
+    failed : dict
+        The ids of the jobs whose outputs could not be cleared and the corresponding error messages.
+    """
+    failed = {}
+    ids = [ job for job in jobs if not isinstance( job, SlurmJob ) ]
+    if ids:
+        resolved = dict( zip( ids, job_infos( ids ) ) )
+        failed = { str(i) : "the job is unknown to scontrol and sacct" for i, job in resolved.items() if job is None }
+        jobs = [ job if isinstance( job, SlurmJob ) else resolved[ job ] for job in jobs ]
+        jobs = [ job for job in jobs if job is not None ]
+
+    def clear( job ):
+        try:
+            job.clear( stdout = stdout, stderr = stderr )
+            return None
+        except Exception as e:
+            logger.debug( e )
+            return str(e)
+    with ThreadPoolExecutor( max_workers = workers ) as pool:
+        errors = list( pool.map( clear, jobs ) )
+    failed.update( { str( job.id ) : error for job, error in zip( jobs, errors ) if error is not None } )
+    return len( jobs ) - sum( error is not None for error in errors ), failed
+
+def kill_job( jobid : int = None, all : bool = False, last : bool = False, clear_stdout : bool = False, clear_stderr : bool = False, state : str = None ):
     """
     Kill a slurm job. 
 
@@ -98,20 +237,40 @@ def kill_job( jobid : int = None, all : bool = False, last : bool = False, clear
         Remove the stdout of the job.
     clear_stderr : bool
         Remove the stderr of the job.
+    state : str
+        Only kill jobs in this state (only used together with `all`).
     """
     if all: 
-        cmd = "-A $USER"
-    elif last:
-        cmd = last_submit()
+        # the outputs can only be found while the jobs are still known to scontrol
+        jobs = show_all( states = state ) if clear_stdout or clear_stderr else []
+
+        # a single server-side filtered call kills all jobs
+        argv = [ "scancel", "--user", runner.user() ]
+        if state:
+            argv.append( f"--state={state}" )
+        _scancel( argv )
+        cache.invalidate()
+
+        not_cleared = {}
+        if jobs:
+            _, not_cleared = _clear_many( jobs, stdout = clear_stdout, stderr = clear_stderr )
+        print( "All jobs killed" if not state else f"All {state} jobs killed" )
+        for jobid, msg in not_cleared.items():
+            print( f"Could not clear the output of job {jobid}: {msg}" )
+        return
+
+    if last:
+        jobid = last_submit()
+        if jobid is None:
+            print( "No last job was found. Make sure that you submit jobs using 'slurmtools new' because 'sbatch' submitted jobs are not recorded!" )
+            return
         reset_last_submit()
-        jobid = cmd
-    else:
-        cmd = f"-A $USER {jobid}" 
-    cmd = f"scancel {cmd}"
-    subprocess.run( cmd, shell = True )
+    job = SlurmJob( jobid ) if clear_stdout or clear_stderr else None
 
-    if clear_stdout or clear_stderr:
-        clear_output( jobid = jobid, stdout = clear_stdout, stderr = clear_stderr )
+    _scancel( [ "scancel", "--user", runner.user(), jobid ] )
+    cache.invalidate()
+
+    if job is not None:
+        clear_output( jobid = job, stdout = clear_stdout, stderr = clear_stderr )
 
     print( f"Job {jobid} killed" )
-    
\ No newline at end of file
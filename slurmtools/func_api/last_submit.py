@@ -1,30 +1,41 @@
-_last_submit = [None]
-"""The last submitted job id"""
+"""
+Remember the last submitted job (via the submission ledger).
+"""
 
-def last_submit( jobid = None ):
+from .ledger import ledger
+
+def last_submit( jobid = None, script : str = None, resources : dict = None ):
     """
     Get and/or set the last submitted job id
+
+    Parameters
+    ----------
+    jobid : int
+        A newly submitted job id to record.
+    script : str
+        The job file of the newly submitted job.
+    resources : dict
+        The requested resources of the newly submitted job.
+
+    Returns
+    -------
+    jobid : str or None
+        The last submitted job id (for job arrays the id of the array).
+        This is None if nothing was submitted yet or the last job was reset.
     """
     if jobid is not None:
-        # if we have a new jobid then we have to write it 
-        # to the file to ensure it is remembered across command
-        # line calls
-        with open( __file__ , "r" ) as f: 
-            c = f.read().split("\n")
-            c[0] = f"_last_submit = [{jobid}]"
-            c = "\n".join(c)
-        with open( __file__ , "w" ) as f: 
-            f.write( c )
-    return _last_submit[0]
+        ledger().record( jobid, script, resources )
+    last = ledger().last()
+    if last is None or last.cancelled:
+        return None
+    if last.array_id is not None:
+        return str( last.array_id )
+    # array tasks that were recorded without their array id
+    return last.jobid.split( "_" )[0]
 
 def reset_last_submit():
     """
     Reset the last submitted job id
     """
-    with open( __file__ , "r" ) as f: 
-        c = f.read().split("\n")
-        c[0] = "_last_submit = [None]"
-        c = "\n".join(c)
-    with open( __file__ , "w" ) as f: 
-        f.write( c )
-    return _last_submit[0]
\ No newline at end of file
+    ledger().cancel_last()
+    return None
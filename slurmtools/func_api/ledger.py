@@ -0,0 +1,302 @@
+"""
+The submission ledger.
+
+All jobs submitted via slurmtools are recorded in a per-user SQLite database
+(`$XDG_DATA_HOME/slurmtools/ledger.sqlite`, or `~/.local/share/slurmtools/ledger.sqlite`,
+or in `SLURMTOOLS_DATA_DIR` if set) together with their script, resources, and submission time.
+SQLite's file locking makes concurrent submissions from several processes safe, and the
+ledger supports constant-time lookups of the last submissions and indexed lookups by script.
+Submitted workflows are recorded with the job-id and the dependencies of each of their steps.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+def data_dir() -> str:
+    """
+    Get the per-user data directory of slurmtools (it is created if necessary).
+    """
+    directory = os.environ.get( "SLURMTOOLS_DATA_DIR" )
+    if not directory:
+        base = os.environ.get( "XDG_DATA_HOME" ) or os.path.join( os.path.expanduser( "~" ), ".local", "share" )
+        directory = os.path.join( base, "slurmtools" )
+    os.makedirs( directory, exist_ok = True )
+    return directory
+
+class Submission:
+    """
+    A single recorded submission.
+
+    Parameters
+    ----------
+    row : sqlite3.Row
+        The ledger row of the submission.
+    """
+    def __init__( self, row ):
+        self.entry = row["entry"]
+        self.jobid = row["jobid"]
+        self.array_id = row["array_id"]
+        self.script = row["script"]
+        self.resources = json.loads( row["resources"] ) if row["resources"] else {}
+        self.submitted = row["submitted"]
+        self.cancelled = bool( row["cancelled"] )
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}(jobid={self.jobid}, script={self.script})"
+
+class WorkflowRun:
+    """
+    A recorded workflow submission (see `slurmtools.func_api.workflow`).
+
+    Parameters
+    ----------
+    row : sqlite3.Row
+        The ledger row of the workflow.
+    steps : list
+        The ledger rows of the workflow's steps (in submission order).
+    """
+    def __init__( self, row, steps : list ):
+        self.id = row["workflow"]
+        self.name = row["name"]
+        self.submitted = row["submitted"]
+        self.jobids = { i["step"] : i["jobid"] for i in steps }
+        """The job-id of each step"""
+        self.after = { i["step"] : json.loads( i["after"] ) for i in steps }
+        """The dependencies (`{ step : kind }`) of each step"""
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}(id={self.id}, name={self.name}, steps={len(self.jobids)})"
+
+class Ledger:
+    """
+    The submission ledger.
+
+    Parameters
+    ----------
+    path : str
+        The ledger database file. By default `ledger.sqlite` in the slurmtools data directory.
+    """
+    def __init__( self, path : str = None ):
+        self.path = path or os.path.join( data_dir(), "ledger.sqlite" )
+        self._local = threading.local()
+
+    def record( self, jobid, script : str = None, resources : dict = None, array_id : int = None ):
+        """
+        Record a new submission.
+
+        Parameters
+        ----------
+        jobid : int or str
+            The job-id (or array task-id) of the submitted job.
+        script : str
+            The submitted job file.
+        resources : dict
+            The requested resources (e.g. `time`, `cores`, `memory`, ...).
+        array_id : int
+            The id of the job array the job is a task of.
+        """
+        self.record_many( [ jobid ], [ script ], resources, array_id )
+
+    def record_many( self, jobids : list, scripts : list = None, resources : dict = None, array_id : int = None ):
+        """
+        Record many submissions at once (in a single transaction).
+
+        Parameters
+        ----------
+        jobids : list
+            The job-ids (or array task-ids) of the submitted jobs.
+        scripts : list
+            The submitted job files (one per job).
+        resources : dict
+            The requested resources shared by all of the jobs.
+        array_id : int
+            The id of the job array the jobs are tasks of.
+        """
+        scripts = scripts or [ None ] * len( jobids )
+        resources = json.dumps( { k : v for k, v in ( resources or {} ).items() if v is not None } )
+        now = time.time()
+        rows = [ ( str(jobid), array_id, os.path.abspath( script ) if script else None, resources, now ) for jobid, script in zip( jobids, scripts ) ]
+        with self._connect() as connection:
+            connection.executemany( "INSERT INTO submissions ( jobid, array_id, script, resources, submitted ) VALUES ( ?, ?, ?, ?, ? )", rows )
+
+    def last( self ) -> Submission:
+        """
+        Get the last submission (or None if nothing was recorded yet).
+        """
+        submissions = self.last_n( 1 )
+        return submissions[0] if submissions else None
+
+    def last_n( self, n : int ) -> list:
+        """
+        Get the last n submissions (the most recent first).
+        """
+        rows = self._connect().execute( "SELECT * FROM submissions ORDER BY entry DESC LIMIT ?", ( n, ) )
+        return [ Submission( row ) for row in rows ]
+
+    def by_script( self, script : str ) -> list:
+        """
+        Get all submissions of a job file (the most recent first).
+        """
+        rows = self._connect().execute( "SELECT * FROM submissions WHERE script = ? ORDER BY entry DESC", ( os.path.abspath( script ), ) )
+        return [ Submission( row ) for row in rows ]
+
+    def by_jobid( self, jobid ) -> Submission:
+        """
+        Get the submission of a job-id (or None if the job was not recorded).
+        """
+        row = self._connect().execute( "SELECT * FROM submissions WHERE jobid = ? ORDER BY entry DESC LIMIT 1", ( str(jobid), ) ).fetchone()
+        return Submission( row ) if row else None
+
+    def by_jobids( self, jobids : list ) -> dict:
+        """
+        Get the submissions of many job-ids at once.
+
+        Returns
+        -------
+        submissions : dict
+            The (most recent) submission of each recorded job-id by its job-id.
+            Job-ids that were not recorded are missing.
+        """
+        jobids = list( { str(i) for i in jobids } )
+        submissions = {}
+        # stay below SQLite's limit of variables per statement
+        for idx in range( 0, len(jobids), 500 ):
+            chunk = jobids[ idx : idx + 500 ]
+            placeholders = ", ".join( "?" * len(chunk) )
+            rows = self._connect().execute( f"SELECT * FROM submissions WHERE jobid IN ( {placeholders} ) ORDER BY entry", chunk )
+            submissions.update( { row["jobid"] : Submission( row ) for row in rows } )
+        return submissions
+
+    def record_workflow( self, name : str, steps : list ) -> int:
+        """
+        Record a submitted workflow and the submissions of its steps (in a single transaction).
+
+        Parameters
+        ----------
+        name : str
+            The name of the workflow.
+        steps : list
+            The submitted steps as dictionaries with the `step` name, the `jobid`,
+            the `script`, the requested `resources`, and the dependencies (`after`, `{ step : kind }`),
+            in submission order.
+
+        Returns
+        -------
+        workflow : int
+            The id of the recorded workflow.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            workflow = connection.execute( "INSERT INTO workflows ( name, submitted ) VALUES ( ?, ? )", ( name, now ) ).lastrowid
+            connection.executemany( "INSERT INTO submissions ( jobid, script, resources, submitted ) VALUES ( ?, ?, ?, ? )", [
+                    ( str( i["jobid"] ), os.path.abspath( i["script"] ), json.dumps( { k : v for k, v in ( i.get( "resources" ) or {} ).items() if v is not None } ), now )
+                    for i in steps
+                ] )
+            connection.executemany( "INSERT INTO workflow_steps ( workflow, step, jobid, after ) VALUES ( ?, ?, ?, ? )", [
+                    ( workflow, i["step"], str( i["jobid"] ), json.dumps( i.get( "after" ) or {} ) ) for i in steps
+                ] )
+        return workflow
+
+    def workflow( self, workflow = None ) -> WorkflowRun:
+        """
+        Get a recorded workflow.
+
+        Parameters
+        ----------
+        workflow : int or str
+            The id or the name of the workflow (the most recent one of that name).
+            By default the last submitted workflow is returned.
+
+        Returns
+        -------
+        workflow : WorkflowRun
+            The workflow (or None if it was not recorded).
+        """
+        connection = self._connect()
+        if workflow is None:
+            row = connection.execute( "SELECT * FROM workflows ORDER BY workflow DESC LIMIT 1" ).fetchone()
+        elif str( workflow ).isdigit():
+            row = connection.execute( "SELECT * FROM workflows WHERE workflow = ?", ( int( workflow ), ) ).fetchone()
+        else:
+            row = connection.execute( "SELECT * FROM workflows WHERE name = ? ORDER BY workflow DESC LIMIT 1", ( workflow, ) ).fetchone()
+        if row is None:
+            return None
+        steps = connection.execute( "SELECT * FROM workflow_steps WHERE workflow = ? ORDER BY rowid", ( row["workflow"], ) ).fetchall()
+        return WorkflowRun( row, steps )
+
+    def workflows( self, n : int = 10 ) -> list:
+        """
+        Get the last n recorded workflows (the most recent first).
+        """
+        rows = self._connect().execute( "SELECT workflow FROM workflows ORDER BY workflow DESC LIMIT ?", ( n, ) ).fetchall()
+        return [ self.workflow( row["workflow"] ) for row in rows ]
+
+    def cancel_last( self ):
+        """
+        Mark the last submission as cancelled (if it is a task of a job array, all tasks of the array).
+        """
+        with self._connect() as connection:
+            last = connection.execute( "SELECT entry, array_id FROM submissions ORDER BY entry DESC LIMIT 1" ).fetchone()
+            if last is None:
+                return
+            if last["array_id"] is None:
+                connection.execute( "UPDATE submissions SET cancelled = 1 WHERE entry = ?", ( last["entry"], ) )
+            else:
+                connection.execute( "UPDATE submissions SET cancelled = 1 WHERE array_id = ?", ( last["array_id"], ) )
+
+    def _connect( self ) -> sqlite3.Connection:
+        """
+        Get the (lazily opened) database connection of the current thread.
+
+        Note
+        ----
+        sqlite connections may only be used by the thread that opened them, so each
+        thread (e.g. the request handlers of the agent or the sbatch workers of a feeder)
+        opens its own connection.
+        """
+        connection = getattr( self._local, "connection", None )
+        if connection is None:
+            connection = sqlite3.connect( self.path, timeout = 30 )
+            connection.row_factory = sqlite3.Row
+            connection.executescript( """
+                CREATE TABLE IF NOT EXISTS submissions (
+                    entry INTEGER PRIMARY KEY AUTOINCREMENT,
+                    jobid TEXT NOT NULL,
+                    array_id INTEGER,
+                    script TEXT,
+                    resources TEXT,
+                    submitted REAL NOT NULL,
+                    cancelled INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS submissions_script ON submissions ( script );
+                CREATE INDEX IF NOT EXISTS submissions_jobid ON submissions ( jobid );
+                CREATE INDEX IF NOT EXISTS submissions_array ON submissions ( array_id );
+                CREATE TABLE IF NOT EXISTS workflows (
+                    workflow INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    submitted REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS workflow_steps (
+                    workflow INTEGER NOT NULL REFERENCES workflows ( workflow ),
+                    step TEXT NOT NULL,
+                    jobid TEXT NOT NULL,
+                    after TEXT
+                );
+                CREATE INDEX IF NOT EXISTS workflow_steps_workflow ON workflow_steps ( workflow );
+            """ )
+            self._local.connection = connection
+        return connection
+
+_ledger = [ None ]
+"""The default ledger (opened on first use)"""
+
+def ledger() -> Ledger:
+    """
+    Get the default submission ledger.
+    """
+    if _ledger[0] is None:
+        _ledger[0] = Ledger()
+    return _ledger[0]
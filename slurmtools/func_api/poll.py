@@ -0,0 +1,69 @@
+"""
+An adaptive polling schedule.
+
+The schedule polls quickly while things are changing (or right after the user
+changed something, e.g. by submitting or killing jobs) and backs off exponentially
+up to a ceiling while nothing changes. This keeps long-lived viewers responsive
+without putting a constant load on the SLURM controller.
+"""
+
+import time
+
+class AdaptivePoll:
+    """
+    An adaptive polling schedule with exponential backoff.
+
+    Parameters
+    ----------
+    minimum : float
+        The minimal interval between two polls in seconds.
+    maximum : float
+        The maximal interval between two polls in seconds.
+    factor : float
+        The factor by which the interval grows after each poll without changes.
+    """
+    def __init__( self, minimum : float = 1, maximum : float = 60, factor : float = 2 ):
+        self.minimum = minimum
+        self.maximum = max( minimum, maximum )
+        self.factor = factor
+        self.interval = minimum
+        self._last = None
+        self._next = time.monotonic()
+
+    def due( self ) -> bool:
+        """
+        Check if the next poll is due.
+        """
+        return time.monotonic() >= self._next
+
+    def polled( self, changed : bool ):
+        """
+        Register a poll and schedule the next one.
+
+        Parameters
+        ----------
+        changed : bool
+            Whether the poll found any changes. If so, the interval is reset to the
+            minimum, otherwise it is increased (up to the maximum).
+        """
+        if changed:
+            self.interval = self.minimum
+        else:
+            self.interval = min( self.interval * self.factor, self.maximum )
+        self._last = time.monotonic()
+        self._next = self._last + self.interval
+
+    def reset( self ):
+        """
+        Poll as soon as the minimal interval since the last poll has passed and return to the minimal interval.
+        """
+        self.interval = self.minimum
+        if self._last is not None:
+            self._next = min( self._next, self._last + self.minimum )
+
+    @property
+    def remaining( self ) -> float:
+        """
+        Get the number of seconds until the next poll.
+        """
+        return max( self._next - time.monotonic(), 0 )
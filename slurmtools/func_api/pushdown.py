@@ -0,0 +1,159 @@
+"""
+Push job filters down to SLURM.
+
+scontrol cannot filter jobs, so selecting the jobs of the user (or of a state, partition, ...)
+in Python requires the job dump of the whole cluster. squeue filters on the controller instead.
+A `Selection` therefore translates the `mine`, `states`, and `partition` options and the exact
+(`=`) conditions of a query on `UserId`, `Account`, `JobState`, `Partition`, `JobName`, and `JobId`
+into squeue flags, so the ids of the selected jobs (e.g. to kill them) are listed by a single
+squeue call, and only the remaining (residual) conditions of the query are evaluated in Python.
+
+The records of the selected jobs are then fetched from scontrol by their ids (in batches of
+several ids per call). Only selections without any squeue filter read the job dump of the whole cluster.
+
+Example
+-------
+>>> selection = Selection( "state=PENDING partition=long runtime>2h", mine = True )
+>>> selection.squeue_args()
+['--user=alice', '--states=PENDING', '--partition=long']
+>>> selection.residual
+Query('RunTime>2h')
+"""
+
+from . import cache, runner
+from .query import compile_query
+
+_flags = { "UserId" : "--user", "Account" : "--account", "JobState" : "--states", "Partition" : "--partition", "JobName" : "--name", "JobId" : "--jobs" }
+"""The squeue flags of the fields that can be filtered by the controller (for exact matches)"""
+
+_batch = 500
+"""The maximal number of job-ids whose records are fetched with a single scontrol call"""
+
+class Selection:
+    """
+    A selection of jobs, split into the filters evaluated by squeue and the residual query.
+
+    Parameters
+    ----------
+    query : str or Query
+        The query (or regex pattern) to select jobs with (see `slurmtools.func_api.query`).
+    mine : bool
+        Only select jobs of the current user.
+    states : str or list
+        Only select jobs in these states (e.g. `PENDING` or `[ "PENDING", "RUNNING" ]`).
+    partition : str or list
+        Only select jobs on these partitions.
+    """
+    def __init__( self, query = None, mine : bool = True, states = None, partition = None ):
+        self.flags = {}
+        """The squeue flags and their values"""
+        if mine:
+            self.flags["--user"] = [ runner.user() ]
+        if states:
+            self.flags["--states"] = split_values( states )
+        if partition:
+            self.flags["--partition"] = split_values( partition )
+
+        self.residual = None
+        """The conditions (or regex pattern) that are evaluated in Python (None if there are none)"""
+        if query is not None:
+            query = compile_query( query )
+            pushed = []
+            if query.pattern is None:
+                for condition in query.conditions:
+                    flag = _flags.get( condition.field )
+                    if condition.op == "=" and flag is not None and flag not in self.flags:
+                        self.flags[ flag ] = sorted( str(i) for i in condition.value )
+                        pushed.append( condition )
+            self.residual = query.without( pushed )
+
+    def squeue_args( self, all_states : bool = True ) -> list:
+        """
+        Get the squeue arguments of the selection.
+
+        Parameters
+        ----------
+        all_states : bool
+            Include the jobs in all states (that the controller still knows) unless states
+            are selected. Otherwise squeue only lists the pending and running jobs.
+        """
+        args = [ f"{flag}={','.join( values )}" for flag, values in self.flags.items() ]
+        if all_states and "--states" not in self.flags:
+            args.append( "--states=all" )
+        return args
+
+    def jobids( self, all_states : bool = True ) -> list:
+        """
+        Get the ids of the jobs selected by the squeue filters (the residual query is not applied).
+
+        Parameters
+        ----------
+        all_states : bool
+            Include the jobs in all states (see `squeue_args`).
+        """
+        argv = [ "squeue", "--noheader", "--format=%A", *self.squeue_args( all_states ) ]
+        return cache.cached( argv, lambda: runner.output( argv ) ).split()
+
+    def records( self ) -> list:
+        """
+        Get the raw scontrol records of the selected jobs.
+        """
+        from .info import split_records
+        if not self.flags:
+            records = split_records( _dump() )
+        else:
+            jobids = self.jobids()
+            if not jobids:
+                return []
+            records = select_records( split_records( _jobs( jobids ) ), jobids )
+
+        if self.residual is not None:
+            records = self.residual.filter_records( records )
+        return records
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}(squeue {' '.join( self.squeue_args() )}, residual={self.residual})"
+
+def split_values( values ) -> list:
+    """
+    Get a list of comma separated values (or a list of values).
+    """
+    if isinstance( values, str ):
+        values = values.split( "," )
+    return [ str(i) for i in values ]
+
+def select_records( records : list, jobids : list ) -> list:
+    """
+    Get the records of the selected jobs (each only once).
+
+    Note
+    ----
+    The output of an array job includes all of its tasks, which may not all be selected,
+    and which appear again in the output of another batch if their ids were selected as well.
+    """
+    selected = set( jobids )
+    unique = {}
+    for record in records:
+        jobid = record[ len("JobId=") : ].split( maxsplit = 1 )[0]
+        if jobid in selected:
+            unique.setdefault( jobid, record )
+    return list( unique.values() )
+
+def _dump() -> str:
+    """
+    Get the job dump of the whole cluster.
+    """
+    argv = [ "scontrol", "show", "job", "-dd" ]
+    return cache.cached( argv, lambda: runner.output( argv ) )
+
+def scontrol_batches( jobids : list ) -> list:
+    """
+    Get the scontrol commands that fetch the records of several jobs (one per batch of `_batch` job-ids).
+    """
+    return [ [ "scontrol", "show", "job", "-dd", ",".join( str(i) for i in jobids[ start : start + _batch ] ) ] for start in range( 0, len(jobids), _batch ) ]
+
+def _jobs( jobids : list ) -> str:
+    """
+    Get the scontrol output of several jobs.
+    """
+    return "\n".join( cache.cached( argv, lambda: runner.output( argv ) ) for argv in scontrol_batches( jobids ) )
@@ -0,0 +1,354 @@
+"""
+A small query language to select jobs by any of their fields.
+
+A query consists of whitespace separated conditions `field OP value` that must all hold, e.g.
+
+    state=PENDING partition=long name~^sweep_ runtime>2h
+
+The operators are `=` (equal, or equal to one of several comma separated values), `!=`,
+`~` (regex search), `!~`, `>`, `>=`, `<`, and `<=`. The fields are the keys of the scontrol
+records (e.g. `JobState`) or one of their short aliases (`id`, `name`, `user`, `state`, `reason`,
+`partition`, `runtime`, `limit`, `submit`, `start`, `end`, `nodes`, `cores`, `memory`, `exit`, ...).
+Durations are compared as durations (`2h`, `30m`, `1d`, `90s`, or SLURM's `D-HH:MM:SS`),
+timestamps as timestamps (`end<2024-01-31T12:00` or `submit>now-2h`), and integer fields numerically.
+States can be given by their squeue codes (`state=PD,R`) or in lower case, and jobs pending on
+several partitions match each of them. Values containing spaces can be quoted.
+
+A pattern that is not a query (e.g. `^sweep_`) is matched as a regex against the job ids and names.
+
+Queries are compiled once and can be evaluated on the raw scontrol records (only the
+queried fields are extracted, and exact matches are first looked up in the raw text),
+on parsed fields, or on a columnar `Queue` snapshot.
+"""
+
+import re
+import shlex
+from datetime import datetime, timedelta
+
+from .info import _field_key, _int_fields, convert_value
+from .timeparse import duration_seconds, span_seconds
+
+_aliases = {
+                "id" : "JobId", "jobid" : "JobId", "name" : "JobName", "user" : "UserId", "account" : "Account",
+                "state" : "JobState", "reason" : "Reason", "partition" : "Partition", "runtime" : "RunTime",
+                "time" : "RunTime", "limit" : "TimeLimit", "submit" : "SubmitTime", "start" : "StartTime",
+                "end" : "EndTime", "nodes" : "NodeList", "numnodes" : "NumNodes", "cores" : "NumCPUs",
+                "cpus" : "NumCPUs", "memory" : "Mem", "exit" : "ExitCode", "exit_code" : "ExitCode",
+                "workdir" : "WorkDir", "command" : "Command", "stdout" : "StdOut", "stderr" : "StdErr",
+                "array" : "ArrayJobId", "task" : "ArrayTaskId", "qos" : "QOS", "priority" : "Priority",
+            }
+"""Short aliases of the scontrol keys"""
+
+_durations = { "RunTime", "TimeLimit", "TimeMin" }
+"""Fields that are compared as durations"""
+
+_timestamps = { "SubmitTime", "EligibleTime", "AccrueTime", "StartTime", "EndTime", "Deadline", "SuspendTime", "LastSchedEval" }
+"""Fields that are compared as timestamps"""
+
+_queue_columns = {
+                    "JobId" : "ids", "JobName" : "names", "UserId" : "users",
+                    "JobState" : "states", "Partition" : "partitions", "RunTime" : "times",
+                    "TimeLimit" : "time_limits", "NumNodes" : "nodes",
+                }
+"""The columns of a `Queue` snapshot that correspond to scontrol keys"""
+
+_state_codes = {
+                    "PD" : "PENDING", "R" : "RUNNING", "CG" : "COMPLETING", "CD" : "COMPLETED", "CA" : "CANCELLED",
+                    "F" : "FAILED", "TO" : "TIMEOUT", "NF" : "NODE_FAIL", "PR" : "PREEMPTED", "S" : "SUSPENDED",
+                    "ST" : "STOPPED", "OOM" : "OUT_OF_MEMORY", "BF" : "BOOT_FAIL", "DL" : "DEADLINE", "CF" : "CONFIGURING",
+                    "RQ" : "REQUEUED", "RH" : "REQUEUE_HOLD", "RF" : "REQUEUE_FED", "RS" : "RESIZING", "RV" : "REVOKED",
+                    "RD" : "RESV_DEL_HOLD", "SE" : "SPECIAL_EXIT", "SI" : "SIGNALING", "SO" : "STAGE_OUT",
+                }
+"""The short job state codes of squeue and their full names"""
+
+_condition = re.compile( "^([A-Za-z][A-Za-z0-9_/:]*)(!=|!~|>=|<=|=|~|>|<)(.*)$", re.DOTALL )
+"""Matches a single condition of a query"""
+
+def state_name( state : str ) -> str:
+    """
+    Get the full name of a job state given in any of the forms squeue accepts (e.g. `R`, `running`, or `RUNNING`).
+    """
+    state = state.strip().upper()
+    return _state_codes.get( state, state )
+
+class Condition:
+    """
+    A single condition `field OP value` of a query.
+
+    Parameters
+    ----------
+    field : str
+        The field (a scontrol key or one of its aliases).
+    op : str
+        The operator.
+    value : str
+        The value to compare with.
+    """
+    def __init__( self, field : str, op : str, value : str ):
+        self.field = _aliases.get( field.lower(), field )
+        self.op = op
+        self.raw = value
+
+        if self.field in _durations:
+            self.kind = "duration"
+        elif self.field in _timestamps:
+            self.kind = "timestamp"
+        elif self.field in _int_fields or self.field == "ExitCode":
+            self.kind = "int"
+        else:
+            self.kind = "str"
+
+        # the exact-match fast path: the record must contain one of the `Key=value` strings
+        self.needles = None
+        if op in ( "~", "!~" ):
+            self.value = re.compile( value )
+        elif op in ( "=", "!=" ):
+            self.value = { self._convert( i ) for i in value.split( "," ) }
+            # pending jobs may list several partitions (e.g. `Partition=long,short`), so there is no fast path for them
+            if op == "=" and self.kind == "str" and self.field != "Partition":
+                self.needles = tuple( f"{self.field}={i}" for i in self.value )
+        else:
+            self.value = self._convert( value )
+
+    def test( self, value ) -> bool:
+        """
+        Check the condition for the (converted) value of a job's field (None if the job does not have the field).
+        """
+        if self.op == "~":
+            return value is not None and self.value.search( str( value ) ) is not None
+        if self.op == "!~":
+            return value is None or self.value.search( str( value ) ) is None
+        value = self._normalize( value )
+        if self.op in ( "=", "!=" ):
+            if self.field == "Partition" and value is not None:
+                found = not self.value.isdisjoint( value.split( "," ) )
+            else:
+                found = value in self.value
+            return found if self.op == "=" else not found
+        if value is None:
+            return False
+        if self.op == ">":
+            return value > self.value
+        if self.op == ">=":
+            return value >= self.value
+        if self.op == "<":
+            return value < self.value
+        return value <= self.value
+
+    def extract( self, record : str ):
+        """
+        Extract the (converted) value of the field from a raw scontrol record (None if it is missing).
+        """
+        return extract( record, self.field )
+
+    def _convert( self, value : str ):
+        """
+        Convert a value of the query into the type of the field.
+        """
+        if self.kind == "duration":
+            seconds = span_seconds( value )
+            if seconds is None:
+                raise ValueError( f"Invalid duration '{value}' for field {self.field}" )
+            return seconds
+        if self.kind == "timestamp":
+            relative = re.fullmatch( "now(?:-([0-9.]+[smhd]))?", value.strip() )
+            if relative:
+                offset = span_seconds( relative.group(1) ) if relative.group(1) else 0
+                return ( datetime.now() - timedelta( seconds = offset ) ).isoformat( timespec = "seconds" )
+            return value
+        if self.kind == "int":
+            try:
+                return int( value )
+            except ValueError:
+                raise ValueError( f"Invalid number '{value}' for field {self.field}" )
+        if self.field == "JobState":
+            return state_name( value )
+        return value
+
+    def _normalize( self, value ):
+        """
+        Bring a (converted) field value of a job into the comparable type.
+        """
+        if value is None:
+            return None
+        if self.kind == "duration":
+            # records hold duration strings, queue snapshots seconds (-1 for undefined durations)
+            if isinstance( value, str ):
+                value = duration_seconds( value )
+            return value if value is not None and value >= 0 else None
+        if self.kind == "timestamp":
+            # ISO timestamps compare correctly as strings
+            return value if value[:1].isdigit() else None
+        if self.kind == "int":
+            # values that are not numbers (e.g. a range of nodes `1-2`) match no comparison
+            try:
+                return int( value )
+            except ( TypeError, ValueError ):
+                return None
+        if self.field == "UserId":
+            # scontrol records hold `name(uid)`, sacct records and queue snapshots only the name
+            return value.split( "(" )[0]
+        return value
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}({self.field}{self.op}{self.raw})"
+
+class Query:
+    """
+    A compiled job query.
+
+    Parameters
+    ----------
+    query : str
+        The query (see the module documentation), or a regex pattern
+        to match against the job ids and names.
+    """
+    def __init__( self, query : str ):
+        self.query = query
+        self.conditions = []
+        self.pattern = None
+        try:
+            terms = shlex.split( query )
+        except ValueError:
+            terms = None
+        matches = [ _condition.match( i ) for i in terms ] if terms else None
+        if matches and all( matches ):
+            self.conditions = [ Condition( *m.groups() ) for m in matches ]
+            # the cheap exact matches are checked first
+            self.conditions.sort( key = lambda c: c.needles is None )
+        else:
+            self.pattern = re.compile( query )
+
+    def match_record( self, record : str ) -> bool:
+        """
+        Check if a raw scontrol job record matches the query.
+        """
+        if self.pattern is not None:
+            return self._match_pattern( record.split( maxsplit = 1 )[0][ len("JobId=") : ], extract( record, "JobName" ) )
+        for condition in self.conditions:
+            if condition.needles is not None and not any( needle in record for needle in condition.needles ):
+                return False
+            if not condition.test( condition.extract( record ) ):
+                return False
+        return True
+
+    def match_fields( self, fields : dict ) -> bool:
+        """
+        Check if the parsed fields of a job (see `parse_record`) match the query.
+        """
+        if self.pattern is not None:
+            return self._match_pattern( fields.get( "JobId" ), fields.get( "JobName" ) )
+        return all( condition.test( fields.get( condition.field ) ) for condition in self.conditions )
+
+    def filter_records( self, records : list ) -> list:
+        """
+        Get the raw scontrol job records matching the query.
+        """
+        return [ record for record in records if self.match_record( record ) ]
+
+    def filter_queue( self, queue ) -> "Queue":
+        """
+        Get the jobs of a `Queue` snapshot matching the query.
+
+        Raises
+        ------
+        ValueError
+            If the query uses fields that are not part of the queue snapshot.
+        """
+        if self.pattern is not None:
+            indices = [ i for i, ( jobid, name ) in enumerate( zip( queue.ids, queue.names ) ) if self._match_pattern( jobid, name ) ]
+            return queue._take( indices )
+
+        indices = range( len(queue) )
+        for condition in self.conditions:
+            column = _queue_columns.get( condition.field )
+            if column is None:
+                raise ValueError( f"The queue has no field {condition.field}. Use one of: {sorted( _queue_columns )}" )
+            values = queue.column( column )
+            if condition.op == "=" and condition.kind != "duration" and condition.field != "Partition":
+                # exact matches are simple set lookups
+                indices = [ i for i in indices if values[i] in condition.value ]
+            else:
+                indices = [ i for i in indices if condition.test( values[i] ) ]
+        return queue._take( indices )
+
+    def without( self, conditions : list ) -> "Query":
+        """
+        Get the query of the remaining conditions (e.g. those that could not be evaluated by SLURM itself).
+
+        Parameters
+        ----------
+        conditions : list
+            The conditions to remove.
+
+        Returns
+        -------
+        query : Query or None
+            The query of the remaining conditions, or None if no conditions remain.
+        """
+        if self.pattern is not None:
+            return self
+        remaining = [ i for i in self.conditions if i not in conditions ]
+        if not remaining:
+            return None
+        query = Query.__new__( Query )
+        query.query = " ".join( f"{i.field}{i.op}{shlex.quote( i.raw )}" for i in remaining )
+        query.conditions = remaining
+        query.pattern = None
+        return query
+
+    def _match_pattern( self, jobid, name ) -> bool:
+        """
+        Match the regex pattern against a job's id and name.
+        """
+        return self.pattern.search( str( jobid ) ) is not None or ( name is not None and self.pattern.search( name ) is not None )
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}({self.query!r})"
+
+_keys = {}
+"""The compiled patterns of the keys extracted from raw records"""
+
+def extract( record : str, field : str ):
+    """
+    Extract the (converted) value of a single field from a raw scontrol record
+    without parsing the whole record.
+
+    Parameters
+    ----------
+    record : str
+        The raw job record.
+    field : str
+        The key of the field (e.g. `JobState`).
+
+    Returns
+    -------
+    value : str or int or None
+        The converted value (see `parse_record`) or None if the record does not have the field.
+    """
+    key = _keys.get( field )
+    if key is None:
+        key = _keys[ field ] = re.compile( f"(?:^|(?<=\\s)){re.escape( field )}=" )
+    key = key.search( record )
+    if key is None:
+        return None
+    end = _field_key.search( record, key.end() )
+    return convert_value( field, record[ key.end() : end.start() if end else len(record) ] )
+
+def compile_query( query ) -> Query:
+    """
+    Compile a query (see the module documentation).
+
+    Parameters
+    ----------
+    query : str or Query
+        The query (or an already compiled query).
+
+    Returns
+    -------
+    query : Query
+        The compiled query.
+    """
+    if isinstance( query, Query ):
+        return query
+    return Query( query )
@@ -4,15 +4,63 @@ Show the job queue
 
 import curses
 import os
-import subprocess
 import time
+from array import array
+from collections import namedtuple
 from datetime import datetime 
 from pytermwindows import ScrollWindow
 import slurmtools.func_api.info as info
+from . import cache, runner
+from .poll import AdaptivePoll
+from .pushdown import Selection
+from .query import compile_query
+from .timeparse import duration_seconds, format_duration
 
 # from termcolor import colored
 
-def queue( all : bool = False ) -> str:
+_squeue_format = "%A|%i|%P|%u|%T|%M|%l|%D|%R|%j"
+"""The machine-parsable squeue output format (the job name is last since it may contain the delimiter)"""
+
+_squeue_columns = ( "ids", "labels", "partitions", "users", "states", "times", "time_limits", "nodes", "reasons", "names" )
+"""The Queue columns corresponding to the squeue output format"""
+
+QueueRow = namedtuple( "QueueRow", ( "id", "label", "partition", "user", "state", "time", "time_limit", "nodes", "reason", "name" ) )
+"""A single job in the queue"""
+
+def snapshot( all : bool = False, states = None, partition = None, query = None ) -> "Queue":
+    """
+    Get a snapshot of the job queue.
+
+    Note
+    ----
+    The user, state, and partition filters and the exact conditions of the query
+    are evaluated by squeue (see `slurmtools.func_api.pushdown`), only the remaining 
+    conditions of the query are evaluated on the snapshot.
+
+    Parameters
+    ----------
+    all : bool
+        Include all jobs. By default only the user's jobs are included.
+    states : str or list
+        Only include jobs in these states. By default the pending and running jobs are included.
+    partition : str or list
+        Only include jobs on these partitions.
+    query : str or Query
+        Only include jobs matching a query (see `Queue.select`).
+    
+    Returns
+    -------
+    queue : Queue
+        The job queue.
+    """
+    selection = Selection( query, mine = not all, states = states, partition = partition )
+    argv = [ "squeue", "--noheader", f"--format={_squeue_format}", *selection.squeue_args( all_states = False ) ]
+    queue = Queue.from_squeue( cache.cached( argv, lambda: runner.output( argv ) ) )
+    if selection.residual is not None:
+        queue = selection.residual.filter_queue( queue )
+    return queue
+
+def queue( all : bool = False, states = None, partition = None, query = None ) -> str:
     """
     Show the job queue
     
@@ -20,74 +68,381 @@ def queue( all : bool = False ) -> str:
     ----------
     all : bool
         Show all jobs. By default only the user's jobs are shown.
+    states : str or list
+        Only show jobs in these states.
+    partition : str or list
+        Only show jobs on these partitions.
+    query : str or Query
+        Only show jobs matching a query.
     
     Returns
     -------
     queue : str
         The job queue as a string.
     """
-    cmd = "squeue"
-    if not all: 
-        cmd += " -A $USER"
-    queue = subprocess.run( cmd, shell = True, capture_output = True )
-    queue = queue.stdout.decode("utf-8")
-    return queue
+    return snapshot( all = all, states = states, partition = partition, query = query ).format()
+
+class Queue:
+    """
+    A snapshot of the SLURM job queue stored column-wise.
+
+    Numeric columns (`ids`, `times`, `time_limits`, `nodes`) are stored as compact 
+    integer arrays (times in seconds, -1 for undefined times), string columns as lists
+    (with repeated values such as states or partitions sharing the same string object).
+
+    Parameters
+    ----------
+    columns : dict
+        The columns of the queue. This must contain all of 
+        `ids`, `labels`, `partitions`, `users`, `states`, `times`, 
+        `time_limits`, `nodes`, `reasons`, and `names`.
+    """
+    __header__ = ( "JobID", "Partition", "JobName", "User", "Status", "Time", "Nodes", "Nodelist(Reason)" )
+
+    def __init__( self, columns : dict = None ):
+        columns = columns or {}
+        self.ids = array( "q", columns.get( "ids", () ) )
+        self.labels = list( columns.get( "labels", () ) )
+        self.partitions = list( columns.get( "partitions", () ) )
+        self.users = list( columns.get( "users", () ) )
+        self.states = list( columns.get( "states", () ) )
+        self.times = array( "q", columns.get( "times", () ) )
+        self.time_limits = array( "q", columns.get( "time_limits", () ) )
+        self.nodes = array( "q", columns.get( "nodes", () ) )
+        self.reasons = list( columns.get( "reasons", () ) )
+        self.names = list( columns.get( "names", () ) )
+
+    @classmethod
+    def from_squeue( cls, text : str ) -> "Queue":
+        """
+        Parse the output of `squeue --noheader --format=...` (using the `_squeue_format`).
+
+        Parameters
+        ----------
+        text : str
+            The raw squeue output.
+        
+        Returns
+        -------
+        queue : Queue
+            The parsed queue.
+        """
+        lines = [ line for line in text.splitlines() if line ]
+        if not lines:
+            return cls()
+
+        # fast path: split the whole text at once and slice out the columns,
+        # this only works if no job name contains the delimiter itself
+        values = "|".join( lines ).split( "|" )
+        n = len( _squeue_columns )
+        if len( values ) == n * len( lines ):
+            columns = [ values[ i::n ] for i in range( n ) ]
+        else:
+            rows = [ line.split( "|", n - 1 ) for line in lines ]
+            rows = [ row for row in rows if len(row) == n ]
+            if not rows:
+                return cls()
+            columns = list( zip( *rows ) )
+
+        ids, labels, partitions, users, states, times, limits, nodes, reasons, names = columns
+
+        # repeated values are parsed (and stored) only once
+        def intern( values ):
+            shared = { i : i for i in set( values ) }
+            return list( map( shared.__getitem__, values ) )
+        def seconds( values ):
+            durations = { i : duration_seconds( i ) for i in set( values ) }
+            durations = { i : -1 if value is None else value for i, value in durations.items() }
+            return map( durations.__getitem__, values )
+
+        columns = {
+            "ids" : map( int, ids ),
+            "labels" : labels,
+            "partitions" : intern( partitions ),
+            "users" : intern( users ),
+            "states" : intern( states ),
+            "times" : seconds( times ),
+            "time_limits" : seconds( limits ),
+            "nodes" : map( int, nodes ),
+            "reasons" : intern( reasons ),
+            "names" : names,
+        }
+        return cls( columns )
+
+    def column( self, name : str ):
+        """
+        Get a column by name (any of the `_squeue_columns`).
+        """
+        if name not in _squeue_columns:
+            raise KeyError( f"Unknown column '{name}'. Use one of: {_squeue_columns}" )
+        return getattr( self, name )
+
+    def filter( self, predicate = None, **criteria ) -> "Queue":
+        """
+        Get the jobs matching all given criteria.
+
+        Parameters
+        ----------
+        predicate : callable
+            A function that receives a `QueueRow` and returns True for jobs to keep.
+        **criteria
+            Column names (e.g. `states` or `partitions`) and either a single 
+            value or a collection of values to keep.
+
+        Returns
+        -------
+        queue : Queue
+            A new queue with the matching jobs.
+        """
+        indices = range( len(self) )
+        for name, value in criteria.items():
+            column = self.column( name )
+            if isinstance( value, ( list, tuple, set, frozenset ) ):
+                value = set( value )
+                indices = [ i for i in indices if column[i] in value ]
+            else:
+                indices = [ i for i in indices if column[i] == value ]
+        if predicate is not None:
+            indices = [ i for i in indices if predicate( self[i] ) ]
+        return self._take( indices )
+
+    def select( self, query ) -> "Queue":
+        """
+        Get the jobs matching a query.
+
+        Parameters
+        ----------
+        query : str or Query
+            The query (e.g. `state=PENDING partition=long runtime>2h`, see `slurmtools.func_api.query`).
+            Only the fields of the queue snapshot can be queried.
+
+        Returns
+        -------
+        queue : Queue
+            A new queue with the matching jobs.
+        """
+        return compile_query( query ).filter_queue( self )
+
+    def sort( self, by : str = "ids", reverse : bool = False ) -> "Queue":
+        """
+        Sort the jobs by a column.
+
+        Parameters
+        ----------
+        by : str
+            The column to sort by.
+        reverse : bool
+            Sort in descending order.
+
+        Returns
+        -------
+        queue : Queue
+            A new sorted queue.
+        """
+        column = self.column( by )
+        indices = sorted( range( len(self) ), key = column.__getitem__, reverse = reverse )
+        return self._take( indices )
+
+    def group( self, by : str = "states" ) -> dict:
+        """
+        Group the jobs by the values of a column.
+
+        Parameters
+        ----------
+        by : str
+            The column to group by.
+
+        Returns
+        -------
+        groups : dict
+            A dictionary of column values and `Queue`s with the corresponding jobs.
+        """
+        groups = {}
+        for idx, value in enumerate( self.column( by ) ):
+            groups.setdefault( value, [] ).append( idx )
+        return { value : self._take( indices ) for value, indices in groups.items() }
+
+    def lines( self ) -> list:
+        """
+        Get the formatted lines of the jobs (aligned with the `header`).
+        """
+        return self._format()[1]
+
+    @property
+    def header( self ) -> str:
+        """
+        Get the formatted header line (aligned with the `lines`).
+        """
+        return self._format()[0]
+
+    def format( self ) -> str:
+        """
+        Format the queue as a table including a header.
+        """
+        header, lines = self._format()
+        return "\n".join( [ header, *lines ] )
+
+    def _format( self ) -> tuple:
+        """
+        Format the header and job lines.
+        """
+        durations = { i : format_duration( i ) for i in set( self.times ) }
+        columns = [ 
+                    self.labels, self.partitions, self.names, self.users, self.states, 
+                    list( map( durations.__getitem__, self.times ) ), 
+                    list( map( str, self.nodes ) ), 
+                    self.reasons,
+                ]
+        widths = [ max( len(title), max( map( len, column ), default = 0 ) ) for title, column in zip( self.__header__, columns ) ]
+        widths[-1] = 0
+        header = " ".join( title.ljust( width ) for title, width in zip( self.__header__, widths ) ).rstrip()
+        lines = [ " ".join( value.ljust( width ) for value, width in zip( row, widths ) ).rstrip() for row in zip( *columns ) ]
+        return header, lines
+
+    def _take( self, indices ) -> "Queue":
+        """
+        Get a new queue with the jobs at the given indices.
+        """
+        return Queue( { name : [ getattr( self, name )[i] for i in indices ] for name in _squeue_columns } )
+
+    def __len__( self ) -> int:
+        return len( self.ids )
+
+    def __getitem__( self, idx : int ) -> QueueRow:
+        return QueueRow( *( getattr( self, name )[idx] for name in _squeue_columns ) )
+
+    def __iter__( self ):
+        return ( QueueRow( *row ) for row in zip( *( getattr( self, name ) for name in _squeue_columns ) ) )
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}(jobs={len(self)})"
+    
+    def __str__( self ) -> str:
+        return self.format()
 
 class SlurmQueueViewer( ScrollWindow ):
     """
     This class creates a self-renewing window that displays the Slurm Queue in a scrollable field.
 
+    Only the rows that changed since the previous frame are redrawn, and jobs 
+    that changed their state are highlighted for a few seconds.
+
     Parameters
     ----------
     all : bool
         Show all jobs. By default only the user's jobs are shown.
     refresh_rate : int
-        The refresh rate in seconds.
+        The refresh rate of the window in milliseconds.
+    highlight : float
+        The number of seconds for which jobs that changed their state are highlighted.
+    min_interval : float
+        The minimal number of seconds between two queue updates.
+    max_interval : float
+        The maximal number of seconds between two queue updates.
+        While the queue does not change, the interval grows up to this value.
+    states : str or list
+        Only show jobs in these states.
+    partition : str or list
+        Only show jobs on these partitions.
     """
-    __queue_header__ = "JobID   Partition  JobName     User Status   Time    Nodes Nodelist(Reason)"
-    def __init__( self, all : bool = False, refresh_rate : int = 1 ):
+    def __init__( self, all : bool = False, refresh_rate : int = 1, highlight : float = 10, min_interval : float = 1, max_interval : float = 60, states = None, partition = None ):
         super().__init__( name = "Slurm Queue", height = 30, width = 100, start_line = 4, refresh = refresh_rate, use_color = True )
         self.all = all
+        self.states = states
+        self.partition = partition
+        self.highlight = highlight
+        self.poll = AdaptivePoll( minimum = min_interval, maximum = max_interval )
+        self._marker = cache.marker()
+        self._next_check = 0
+        self._last_change = cache.last_change( self._marker )
+        self.__queue_header__ = ""
+
+        # the previous frame (job-id -> (line, state)) and the rows currently drawn on screen 
+        self._rows = {}
+        self._drawn = {}
+        self._highlighted = {}
+        self._header_drawn = None
+        self._timed_out = False
+
+        self.frame_time = 0.0
+        """The render time of the last frame in milliseconds"""
+        self.changes = { "inserted" : 0, "removed" : 0, "changed" : 0 }
+        """The number of rows inserted, removed, and changed with the last queue update"""
+
         self.queue = self._read_queue()
        
     def _read_queue( self ) -> list:
         """
         Read the queue and return a list of all jobs.
         """
-        self.queue = queue( all = self.all )
-        self.queue = [ i.strip() for i in self.queue.split("\n")[1:] if i != "" ]
+        self.snapshot = snapshot( all = self.all, states = self.states, partition = self.partition )
+        self.__queue_header__ = self.snapshot.header
+        self.queue = self.snapshot.lines()
+        self._diff_rows()
         return self.queue
 
-    def _queue_header( self ) -> str:
+    def _diff_rows( self ):
         """
-        Make the header of the queue.
+        Compare the new queue with the previous frame (keyed by job-id) 
+        and mark the jobs that changed their state for highlighting.
         """
+        rows = { label : ( line, state ) for label, line, state in zip( self.snapshot.labels, self.queue, self.snapshot.states ) }
+        inserted = rows.keys() - self._rows.keys()
+        removed = self._rows.keys() - rows.keys()
+        changed = [ label for label in rows.keys() & self._rows.keys() if rows[label] != self._rows[label] ]
 
-        user = f"{ os.environ.get('USER') }'s" if not self.all else "The whole"
-        total = len( user )
-        user = self.colored( user, "green" )
-        self.write( 1, 0, user )
+        until = time.monotonic() + self.highlight
+        for label in changed:
+            if rows[label][1] != self._rows[label][1]:
+                self._highlighted[ label ] = until
+        for label in removed:
+            self._highlighted.pop( label, None )
 
-        mid = " queue at "
-        self.write( 1, total, mid )
-        total += len(mid)
+        self.changes = { "inserted" : len(inserted), "removed" : len(removed), "changed" : len(changed) }
+        self._rows = rows
 
-        timestamp = str( datetime.now().strftime( "%H:%M:%S") )
-        timestamp = self.colored( timestamp, "cyan" )
-        self.write( 1, total, timestamp )
-        total += len(timestamp[0])
+        # poll quickly while the queue changes and back off while it does not
+        self.poll.polled( changed = any( self.changes.values() ) )
 
-        instructions = f"  |  press q to quit, r to refresh"
-        self.write( 1, total, instructions )
+    def adjust_size( self ):
+        """
+        Resizes the window to terminal size (this clears the screen so everything is redrawn).
+        """
+        super().adjust_size()
+        self._drawn = {}
+        self._header_drawn = None
 
-        total += len( instructions )
-        total = max( total, len(self.__queue_header__) )
+    def _queue_header( self ) -> str:
+        """
+        Make the header of the queue.
+        """
 
-        blankline = "-" * total
-        self.write( 0,0, blankline )
-        self.write( 2, 0, blankline )
-        self.write( 3, 0, self.__queue_header__ )
-        self.write( 4, 0, blankline )
+        user = f"{ runner.user() }'s" if not self.all else "The whole"
+        mid = " queue at "
+        timestamp = str( datetime.now().strftime( "%H:%M:%S") )
+        instructions = f"  |  press q to quit, r to refresh"
+        stats = f"  |  next update in {self.poll.remaining:.0f}s  |  {self.frame_time:.1f} ms"
+        if self._timed_out:
+            stats += "  |  SLURM did not respond"
+
+        # the static parts only need to be redrawn if they changed
+        static = ( user, self.__queue_header__ )
+        if self._header_drawn != static:
+            total = len(user) + len(mid) + len(timestamp) + len(instructions) + len(stats) + 10
+            total = max( total, len(self.__queue_header__) )
+            blankline = "-" * total
+            self.write( 0, 0, blankline, clear = True )
+            self.write( 1, 0, self.colored( user, "green" ), clear = True )
+            self.write( 1, len(user), mid )
+            self.write( 2, 0, blankline, clear = True )
+            self.write( 3, 0, self.__queue_header__, clear = True )
+            self.write( 4, 0, blankline, clear = True )
+            self._header_drawn = static
+
+        total = len(user) + len(mid)
+        self.write( 1, total, self.colored( timestamp, "cyan" ) )
+        total += len(timestamp)
+        self.write( 1, total, instructions + stats + " " * 4 )
 
     # def _add_time_bar( self, line ):
     #     """
@@ -111,33 +466,70 @@ class SlurmQueueViewer( ScrollWindow ):
         """
         The window contents to show the queue
         """
+        start = time.perf_counter()
+
+        # poll again soon after jobs were submitted or killed via slurmtools
+        # (the marker is checked once per minimal poll interval rather than on every tick)
+        if start >= self._next_check:
+            self._next_check = start + self.poll.minimum
+            last_change = cache.last_change( self._marker )
+            if last_change != self._last_change:
+                self._last_change = last_change
+                self.poll.reset()
+
+        if self.keystring == "r" or self.poll.due():
+            if self.keystring == "r":
+                self.poll.reset()
+            try:
+                self.queue = self._read_queue()
+                self._timed_out = False
+            except TimeoutError:
+                # keep showing the last snapshot while the controller does not respond
+                self._timed_out = True
+                self.poll.polled( changed = False )
 
         self._queue_header()
 
-        if self.can_update() or self.keystring == "r":
-            self.queue = self._read_queue()
-        
-        self.to_first_line
+        # only redraw the rows that differ from what is currently on screen
+        now = time.monotonic()
         if len(self.queue) == 0:
-            self.write( self.to_next_line, 0, "No jobs in queue", clear = True )
+            rows = [ ( None, "No jobs in queue", False ) ]
         else:
-            queue = self.crop_data_to_scroll_range( self.queue )
-            for line in queue:
-                self.write( self.to_next_line, 0, line )
-
-        # now clear all remaining lines 
-        self.clear_line( range( self.next_line, self.bottom_line ) ) 
+            labels = self.crop_data_to_scroll_range( self.snapshot.labels )
+            lines = self.crop_data_to_scroll_range( self.queue )
+            rows = [ ( label, line, self._highlighted.get( label, 0 ) > now ) for label, line in zip( labels, lines ) ]
+
+        drawn = {}
+        for idx, row in enumerate( rows ):
+            screen_line = self.first_line + 1 + idx
+            if screen_line >= self.bottom_line:
+                break
+            if self._drawn.get( screen_line ) != row:
+                label, line, highlighted = row
+                self.write( screen_line, 0, self.colored( line, "yellow" ) if highlighted else line, clear = True )
+            drawn[ screen_line ] = row
+
+        # clear the lines that are no longer used
+        stale = [ i for i in self._drawn if i not in drawn ]
+        if stale:
+            self.clear_line( stale )
+        self._drawn = drawn
+        self._highlighted = { label : until for label, until in self._highlighted.items() if until > now }
             
         self.auto_scroll( restrict = len(self.queue)-1 )
         self.quit_on( keystring = "q" )
 
         self.update_counter()
         self.refresh()
+        self.frame_time = ( time.perf_counter() - start ) * 1000
 
 
-def view_queue( all : bool = False, n : int = 20, refresh : int = 1 ):
+def view_queue( all : bool = False, n : int = 20, refresh : int = 1, max_refresh : int = 60, states = None, partition = None ):
     """
     View the queue.
+
+    The queue is updated quickly while it changes (and right after jobs were submitted
+    or killed via slurmtools) and less and less frequently while it does not change.
     
     Parameters
     ----------
@@ -146,10 +538,15 @@ def view_queue( all : bool = False, n : int = 20, refresh : int = 1 ):
     n : int
         The number of jobs to show. By default 20 jobs are shown at a time.
     refresh : int
-        The refresh rate in seconds.
+        The minimal number of seconds between two queue updates.
+    max_refresh : int
+        The maximal number of seconds between two queue updates.
+    states : str or list
+        Only show jobs in these states.
+    partition : str or list
+        Only show jobs on these partitions.
     """
-    queue_viewer = SlurmQueueViewer( all = all, refresh_rate = 5 )
-    queue_viewer.set_update_interval( 0.1 * refresh )
+    queue_viewer = SlurmQueueViewer( all = all, refresh_rate = 5, min_interval = refresh, max_interval = max_refresh, states = states, partition = partition )
     queue_viewer.set_scroll_range( n )
     queue_viewer.run()
 
@@ -1,54 +1,295 @@
 """
 Functions to read the stdout or stderr of a job.
+
+The outputs are read in chunks so that memory use stays bounded no matter
+how large the log files are. Windows of the outputs (the first or last lines or bytes,
+or a range of them) are read without loading the rest of the file, and the
+outputs of running jobs can be followed as they are written.
 """
 
+import codecs
 import os
+import time
 from .info import SlurmJob
 
-def read_stdout( jobid : int ) -> str:
+chunk_size = 1 << 16
+"""The number of bytes read at once"""
+
+def iter_stdout( jobid : int, head : int = None, tail : int = None, window : tuple = None, unit : str = "lines", follow : bool = False, interval : float = 1 ):
+    """
+    Iterate over the stdout of a job in chunks.
+
+    Parameters
+    ----------
+    jobid : int
+        The job-id whose stdout to read.
+    head : int
+        Only read the first n lines (or bytes).
+    tail : int
+        Only read the last n lines (or bytes).
+    window : tuple
+        Only read a (start, end) range of lines (or bytes).
+        Either may be None to read from the beginning or to the end.
+    unit : str
+        The unit of `head`, `tail`, and `window`. Either "lines" or "bytes".
+    follow : bool
+        Keep reading newly written output while the job is running.
+    interval : float
+        The number of seconds to wait between checks for new output when following.
+
+    Yields
+    ------
+    chunk : str
+        The next chunk of the stdout.
+    """
+    job = SlurmJob( jobid )
+    yield from _iter_job_output( job, "stdout", head, tail, window, unit, follow, interval )
+
+def iter_stderr( jobid : int, head : int = None, tail : int = None, window : tuple = None, unit : str = "lines", follow : bool = False, interval : float = 1 ):
+    """
+    Iterate over the stderr of a job in chunks.
+
+    Parameters
+    ----------
+    jobid : int
+        The job-id whose stderr to read.
+    head : int
+        Only read the first n lines (or bytes).
+    tail : int
+        Only read the last n lines (or bytes).
+    window : tuple
+        Only read a (start, end) range of lines (or bytes).
+        Either may be None to read from the beginning or to the end.
+    unit : str
+        The unit of `head`, `tail`, and `window`. Either "lines" or "bytes".
+    follow : bool
+        Keep reading newly written output while the job is running.
+    interval : float
+        The number of seconds to wait between checks for new output when following.
+
+    Yields
+    ------
+    chunk : str
+        The next chunk of the stderr.
+    """
+    job = SlurmJob( jobid )
+    yield from _iter_job_output( job, "stderr", head, tail, window, unit, follow, interval )
+
+def read_stdout( jobid : int, **kwargs ) -> str:
     """
     Read the stdout of a job.
 
+    Note
+    ----
+    This loads the (selected part of the) stdout into memory.
+    Use `iter_stdout` to read large outputs in chunks.
+
     Parameters
     ----------
     jobid : int
         The job-id whose stdout to read.
-    
+    **kwargs
+        Any options of `iter_stdout` (e.g. `tail`) except `follow`.
+
     Returns
     -------
     stdout : str
         The stdout of the job.
     """
     job = SlurmJob( jobid )
-    if os.path.exists( job.stdout ):
-        with open( job.stdout , "r" ) as f:
-            stdout = f.read()
-    else:
-        print( "The stdout file does not exist (yet)." ) 
+    if not job.stdout or not os.path.exists( job.stdout ):
+        print( "The stdout file does not exist (yet)." )
         return
-    return stdout
-
+    return "".join( iter_output( job.stdout, **kwargs ) )
 
-
-def read_stderr( jobid : int ) -> str:
+def read_stderr( jobid : int, **kwargs ) -> str:
     """
     Read the stderr of a job.
 
+    Note
+    ----
+    This loads the (selected part of the) stderr into memory.
+    Use `iter_stderr` to read large outputs in chunks.
+
     Parameters
     ----------
     jobid : int
         The job-id whose stderr to read.
-    
+    **kwargs
+        Any options of `iter_stderr` (e.g. `tail`) except `follow`.
+
     Returns
     -------
     stderr : str
         The stderr of the job.
     """
     job = SlurmJob( jobid )
-    if os.path.exists( job.stderr ):
-        with open( job.stderr , "r" ) as f:
-            stderr = f.read()
-    else:
-        print( "The stderr file does not exist (yet)." ) 
+    if not job.stderr or not os.path.exists( job.stderr ):
+        print( "The stderr file does not exist (yet)." )
+        return
+    return "".join( iter_output( job.stderr, **kwargs ) )
+
+def iter_output( filename : str, head : int = None, tail : int = None, window : tuple = None, unit : str = "lines", follow = False, interval : float = 1 ):
+    """
+    Iterate over (a window of) an output file in chunks.
+
+    Parameters
+    ----------
+    filename : str
+        The file to read.
+    head : int
+        Only read the first n lines (or bytes).
+    tail : int
+        Only read the last n lines (or bytes).
+    window : tuple
+        Only read a (start, end) range of lines (or bytes).
+    unit : str
+        The unit of `head`, `tail`, and `window`. Either "lines" or "bytes".
+    follow : bool or callable
+        Keep reading newly written output. If this is a function it is called
+        whenever there is no new output and following stops once it returns False.
+    interval : float
+        The number of seconds to wait between checks for new output when following.
+
+    Yields
+    ------
+    chunk : str
+        The next chunk of the file.
+    """
+    if unit not in ( "lines", "bytes" ):
+        raise ValueError( f"unit must be either 'lines' or 'bytes', not '{unit}'" )
+    if head is not None:
+        window = ( 0, head )
+    start, end = window if window is not None else ( None, None )
+
+    decoder = codecs.getincrementaldecoder( "utf-8" )( errors = "replace" )
+    with open( filename, "rb" ) as f:
+
+        # find the byte offset to start from
+        if tail is not None:
+            offset = _tail_offset( f, tail, unit )
+        elif start and unit == "lines":
+            offset = _line_offset( f, 0, start )
+        else:
+            offset = start or 0
+
+        # find the number of bytes (or lines) to read
+        if end is None:
+            remaining = None
+        elif unit == "lines":
+            remaining = end - ( start or 0 )
+        else:
+            remaining = end - offset
+
+        f.seek( offset )
+        for chunk in _read_chunks( f, remaining, unit ):
+            yield decoder.decode( chunk )
+
+        # keep reading new output from where we stopped
+        if follow and end is None:
+            while True:
+                chunk = f.read( chunk_size )
+                if chunk:
+                    yield decoder.decode( chunk )
+                    continue
+                if callable( follow ) and not follow():
+                    chunk = f.read()
+                    if chunk:
+                        yield decoder.decode( chunk )
+                    break
+                time.sleep( interval )
+
+        rest = decoder.decode( b"", final = True )
+        if rest:
+            yield rest
+
+def _iter_job_output( job : SlurmJob, which : str, head, tail, window, unit, follow, interval ):
+    """
+    Iterate over the stdout or stderr of a job (see `iter_stdout`).
+    """
+    filename = getattr( job, which )
+    if not filename or not os.path.exists( filename ):
+        print( f"The {which} file does not exist (yet)." )
         return
-    return stderr
+
+    def running():
+        job.get_info()
+        return job.state in ( "RUNNING", "PENDING", "CONFIGURING", "COMPLETING", "REQUEUED", "RESIZING", "SUSPENDED" )
+
+    yield from iter_output( filename, head, tail, window, unit, running if follow else False, interval )
+
+def _read_chunks( f, remaining : int, unit : str ):
+    """
+    Read chunks from the current position until a number of lines or bytes was read (or the end of the file).
+    """
+    while remaining is None or remaining > 0:
+        chunk = f.read( chunk_size if remaining is None or unit == "lines" else min( chunk_size, remaining ) )
+        if not chunk:
+            return
+        if remaining is not None:
+            if unit == "lines":
+                newlines = chunk.count( b"\n" )
+                if newlines >= remaining:
+                    cut = _nth_newline( chunk, remaining ) + 1
+                    f.seek( cut - len(chunk), os.SEEK_CUR )
+                    chunk = chunk[ :cut ]
+                    remaining = 0
+                else:
+                    remaining -= newlines
+            else:
+                remaining -= len( chunk )
+        yield chunk
+
+def _line_offset( f, offset : int, lines : int ) -> int:
+    """
+    Get the byte offset after skipping a number of lines from an offset.
+    """
+    f.seek( offset )
+    while lines > 0:
+        chunk = f.read( chunk_size )
+        if not chunk:
+            break
+        newlines = chunk.count( b"\n" )
+        if newlines >= lines:
+            return offset + _nth_newline( chunk, lines ) + 1
+        lines -= newlines
+        offset += len( chunk )
+    return offset
+
+def _tail_offset( f, n : int, unit : str ) -> int:
+    """
+    Get the byte offset of the last n lines (or bytes) by reading backwards from the end of the file.
+    """
+    size = f.seek( 0, os.SEEK_END )
+    if unit == "bytes":
+        return max( size - n, 0 )
+    if n <= 0:
+        return size
+
+    # a trailing newline does not start another line
+    position = size
+    f.seek( max( size - 1, 0 ) )
+    newlines = -1 if f.read( 1 ) == b"\n" else 0
+    while position > 0:
+        start = max( position - chunk_size, 0 )
+        f.seek( start )
+        chunk = f.read( position - start )
+        count = chunk.count( b"\n" )
+        if newlines + count >= n:
+            # find the n-th newline from the end of this chunk
+            idx = len( chunk )
+            for _ in range( n - newlines ):
+                idx = chunk.rindex( b"\n", 0, idx )
+            return start + idx + 1
+        newlines += count
+        position = start
+    return 0
+
+def _nth_newline( chunk : bytes, n : int ) -> int:
+    """
+    Get the index of the n-th newline in a chunk.
+    """
+    idx = -1
+    for _ in range( n ):
+        idx = chunk.index( b"\n", idx + 1 )
+    return idx
@@ -0,0 +1,292 @@
+"""
+The single call path of all SLURM commands (and other subprocesses) run by slurmtools.
+
+Commands are given as argument lists and executed directly (without a shell). Each command
+has a timeout (`_timeouts`, or `SLURMTOOLS_TIMEOUT` seconds for all commands), so that a hung
+controller cannot freeze slurmtools, and transient controller errors (e.g. "Socket timed out")
+as well as timeouts of commands that are safe to repeat are retried with a jittered exponential backoff.
+
+Every call is recorded with its command, wall time, exit code, and the number of bytes
+of output. The records can be collected programmatically via the `profile` context manager,
+printed per command by the `--profile` flag of the CLI, or appended to a JSONL trace file
+set via the environment variable `SLURMTOOLS_TRACE`.
+
+Example
+-------
+>>> from slurmtools import profile, show_all
+>>> with profile() as calls:
+...     jobs = show_all()
+>>> print( calls.table() )
+"""
+
+import getpass
+import json
+import os
+import random
+import re
+import shlex
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import logging
+
+logger = logging.getLogger( "slurmtools" )
+
+_timeouts = { "scontrol" : 30, "squeue" : 30, "scancel" : 30, "sbatch" : 60, "sacct" : 120 }
+"""The timeouts (in seconds) of the SLURM commands. Other commands have no timeout."""
+
+_retried = { "scontrol", "squeue", "scancel", "sacct" }
+"""The commands that are safe to repeat (sbatch is not, a repeated call could submit a job twice)"""
+
+_transient = re.compile( "Socket timed out|Unable to contact slurm controller|Transport endpoint is not connected|Resource temporarily unavailable|Connection refused" )
+"""Matches the error messages of transient controller failures"""
+
+class Call:
+    """
+    A recorded subprocess call.
+
+    Parameters
+    ----------
+    cmd : list or str
+        The command (its arguments, or the arguments already joined to a string).
+    start : float
+        The start time (as UNIX timestamp).
+    wall_time : float
+        The wall time in seconds.
+    returncode : int
+        The exit code (None if the command timed out).
+    stdout_bytes : int
+        The number of bytes written to stdout (0 if stdout was not captured).
+    stderr_bytes : int
+        The number of bytes written to stderr (0 if stderr was not captured).
+    """
+    __slots__ = ( "cmd", "start", "wall_time", "returncode", "stdout_bytes", "stderr_bytes" )
+
+    def __init__( self, cmd, start : float, wall_time : float, returncode : int, stdout_bytes : int = 0, stderr_bytes : int = 0 ):
+        self.cmd = cmd if isinstance( cmd, str ) else shlex.join( str(i) for i in cmd )
+        self.start = start
+        self.wall_time = wall_time
+        self.returncode = returncode
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+
+    @property
+    def command( self ) -> str:
+        """
+        The program that was called (e.g. `squeue`), including the subcommand
+        for `scontrol` and `sacctmgr` (e.g. `scontrol show`).
+        """
+        try:
+            words = shlex.split( self.cmd )
+        except ValueError:
+            words = self.cmd.split()
+        if not words:
+            return ""
+        program = os.path.basename( words[0] )
+        if program in ( "scontrol", "sacctmgr" ) and len(words) > 1:
+            return f"{program} {words[1]}"
+        return program
+
+    def to_dict( self ) -> dict:
+        """
+        Get the call as a dictionary (one line of the JSONL trace).
+        """
+        return {
+                    "time" : datetime.fromtimestamp( self.start ).isoformat( timespec = "milliseconds" ),
+                    "command" : self.command,
+                    "cmd" : self.cmd,
+                    "wall_time" : round( self.wall_time, 6 ),
+                    "returncode" : self.returncode,
+                    "stdout_bytes" : self.stdout_bytes,
+                    "stderr_bytes" : self.stderr_bytes,
+                    "pid" : os.getpid(),
+                }
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}({self.cmd!r}, {self.wall_time:.3f}s, exit {self.returncode})"
+
+class Profile:
+    """
+    Collects the calls made while it is active (see `profile`).
+    """
+    def __init__( self ):
+        self.calls = []
+
+    def __enter__( self ) -> "Profile":
+        with _lock:
+            _profiles.append( self )
+        return self
+
+    def __exit__( self, *args ):
+        with _lock:
+            _profiles.remove( self )
+
+    def summary( self ) -> dict:
+        """
+        Summarize the calls per command.
+
+        Returns
+        -------
+        summary : dict
+            The number of calls, failed calls (non-zero exit code), the total and maximal
+            wall time (in seconds), and the output bytes per command, ordered by the total wall time.
+        """
+        summary = {}
+        for call in self.calls:
+            entry = summary.setdefault( call.command, { "calls" : 0, "failed" : 0, "total" : 0.0, "max" : 0.0, "bytes" : 0 } )
+            entry["calls"] += 1
+            entry["failed"] += call.returncode != 0
+            entry["total"] += call.wall_time
+            entry["max"] = max( entry["max"], call.wall_time )
+            entry["bytes"] += call.stdout_bytes + call.stderr_bytes
+        return dict( sorted( summary.items(), key = lambda i: i[1]["total"], reverse = True ) )
+
+    def table( self ) -> str:
+        """
+        Get the per-command summary as a printable table.
+        """
+        header = f"{'command':<20} {'calls':>6} {'failed':>6} {'total (s)':>10} {'mean (s)':>10} {'max (s)':>10} {'bytes':>12}"
+        lines = [ header, "-" * len(header) ]
+        total = { "calls" : 0, "failed" : 0, "total" : 0.0, "max" : 0.0, "bytes" : 0 }
+        for command, entry in self.summary().items():
+            lines.append( f"{command:<20} {entry['calls']:>6} {entry['failed']:>6} {entry['total']:>10.3f} {entry['total'] / entry['calls']:>10.3f} {entry['max']:>10.3f} {entry['bytes']:>12}" )
+            for key in ( "calls", "failed", "total", "bytes" ):
+                total[ key ] += entry[ key ]
+            total["max"] = max( total["max"], entry["max"] )
+        lines.append( "-" * len(header) )
+        mean = total["total"] / total["calls"] if total["calls"] else 0.0
+        lines.append( f"{'total':<20} {total['calls']:>6} {total['failed']:>6} {total['total']:>10.3f} {mean:>10.3f} {total['max']:>10.3f} {total['bytes']:>12}" )
+        return "\n".join( lines )
+
+    def __len__( self ) -> int:
+        return len( self.calls )
+
+_profiles = []
+"""The currently active profiles"""
+
+_lock = threading.Lock()
+
+def profile() -> Profile:
+    """
+    Record all calls made within a `with` block.
+
+    Returns
+    -------
+    profile : Profile
+        The profile whose `calls` are filled while the block runs.
+    """
+    return Profile()
+
+def record( call : Call ):
+    """
+    Record a finished call with the active profiles and the trace file (if any).
+
+    Parameters
+    ----------
+    call : Call
+        The call to record.
+    """
+    with _lock:
+        for active in _profiles:
+            active.calls.append( call )
+    trace = os.environ.get( "SLURMTOOLS_TRACE" )
+    if trace:
+        # single appends of a line are atomic, so concurrent processes can share the trace
+        with open( trace, "a" ) as f:
+            f.write( json.dumps( call.to_dict() ) + "\n" )
+
+def timeout( argv : list ) -> float:
+    """
+    Get the timeout of a command in seconds (None for no timeout).
+    """
+    default = os.environ.get( "SLURMTOOLS_TIMEOUT" )
+    program = os.path.basename( argv[0] )
+    if program not in _timeouts:
+        return None
+    try:
+        return float( default ) if default else _timeouts[ program ]
+    except ValueError:
+        logger.warning( "SLURMTOOLS_TIMEOUT must be a number of seconds. The default timeouts are used." )
+        return _timeouts[ program ]
+
+def backoff( attempt : int, base : float = 0.5, maximum : float = 10 ) -> float:
+    """
+    Get the (jittered) delay before a retry.
+
+    Parameters
+    ----------
+    attempt : int
+        The number of the failed attempt (starting at 0).
+    base : float
+        The delay after the first attempt in seconds.
+    maximum : float
+        The maximal delay in seconds.
+
+    Returns
+    -------
+    delay : float
+        A random delay between half and the full exponential backoff, so that many
+        processes that failed at the same time do not all retry at the same time.
+    """
+    delay = min( maximum, base * 2 ** attempt )
+    return random.uniform( delay / 2, delay )
+
+def run( argv : list, capture : bool = True, retries : int = 3 ) -> subprocess.CompletedProcess:
+    """
+    Run a command and record the call.
+
+    Parameters
+    ----------
+    argv : list
+        The command and its arguments (these are not interpreted by a shell).
+    capture : bool
+        Capture the (bytes) stdout and stderr. Otherwise they go to the terminal.
+    retries : int
+        The maximal number of retries after transient controller errors or timeouts
+        (only for the commands that are safe to repeat).
+
+    Returns
+    -------
+    result : CompletedProcess
+        The finished process.
+
+    Raises
+    ------
+    TimeoutError
+        If the command did not finish within its timeout (in any attempt).
+    """
+    argv = [ str(i) for i in argv ]
+    limit = timeout( argv )
+    retries = retries if os.path.basename( argv[0] ) in _retried else 0
+    for attempt in range( retries + 1 ):
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            result = subprocess.run( argv, capture_output = capture, timeout = limit )
+        except subprocess.TimeoutExpired:
+            record( Call( argv, start, time.perf_counter() - begin, None ) )
+            if attempt < retries:
+                time.sleep( backoff( attempt ) )
+                continue
+            raise TimeoutError( f"'{shlex.join( argv )}' did not finish within {limit:g}s" )
+        record( Call( argv, start, time.perf_counter() - begin, result.returncode, len( result.stdout or b"" ), len( result.stderr or b"" ) ) )
+
+        if result.returncode != 0 and attempt < retries and _transient.search( ( result.stderr or b"" ).decode( "utf-8", "replace" ) ):
+            logger.info( f"Retrying '{argv[0]}' after a transient error: {result.stderr.decode( 'utf-8', 'replace' ).strip()}" )
+            time.sleep( backoff( attempt ) )
+            continue
+        return result
+
+def output( argv : list, **kwargs ) -> str:
+    """
+    Run a command, record the call, and get its decoded stdout (see `run`).
+    """
+    return run( argv, **kwargs ).stdout.decode("utf-8")
+
+def user() -> str:
+    """
+    Get the name of the current user (without asking a `whoami` subprocess).
+    """
+    return getpass.getuser()
@@ -2,8 +2,9 @@
 Interactive slurm sessions (srun) wrapper.
 """
 
-import subprocess
+import shlex
 from datetime import datetime
+from . import runner
 
 # import os
 
@@ -185,29 +186,28 @@ def session(
         name = f"[{cmd}]-session-{datetime.now().strftime( '%Y%m%d-%H%M%S' )}"
 
     # now make the command
-    _cmd = cmd
-    cmd = f"""srun --job-name='{name}'"""
+    argv = [ "srun", f"--job-name={name}" ]
     
     if time: 
-        cmd += f" --time={time}"
+        argv.append( f"--time={time}" )
     if cpu:
-        cmd += f" --cpus-per-task={cpu}"
+        argv.append( f"--cpus-per-task={cpu}" )
     if memory:
-        cmd += f" --mem={memory}"
+        argv.append( f"--mem={memory}" )
     if partition: 
-        cmd += f" -p {partition}"
+        argv += [ "-p", partition ]
     if nodes:
-        cmd += f" -N {nodes}"
+        argv += [ "-N", str( nodes ) ]
 
-    cmd += f" --pty {_cmd}"
+    argv += [ "--pty", *shlex.split( cmd ) ]
 
-    if detach:    
-        cmd = f"""
-tmux new -s {name} "{cmd}"  
-tmux attach -t {name}    
-""".strip()
+    if detach:
+        # tmux runs the session command through its own shell
+        runner.run( [ "tmux", "new", "-s", name, shlex.join( argv ) ], capture = False )
+        runner.run( [ "tmux", "attach", "-t", name ], capture = False )
+        return
 
-    subprocess.run( cmd, shell = True )
+    runner.run( argv, capture = False )
 
 
 def _available_scales():
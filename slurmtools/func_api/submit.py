@@ -2,8 +2,14 @@
 Submit a new slurm job
 """
 
-import subprocess
+import os
+import re
+import shlex
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from . import cache, runner
 from .last_submit import last_submit
+from .ledger import ledger
 
 class CmdArgs:
     """
@@ -66,20 +72,62 @@ def submit( filename : str, args ) -> int:
         The job-id of the submitted job.
     """
 
-    time = "-t {args.time} " if args.time else ""
-    nodes = "-N {args.nodes} " if args.nodes else ""
-    cores = "-c {args.cores} " if args.cores else ""
-    memory = "-m {args.memory} " if args.memory else ""
-    partition = "-p {args.partition} " if args.partition else ""
-
-    cmd = f"sbatch {time}{cores}{memory}{partition}{nodes}{filename}"
-    newjob = subprocess.run( cmd, shell = True, capture_output = True )
+    newjob = runner.run( [ "sbatch", *sbatch_options( args ), *shlex.split( filename ) ] )
     
     newjob = extract_jobid(newjob) 
-    last_submit( newjob )
+    last_submit( newjob, script = shlex.split( filename )[0], resources = resources( args ) )
+    cache.invalidate()
     
     return newjob
 
+def sbatch_options( args ) -> list:
+    """
+    Get the sbatch options for the job resources.
+
+    Parameters
+    ----------
+    args : CmdArgs
+        The arguments to pass to the job.
+        This can have attributes for `time`, 
+        `nodes`, `cores`, `memory`, and `partition`.
+
+    Returns
+    -------
+    options : list
+        The sbatch options.
+    """
+    options = []
+    if args is None:
+        return options
+    if args.time:
+        options += [ "-t", str( args.time ) ]
+    if args.cores:
+        options += [ "-c", str( args.cores ) ]
+    if args.memory:
+        options += [ "--mem", str( args.memory ) ]
+    if args.partition:
+        options += [ "-p", str( args.partition ) ]
+    if args.nodes:
+        options += [ "-N", str( args.nodes ) ]
+    return options
+
+def resources( args ) -> dict:
+    """
+    Get the requested resources as a dictionary (e.g. for the submission ledger).
+
+    Parameters
+    ----------
+    args : CmdArgs
+        The arguments to pass to the job.
+
+    Returns
+    -------
+    resources : dict
+        The `time`, `nodes`, `cores`, `memory`, and `partition` of the job.
+    """
+    names = ( "time", "nodes", "cores", "memory", "partition" )
+    return { name : getattr( args, name, None ) for name in names }
+
 def extract_jobid( msg ) -> int:
     """
     Extracts the jobid from the slurm submission message.
@@ -87,14 +135,276 @@ def extract_jobid( msg ) -> int:
     Parameters
     ----------
     msg : CompletedProcess
-        The slurm submission message as raw output from `subprocess.run`.
+        The slurm submission message as raw output from `runner.run`
+        (or an `AsyncSlurmClient` call).
     
     Returns
     -------
     jobid : int
         The job-id of the submitted job.
     """
-    msg = msg.stdout.decode("utf-8")
+    msg = msg.stdout
+    if isinstance( msg, bytes ):
+        msg = msg.decode("utf-8")
     jobid = int( msg.split(" ")[-1].strip() )
     return jobid
-  
\ No newline at end of file
+  
+def render_template( template : str, params, directory : str = None ) -> list:
+    """
+    Render a job file template for each row of a parameter table.
+
+    Placeholders in the template are written as `{{name}}` (so that they do not
+    clash with shell variables such as `${HOME}`).
+
+    Parameters
+    ----------
+    template : str
+        The template job file.
+    params : list or dict
+        The parameter table either as a list of dictionaries (one per job)
+        or as a dictionary of equally long columns.
+    directory : str
+        The directory to write the rendered job files to.
+        By default a directory `<template>.jobs` next to the template is used.
+
+    Returns
+    -------
+    filenames : list
+        The rendered job files (in the order of the parameter rows).
+    """
+    if isinstance( params, dict ):
+        params = [ dict( zip( params.keys(), row ) ) for row in zip( *params.values() ) ]
+
+    with open( template, "r" ) as f:
+        content = f.read()
+
+    directory = directory or f"{os.path.splitext( template )[0]}.jobs"
+    os.makedirs( directory, exist_ok = True )
+    name, ext = os.path.splitext( os.path.basename( template ) )
+
+    filenames = []
+    for idx, row in enumerate( params ):
+        def replace( match ):
+            key = match.group(1)
+            if key not in row:
+                raise KeyError( f"The template placeholder '{key}' is missing in parameter row {idx}." )
+            return str( row[key] )
+        filename = os.path.join( directory, f"{name}_{idx}{ext}" )
+        with open( filename, "w" ) as f:
+            f.write( _placeholder.sub( replace, content ) )
+        filenames.append( filename )
+    return filenames
+
+def submit_template( template : str, params, args = None, throttle : int = None, array : bool = True, directory : str = None, workers : int = 8 ) -> list:
+    """
+    Submit a job file template for each row of a parameter table.
+    The jobs are submitted as a single job array if possible (see `submit_many`).
+
+    Parameters
+    ----------
+    template : str
+        The template job file (placeholders are written as `{{name}}`).
+    params : list or dict
+        The parameter table either as a list of dictionaries (one per job)
+        or as a dictionary of equally long columns.
+    args : CmdArgs
+        The arguments to pass to the jobs.
+    throttle : int
+        The maximal number of array tasks running at the same time.
+    array : bool
+        Submit the jobs as a job array if possible.
+    directory : str
+        The directory to write the rendered job files to.
+    workers : int
+        The number of parallel sbatch calls if the jobs are not submitted as an array.
+
+    Returns
+    -------
+    jobids : list
+        The job-ids (or array task-ids) of the submitted jobs as strings.
+    """
+    filenames = render_template( template, params, directory )
+    return submit_many( filenames, args = args, throttle = throttle, array = array, workers = workers )
+
+def submit_many( filenames : list, args = None, throttle : int = None, array : bool = True, workers : int = 8 ) -> list:
+    """
+    Submit many job files at once.
+
+    If all files share the same `#SBATCH` directives (and the cluster's MaxArraySize allows it) 
+    they are submitted with a single `sbatch --array` call whose tasks each run one of the files.
+    Otherwise the files are submitted with parallel `sbatch` calls.
+
+    Parameters
+    ----------
+    filenames : list
+        The job files to submit.
+    args : CmdArgs
+        The arguments to pass to the jobs.
+    throttle : int
+        The maximal number of array tasks running at the same time (`--array=...%throttle`).
+    array : bool
+        Submit the jobs as a job array if possible.
+    workers : int
+        The number of parallel sbatch calls if the jobs are not submitted as an array.
+
+    Returns
+    -------
+    jobids : list
+        The job-ids (or `<arrayid>_<taskid>` task-ids) of the submitted jobs as strings,
+        in the order of the files.
+
+    Raises
+    ------
+    RuntimeError
+        If some of the files could not be submitted. The other files are submitted
+        (and recorded in the ledger) nonetheless, the error lists their job-ids and the failed files.
+    """
+    filenames = [ os.path.abspath( i ) for i in filenames ]
+    if not filenames:
+        return []
+
+    if array and len( filenames ) > 1 and can_submit_array( filenames ):
+        jobid = submit_array( filenames, args, throttle )
+        jobids = [ f"{jobid}_{idx}" for idx in range( len(filenames) ) ]
+        ledger().record_many( jobids, filenames, resources( args ), array_id = jobid )
+        cache.invalidate()
+        return jobids
+
+    def sbatch( filename ):
+        try:
+            result = runner.run( [ "sbatch", "--parsable", *sbatch_options( args ), filename ] )
+            return parsable_jobid( result ), None
+        except ( RuntimeError, TimeoutError ) as e:
+            return None, e
+    with ThreadPoolExecutor( max_workers = workers ) as pool:
+        results = list( pool.map( sbatch, filenames ) )
+
+    submitted = [ ( filename, jobid ) for filename, ( jobid, error ) in zip( filenames, results ) if error is None ]
+    if submitted:
+        ledger().record_many( [ i[1] for i in submitted ], [ i[0] for i in submitted ], resources( args ) )
+        cache.invalidate()
+    failed = [ ( filename, error ) for filename, ( jobid, error ) in zip( filenames, results ) if error is not None ]
+    if failed:
+        msg = f"{len(failed)} of {len(filenames)} jobs could not be submitted:\n" + "\n".join( f"  {f}: {e}" for f, e in failed )
+        if submitted:
+            msg += f"\nThe other jobs were submitted with ids {', '.join( i[1] for i in submitted )}"
+        raise RuntimeError( msg )
+    return [ i[1] for i in submitted ]
+
+_placeholder = re.compile( "\\{\\{\\s*(\\w+)\\s*\\}\\}" )
+"""Matches the placeholders in job file templates"""
+
+def directives( filename : str ) -> tuple:
+    """
+    Get the shebang and the `#SBATCH` directives of a job file.
+
+    Parameters
+    ----------
+    filename : str
+        The job file.
+
+    Returns
+    -------
+    shebang : str
+        The shebang line (None if the file has none).
+    directives : tuple
+        The `#SBATCH` lines (up to the first command of the file).
+    """
+    shebang, lines = None, []
+    with open( filename, "r" ) as f:
+        for idx, line in enumerate( f ):
+            line = line.rstrip( "\n" )
+            if idx == 0 and line.startswith( "#!" ):
+                shebang = line
+            elif line.startswith( "#SBATCH" ):
+                lines.append( line )
+            elif line.strip() and not line.startswith( "#" ):
+                # sbatch stops reading directives at the first command
+                break
+    return shebang, tuple( lines )
+
+def max_array_size() -> int:
+    """
+    Get the cluster's MaxArraySize (SLURM's default is 1001).
+    """
+    config = runner.output( [ "scontrol", "show", "config" ] )
+    size = re.search( "MaxArraySize\\s*=\\s*([0-9]+)", config )
+    return int( size.group(1) ) if size else 1001
+
+def can_submit_array( filenames : list, max_size : int = None ) -> bool:
+    """
+    Check if job files can be submitted as a single job array.
+
+    Parameters
+    ----------
+    filenames : list
+        The job files.
+    max_size : int
+        The maximal number of tasks of a job array. By default the cluster's MaxArraySize is looked up.
+    """
+    first = directives( filenames[0] )
+    if any( directives( i ) != first for i in filenames[1:] ):
+        return False
+    if any( "--array" in i or i.split()[1:2] == [ "-a" ] for i in first[1] ):
+        return False
+    return len( filenames ) <= ( max_array_size() if max_size is None else max_size )
+
+def submit_array( filenames : list, args = None, throttle : int = None ) -> int:
+    """
+    Submit job files as the tasks of a single job array.
+
+    A driver script with the shared `#SBATCH` directives and the list of the files is written
+    next to the first file (under a unique name, so concurrent submissions of the same files do
+    not overwrite each other). Each task runs the file at its task index. SLURM copies the driver
+    at submission, so it is removed again right after the sbatch call.
+
+    Parameters
+    ----------
+    filenames : list
+        The job files (which must share their `#SBATCH` directives, see `can_submit_array`).
+    args : CmdArgs
+        The arguments to pass to the jobs.
+    throttle : int
+        The maximal number of array tasks running at the same time.
+
+    Returns
+    -------
+    jobid : int
+        The id of the job array (task `i` runs the i-th file).
+    """
+    shebang, sbatch_lines = directives( filenames[0] )
+    interpreter = shebang[2:].strip() if shebang else "bash"
+
+    directory, name = os.path.split( os.path.splitext( filenames[0] )[0] )
+    fd, driver = tempfile.mkstemp( prefix = f"{name}.", suffix = ".array.slurm", dir = directory )
+
+    array = f"0-{len(filenames) - 1}" + ( f"%{throttle}" if throttle else "" )
+    with os.fdopen( fd, "w" ) as f:
+        f.write( "#!/bin/bash\n" )
+        f.write( "\n".join( sbatch_lines ) + "\n" )
+        f.write( f"#SBATCH --array={array}\n\n" )
+        # the list is part of the script, which SLURM copies at submission
+        f.write( "scripts=(\n" )
+        f.write( "".join( f"    {shlex.quote( i )}\n" for i in filenames ) )
+        f.write( ")\n" )
+        f.write( f"exec {interpreter} \"${{scripts[$SLURM_ARRAY_TASK_ID]}}\"\n" )
+
+    try:
+        result = runner.run( [ "sbatch", "--parsable", *sbatch_options( args ), driver ] )
+    finally:
+        os.remove( driver )
+    return int( parsable_jobid( result ) )
+
+def parsable_jobid( result ) -> str:
+    """
+    Get the job-id from the output of `sbatch --parsable` (`jobid[;cluster]`).
+
+    Raises
+    ------
+    RuntimeError
+        If sbatch failed.
+    """
+    output = result.stdout.decode("utf-8").strip()
+    if result.returncode != 0 or not output:
+        raise RuntimeError( f"Could not submit job: {result.stderr.decode('utf-8').strip()}" )
+    return output.split( ";" )[0]
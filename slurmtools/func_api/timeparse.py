@@ -0,0 +1,228 @@
+"""
+Parse SLURM durations and timestamps.
+
+Single values are parsed with plain python (no pandas required).
+For whole columns of values (e.g. the runtimes of many jobs) the
+`to_timedeltas` and `to_datetimes` functions use a vectorized
+conversion via pandas if it is installed.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+_unset = { "", "UNLIMITED", "INVALID", "NOT_SET", "N/A", "None", "Unknown", "(null)" }
+"""Values that SLURM uses for unknown or undefined times"""
+
+_duration = "^(?:(?P<days>\\d+)-)?(?P<a>\\d+)(?::(?P<b>\\d+))?(?::(?P<c>\\d+))?$"
+"""Matches SLURM durations (for the vectorized conversion)"""
+
+_units = { "s" : 1, "m" : 60, "h" : 3600, "d" : 86400 }
+"""The seconds per unit of a duration like `12h`"""
+
+def parse_duration( value : str ) -> timedelta:
+    """
+    Parse a SLURM duration.
+
+    Supported formats are `D-HH:MM:SS`, `D-HH:MM`, `D-HH`, `HH:MM:SS`, `MM:SS` and `MM`.
+
+    Parameters
+    ----------
+    value : str
+        The duration string.
+
+    Returns
+    -------
+    duration : timedelta or None
+        The parsed duration or None if the value is undefined (e.g. `UNLIMITED`) or cannot be parsed.
+    """
+    seconds = duration_seconds( value )
+    if seconds is None:
+        return None
+    return timedelta( seconds = seconds )
+
+def duration_seconds( value : str ) -> int:
+    """
+    Parse a SLURM duration into seconds.
+
+    Parameters
+    ----------
+    value : str
+        The duration string (see `parse_duration` for the supported formats).
+
+    Returns
+    -------
+    seconds : int or None
+        The duration in seconds or None if the value is undefined or cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value in _unset:
+        return None
+    try:
+        days = 0
+        if "-" in value:
+            days, value = value.split( "-" )
+            days = int( days )
+            # D-HH, D-HH:MM, and D-HH:MM:SS
+            parts = [ int(i) for i in value.split(":") ] + [ 0, 0 ]
+            hours, minutes, seconds = parts[:3]
+        else:
+            # MM, MM:SS, and HH:MM:SS
+            parts = [ int(i) for i in value.split(":") ]
+            parts = [ 0 ] * ( 3 - len(parts) ) + parts
+            if len(parts) != 3:
+                return None
+            hours, minutes, seconds = parts
+            if value.count(":") == 0:
+                hours, minutes, seconds = 0, parts[2], 0
+    except ValueError:
+        return None
+    return ( ( days * 24 + hours ) * 60 + minutes ) * 60 + seconds
+
+def span_seconds( value ) -> float:
+    """
+    Convert a duration given by the user into seconds.
+
+    Besides SLURM durations (see `parse_duration`) this accepts a number with a unit
+    (`90s`, `30m`, `12h`, `7d`), a plain number of seconds, or a `timedelta`.
+
+    Parameters
+    ----------
+    value : str, int, float or timedelta
+        The duration.
+
+    Returns
+    -------
+    seconds : float or None
+        The duration in seconds or None if the value cannot be parsed.
+    """
+    if isinstance( value, timedelta ):
+        return value.total_seconds()
+    if isinstance( value, ( int, float ) ):
+        return float( value )
+    unit = re.fullmatch( "([0-9.]+)([smhd])", value.strip() )
+    if unit:
+        try:
+            return float( unit.group(1) ) * _units[ unit.group(2) ]
+        except ValueError:
+            return None
+    seconds = duration_seconds( value )
+    return float( seconds ) if seconds is not None else None
+
+def format_duration( seconds : int ) -> str:
+    """
+    Format a duration in seconds the way `squeue` displays it 
+    (`D-HH:MM:SS`, `H:MM:SS` or `M:SS`).
+
+    Parameters
+    ----------
+    seconds : int
+        The duration in seconds. Negative values or None are undefined durations.
+
+    Returns
+    -------
+    duration : str
+        The formatted duration (`N/A` for undefined durations).
+    """
+    if seconds is None or seconds < 0:
+        return "N/A"
+    minutes, seconds = divmod( int(seconds), 60 )
+    hours, minutes = divmod( minutes, 60 )
+    days, hours = divmod( hours, 24 )
+    if days:
+        return f"{days}-{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+def parse_timestamp( value : str ) -> datetime:
+    """
+    Parse a SLURM timestamp (ISO format `YYYY-MM-DDTHH:MM:SS`).
+
+    Parameters
+    ----------
+    value : str
+        The timestamp string.
+
+    Returns
+    -------
+    timestamp : datetime or None
+        The parsed timestamp or None if the value is undefined (e.g. `Unknown`) or cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value in _unset:
+        return None
+    try:
+        return datetime.fromisoformat( value )
+    except ValueError:
+        return None
+
+def to_timedeltas( values ):
+    """
+    Convert a whole column of SLURM durations at once.
+
+    Note
+    ----
+    This uses a vectorized conversion via pandas if it is installed,
+    otherwise the values are parsed one by one.
+
+    Parameters
+    ----------
+    values : iterable
+        The duration strings.
+
+    Returns
+    -------
+    durations : pandas.Series or list
+        A `timedelta64` Series (with `NaT` for undefined values) if pandas is available,
+        otherwise a list of `timedelta` objects (with `None` for undefined values).
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        return [ parse_duration( i ) for i in values ]
+
+    values = pd.Series( list( values ), dtype = "object" )
+    parts = values.str.strip().str.extract( _duration ).astype( "float64" )
+
+    # the fields are HH:MM:SS if there are three parts, MM:SS if there are two,
+    # and MM if there is only one (unless days are given, then it's D-HH[:MM[:SS]])
+    has_days = parts["days"].notna()
+    n = parts[[ "a", "b", "c" ]].notna().sum( axis = 1 )
+    hours = parts["a"].where( has_days | ( n == 3 ), 0 )
+    minutes = parts["b"].where( has_days | ( n == 3 ), parts["a"].where( n < 3, 0 ) )
+    seconds = parts["c"].where( has_days | ( n == 3 ), parts["b"].where( n == 2, 0 ) )
+    seconds = parts["days"].fillna( 0 ) * 86400 + hours * 3600 + minutes.fillna( 0 ) * 60 + seconds.fillna( 0 )
+    seconds = seconds.where( n > 0 )
+    return pd.to_timedelta( seconds, unit = "s" )
+
+def to_datetimes( values ):
+    """
+    Convert a whole column of SLURM timestamps at once.
+
+    Note
+    ----
+    This uses a vectorized conversion via pandas if it is installed,
+    otherwise the values are parsed one by one.
+
+    Parameters
+    ----------
+    values : iterable
+        The timestamp strings.
+
+    Returns
+    -------
+    timestamps : pandas.Series or list
+        A `datetime64` Series (with `NaT` for undefined values) if pandas is available,
+        otherwise a list of `datetime` objects (with `None` for undefined values).
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        return [ parse_timestamp( i ) for i in values ]
+
+    values = pd.Series( list( values ), dtype = "object" )
+    return pd.to_datetime( values, format = "%Y-%m-%dT%H:%M:%S", errors = "coerce" )
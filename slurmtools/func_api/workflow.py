@@ -0,0 +1,408 @@
+"""
+Submit workflows (DAGs) of dependent jobs at once.
+
+A workflow consists of steps, each a job file that may depend on other steps. Rather than
+waiting for one stage to finish before submitting the next, the whole graph is submitted at once:
+the steps are submitted in topological order (the independent steps of each level via parallel
+`sbatch --parsable` calls) and each step is wired to the job-ids of the steps it depends on via
+`--dependency` (`afterok`, `afterany`, `aftercorr`, ...). SLURM then starts every step as soon as
+its dependencies are satisfied. Steps whose dependencies can never be satisfied (e.g. after a
+failed `afterok` step) are cancelled by SLURM (`--kill-on-invalid-dep=yes`).
+
+Submitted workflows are recorded in the submission ledger, so that their status can be shown
+and all of their remaining jobs cancelled at once.
+
+Workflows are either defined in python or in a small TOML (or YAML) spec. Scripts are
+relative to the spec file, and the `resources` are the defaults of all steps:
+
+    name = "pipeline"
+
+    [resources]
+    partition = "main"
+
+    [steps.prepare]
+    script = "prepare.slurm"
+
+    [steps.align]
+    script = "align.slurm sample1"
+    after = "prepare"
+    time = "02:00:00"
+
+    [steps.report]
+    script = "report.slurm"
+    after = { align = "afterany" }
+
+Note
+----
+YAML specs require PyYAML (and TOML specs tomli on python < 3.11), `pip install slurmtools[workflow]`.
+
+Example
+-------
+>>> from slurmtools import Workflow, workflow_status
+>>> flow = Workflow( "pipeline" )
+>>> flow.add( "prepare", "prepare.slurm" )
+>>> flow.add( "align", "align.slurm", after = "prepare", time = "02:00:00" )
+>>> flow.add( "report", "report.slurm", after = { "align" : "afterany" } )
+>>> run = flow.submit()
+>>> workflow_status( run.id )
+"""
+
+import os
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache, runner
+from .ledger import ledger
+from .submit import CmdArgs, sbatch_options, resources, parsable_jobid
+
+_kinds = ( "after", "afterok", "afternotok", "afterany", "aftercorr" )
+"""The supported dependency types"""
+
+_resources = ( "time", "nodes", "cores", "memory", "partition" )
+"""The resources that can be requested per step (see `CmdArgs`)"""
+
+class Step:
+    """
+    A single step of a workflow.
+
+    Parameters
+    ----------
+    name : str
+        The name of the step.
+    script : str
+        The job file (including any additional arguments).
+    after : str or list or dict
+        The steps this step depends on, either as a list of names
+        or as a dictionary with the dependency type of each step (e.g. `{ "align" : "afterany" }`).
+    dependency : str
+        The dependency type of the steps given as a list (default `afterok`).
+    **resources
+        The resources of the step (`time`, `nodes`, `cores`, `memory`, and `partition`).
+    """
+    def __init__( self, name : str, script : str, after = None, dependency : str = "afterok", **resources ):
+        if isinstance( after, str ):
+            after = [ after ]
+        if not isinstance( after, dict ):
+            after = { i : dependency for i in ( after or () ) }
+        for step, kind in after.items():
+            if kind not in _kinds:
+                raise ValueError( f"Unknown dependency type '{kind}' of step '{name}' on '{step}'. Use one of {', '.join( _kinds )}." )
+        unknown = set( resources ) - set( _resources )
+        if unknown:
+            raise ValueError( f"Unknown options of step '{name}': {', '.join( sorted( unknown ) )}" )
+
+        self.name = name
+        self.script = script
+        self.after = after
+        self.resources = resources
+
+    def dependency( self, jobids : dict ) -> str:
+        """
+        Get the `--dependency` value of the step (e.g. `afterok:1234:1235,afterany:1236`).
+
+        Parameters
+        ----------
+        jobids : dict
+            The job-ids of the (already submitted) steps.
+        """
+        kinds = {}
+        for step, kind in self.after.items():
+            kinds.setdefault( kind, [] ).append( str( jobids[ step ] ) )
+        return ",".join( f"{kind}:{':'.join( ids )}" for kind, ids in kinds.items() )
+
+    def args( self, defaults = None ) -> CmdArgs:
+        """
+        Get the resources of the step, filled up with the defaults.
+
+        Parameters
+        ----------
+        defaults : CmdArgs or dict
+            The default resources.
+        """
+        if not isinstance( defaults, dict ):
+            defaults = { name : getattr( defaults, name, None ) for name in _resources }
+        return CmdArgs( **{ name : self.resources.get( name ) or defaults.get( name ) for name in _resources } )
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}({self.name}, script={self.script}, after={self.after})"
+
+class Workflow:
+    """
+    A workflow of dependent jobs.
+
+    Parameters
+    ----------
+    name : str
+        The name of the workflow.
+    resources : dict
+        The default resources of all steps (`time`, `nodes`, `cores`, `memory`, and `partition`).
+    """
+    def __init__( self, name : str = None, resources : dict = None ):
+        self.name = name
+        self.resources = resources or {}
+        self.steps = {}
+
+    def add( self, name : str, script : str, after = None, dependency : str = "afterok", **resources ) -> Step:
+        """
+        Add a step to the workflow (see `Step` for the parameters).
+
+        Returns
+        -------
+        step : Step
+            The new step.
+        """
+        if name in self.steps:
+            raise ValueError( f"The workflow already has a step '{name}'." )
+        step = self.steps[ name ] = Step( name, script, after, dependency, **resources )
+        return step
+
+    def levels( self ) -> list:
+        """
+        Sort the steps topologically.
+
+        Returns
+        -------
+        levels : list
+            The lists of steps of each level. The steps of a level only depend
+            on the steps of previous levels (and can be submitted at the same time).
+        """
+        for step in self.steps.values():
+            missing = [ i for i in step.after if i not in self.steps ]
+            if missing:
+                raise ValueError( f"Step '{step.name}' depends on unknown steps: {', '.join( missing )}" )
+
+        levels, done = [], set()
+        remaining = list( self.steps.values() )
+        while remaining:
+            level = [ step for step in remaining if all( i in done for i in step.after ) ]
+            if not level:
+                raise ValueError( f"The workflow has a dependency cycle among the steps {', '.join( i.name for i in remaining )}." )
+            levels.append( level )
+            done.update( step.name for step in level )
+            remaining = [ step for step in remaining if step.name not in done ]
+        return levels
+
+    def submit( self, args = None, workers : int = 8 ):
+        """
+        Submit the workflow (see `submit_workflow`).
+        """
+        return submit_workflow( self, args, workers )
+
+    @classmethod
+    def from_dict( cls, spec : dict, directory : str = None ) -> "Workflow":
+        """
+        Create a workflow from a spec.
+
+        Parameters
+        ----------
+        spec : dict
+            The spec with the `name` of the workflow, the default `resources`,
+            and the `steps` (the keyword arguments of `Workflow.add` by step name).
+        directory : str
+            The directory the job files are relative to.
+        """
+        workflow = cls( spec.get( "name" ), spec.get( "resources" ) )
+        for name, step in ( spec.get( "steps" ) or {} ).items():
+            step = dict( step )
+            if "script" not in step:
+                raise ValueError( f"Step '{name}' has no script." )
+            script = shlex.split( step.pop( "script" ) )
+            if directory:
+                script[0] = os.path.join( directory, script[0] )
+            workflow.add( name, shlex.join( script ), **step )
+        return workflow
+
+    @classmethod
+    def load( cls, path : str ) -> "Workflow":
+        """
+        Load a workflow from a TOML or YAML spec.
+        The workflow is named after the file unless the spec gives a name.
+
+        Parameters
+        ----------
+        path : str
+            The spec file (`.toml`, `.yaml`, or `.yml`).
+        """
+        if path.endswith( ( ".yaml", ".yml" ) ):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError( "Loading YAML workflows requires PyYAML. Install it via 'pip install slurmtools[workflow]'." )
+            with open( path, "r" ) as f:
+                spec = yaml.safe_load( f ) or {}
+        else:
+            try:
+                import tomllib
+            except ImportError:
+                try:
+                    import tomli as tomllib
+                except ImportError:
+                    raise ImportError( "Loading TOML workflows requires tomli (on python < 3.11). Install it via 'pip install slurmtools[workflow]'." )
+            with open( path, "rb" ) as f:
+                spec = tomllib.load( f )
+
+        spec.setdefault( "name", os.path.splitext( os.path.basename( path ) )[0] )
+        return cls.from_dict( spec, os.path.dirname( os.path.abspath( path ) ) )
+
+    def __repr__( self ) -> str:
+        return f"{self.__class__.__name__}({self.name}, steps={list( self.steps )})"
+
+def submit_workflow( workflow, args = None, workers : int = 8 ):
+    """
+    Submit a workflow at once, with the dependencies between its steps wired via `--dependency`.
+
+    If a submission fails, the already submitted steps are cancelled again.
+
+    Parameters
+    ----------
+    workflow : Workflow or str
+        The workflow or its spec file.
+    args : CmdArgs
+        The default resources of the steps (overriding the defaults of the workflow).
+    workers : int
+        The number of parallel sbatch calls per level.
+
+    Returns
+    -------
+    workflow : WorkflowRun
+        The recorded workflow with the job-ids of its steps.
+    """
+    if isinstance( workflow, str ):
+        workflow = Workflow.load( workflow )
+    levels = workflow.levels()
+    defaults = { name : getattr( args, name, None ) or workflow.resources.get( name ) for name in _resources }
+
+    jobids, submitted = {}, []
+    with ThreadPoolExecutor( max_workers = workers ) as pool:
+        for level in levels:
+            futures = [ ( step, pool.submit( _sbatch, step, jobids, step.args( defaults ) ) ) for step in level ]
+            errors = []
+            for step, future in futures:
+                try:
+                    jobids[ step.name ] = future.result()
+                    submitted.append( step )
+                except Exception as e:
+                    errors.append( e )
+            if errors:
+                _rollback( list( jobids.values() ) )
+                raise errors[0]
+
+    entry = ledger().record_workflow( workflow.name, [
+                    dict( step = step.name, jobid = jobids[ step.name ], script = shlex.split( step.script )[0],
+                          resources = resources( step.args( defaults ) ), after = step.after )
+                    for step in submitted
+                ] )
+    cache.invalidate()
+    return ledger().workflow( entry )
+
+def workflow_jobs( workflow = None ) -> dict:
+    """
+    Get the jobs of a submitted workflow.
+
+    Parameters
+    ----------
+    workflow : int or str
+        The id or name of the workflow. By default the last submitted workflow.
+
+    Returns
+    -------
+    jobs : dict
+        The `SlurmJob` objects of each step (all tasks of array jobs). Jobs that
+        neither scontrol nor sacct know (anymore) are missing.
+    """
+    from .info import SlurmJob, parse_record
+    from .history import history_records
+    from .pushdown import Selection
+    run = _recorded( workflow )
+    steps = { jobid : step for step, jobid in run.jobids.items() }
+
+    jobs = { step : [] for step in run.jobids }
+    def add( records ):
+        for record in records:
+            fields = parse_record( record )
+            step = steps.get( str( fields.get( "ArrayJobId" ) ) ) or steps.get( str( fields.get( "JobId" ) ) )
+            if step is not None:
+                jobs[ step ].append( SlurmJob.from_record( record ) )
+
+    add( Selection( f"id={','.join( steps )}", mine = False ).records() )
+    missing = [ jobid for jobid, step in steps.items() if not jobs[ step ] ]
+    if missing:
+        add( history_records( missing ) )
+    return jobs
+
+def workflow_status( workflow = None ) -> dict:
+    """
+    Get the states of the steps of a submitted workflow.
+
+    Parameters
+    ----------
+    workflow : int or str
+        The id or name of the workflow. By default the last submitted workflow.
+
+    Returns
+    -------
+    states : dict
+        The state of each step (e.g. `RUNNING`, or `3 COMPLETED, 2 RUNNING` for job arrays,
+        or `UNKNOWN` if the job is no longer known).
+    """
+    states = {}
+    for step, jobs in workflow_jobs( workflow ).items():
+        counts = {}
+        for job in jobs:
+            counts[ job.state ] = counts.get( job.state, 0 ) + 1
+        if not counts:
+            states[ step ] = "UNKNOWN"
+        elif len( jobs ) == 1:
+            states[ step ] = jobs[0].state
+        else:
+            states[ step ] = ", ".join( f"{n} {state}" for state, n in sorted( counts.items(), key = lambda i: -i[1] ) )
+    return states
+
+def cancel_workflow( workflow = None ) -> tuple:
+    """
+    Cancel all pending and running jobs of a submitted workflow.
+
+    Parameters
+    ----------
+    workflow : int or str
+        The id or name of the workflow. By default the last submitted workflow.
+
+    Returns
+    -------
+    killed : list
+        The ids of the jobs that were killed.
+    failed : dict
+        The ids of the jobs that could not be killed and the corresponding error messages.
+    """
+    from .kill import kill_jobs
+    from .pushdown import Selection
+    run = _recorded( workflow )
+    # only the jobs that are still pending or running can be cancelled
+    active = Selection( f"id={','.join( run.jobids.values() )}" ).jobids( all_states = False )
+    return kill_jobs( active )
+
+def _recorded( workflow ):
+    """
+    Get a recorded workflow (or raise a ValueError if it was not recorded).
+    """
+    run = ledger().workflow( workflow )
+    if run is None:
+        raise ValueError( "No workflow was submitted yet." if workflow is None else f"No workflow '{workflow}' was submitted." )
+    return run
+
+def _sbatch( step : Step, jobids : dict, args : CmdArgs ) -> str:
+    """
+    Submit a single step (after the steps it depends on were submitted).
+    """
+    options = [ "--parsable", *sbatch_options( args ) ]
+    if step.after:
+        options += [ f"--dependency={step.dependency( jobids )}", "--kill-on-invalid-dep=yes" ]
+    return parsable_jobid( runner.run( [ "sbatch", *options, *shlex.split( step.script ) ] ) )
+
+def _rollback( jobids : list ):
+    """
+    Cancel the already submitted steps of a workflow whose submission failed.
+    """
+    if jobids:
+        runner.run( [ "scancel", *jobids ] )
+        cache.invalidate()
@@ -2,6 +2,9 @@
 This is the main command line interface of slurmtools
 """
 import argparse
+import csv
+import sys
+from datetime import datetime
 from .__init__ import *
 
 
@@ -14,25 +17,83 @@ def setup_parser():
 
     # setup the CLI parser
     parser = argparse.ArgumentParser( description = description )
+    parser.add_argument( "--profile", help = "Report the number and wall time of the SLURM calls made by the command (per command, printed to stderr).", action = "store_true" )
     _command = parser.add_subparsers( dest = "command" )
 
     _new = _command.add_parser( 'new', help = 'Submit a new job' )
     _new.add_argument( "file", help = "The job file to submit including all additional arguments.", nargs = "+" )
 
+    _bulk = _command.add_parser( 'bulk', help = 'Submit many jobs at once (as a job array if possible)' )
+    _bulk.add_argument( "files", help = "The job files to submit (or the template file if --params is given).", nargs = "+" )
+    _bulk.add_argument( "--params", help = "A CSV file with one row of parameters per job to fill into the {{placeholders}} of a template job file.", default = None )
+    _bulk.add_argument( "--throttle", type = int, help = "The maximal number of array tasks running at the same time.", default = None )
+    _bulk.add_argument( "--no-array", dest = "array", action = "store_false", help = "Submit the jobs with separate (parallel) sbatch calls instead of a job array." )
+
+    _flow = _command.add_parser( 'flow', help = 'Submit a workflow of dependent jobs at once, or show or cancel a submitted one' )
+    _flow.add_argument( "action", help = "Submit a workflow spec, show the status of a submitted workflow, cancel its remaining jobs, or list the submitted workflows.", choices = [ "submit", "status", "cancel", "list" ] )
+    _flow.add_argument( "workflow", help = "The workflow spec (TOML or YAML) to submit, or the id or name of a submitted workflow (by default the last one).", nargs = "?", default = None )
+    _flow.add_argument( "--last", type = int, help = "The number of most recent workflows to list (default 10).", default = 10 )
+
+    _feed = _command.add_parser( 'feed', help = "Keep submitting a campaign of jobs while staying below the cluster's limit of queued jobs" )
+    _feed.add_argument( "name", help = "The name of the feeder. Run it again with only its name to resume it after an interruption." )
+    _feed.add_argument( "files", help = "The job files to submit (or the template file if --params is given).", nargs = "*" )
+    _feed.add_argument( "--list", dest = "listfile", help = "A file listing the job files to submit (one per line).", default = None )
+    _feed.add_argument( "--params", help = "A CSV file with one row of parameters per job to fill into the {{placeholders}} of a template job file.", default = None )
+    _feed.add_argument( "-l", "--limit", type = int, help = "The maximal number of your queued jobs and array tasks (default 1000).", default = 1000 )
+    _feed.add_argument( "--chunk", type = int, help = "The maximal number of jobs submitted at once (by default as many as there are free slots).", default = None )
+    _feed.add_argument( "-i", "--interval", type = float, help = "The number of seconds between two polls of the queue (default 60s).", default = 60 )
+    _feed.add_argument( "--throttle", type = int, help = "The maximal number of array tasks running at the same time.", default = None )
+    _feed.add_argument( "--no-array", dest = "array", action = "store_false", help = "Submit the jobs with separate (parallel) sbatch calls instead of job arrays." )
+    _feed.add_argument( "--status", action = "store_true", help = "Only show the progress of the feeder." )
+
+    _ledger = _command.add_parser( 'ledger', help = 'Show the jobs submitted via slurmtools' )
+    _ledger.add_argument( "-n", "--last", type = int, help = "The number of most recent submissions to show (default 10).", default = 10 )
+    _ledger.add_argument( "-s", "--script", help = "Only show the submissions of this job file.", default = None )
+
     _kill = _command.add_parser( 'kill', help = 'Kill a job' )
     _kill.add_argument( "jobid", help = "The job-id to kill, or 'all' to kill all jobs, or 'last' to kill the last submitted job.", default = None )
-    _kill.add_argument( "-p", "--pattern", help = "Kill all jobs matching a regex pattern in their name or id.", action = "store_true" )
+    _kill.add_argument( "-p", "--pattern", help = "Kill all jobs matching a query (e.g. 'state=PENDING name~^sweep_') or a regex pattern in their name or id.", action = "store_true" )
+    _kill.add_argument( "-s", "--state", help = "When killing 'all' jobs or jobs matching a pattern, only kill the jobs in this state (e.g. PENDING).", default = None )
+    _kill.add_argument( "--partition", help = "When killing jobs matching a pattern, only kill the jobs on this partition.", default = None )
     _kill.add_argument( "-c", "--clear", help = "Remove stdout and/or stderr of the killed job. Options are either just to remove stdout (s), or sdterr (e), or both (se).", choices = [ "s", "e", "se" ], default = None )
 
+    _clean = _command.add_parser( 'clean', help = 'Remove the stdout and stderr files of finished jobs' )
+    _clean.add_argument( "jobids", help = "The job-ids whose outputs to remove. By default all of your finished jobs are selected.", nargs = "*" )
+    _clean.add_argument( "-p", "--pattern", help = "Only remove the outputs of jobs matching a query (e.g. 'name~^sweep_') or a regex pattern in their name or id.", default = None )
+    _clean.add_argument( "--older-than", help = "Only remove the outputs of jobs that ended at least this long ago (e.g. 7d, 12h, or 30m).", default = None )
+    _clean.add_argument( "-s", "--state", help = "Only remove the outputs of jobs in these (comma separated) states (by default all finished states).", default = None )
+    _clean.add_argument( "-S", "--since", help = "The start of the time window searched in the accounting database (e.g. now-90days). By default the 30 days before --older-than.", default = None )
+    _clean.add_argument( "-c", "--clear", help = "Only remove stdout (s) or stderr (e). By default both are removed.", choices = [ "s", "e", "se" ], default = "se" )
+    _clean.add_argument( "-n", "--dry-run", help = "Only list the files that would be removed.", action = "store_true" )
+    _clean.add_argument( "-w", "--workers", type = int, help = "The number of files removed in parallel (default 32).", default = 32 )
+
     _info = _command.add_parser( 'info', help = 'Show job information' )
     _info.add_argument( "jobid", help = "The job-id, or 'all' for all jobs, or 'last' to select only last submitted job." )
     _info.add_argument( "-d","--details", help = "Show detailed job info. By default a shortened summary is shown.", action = "store_true" )
     _info.add_argument( "-a", "--all", help = "Show all jobs (including ones not from the user)", action = "store_true" )
-    _info.add_argument( "-p", "--pattern", help = "Show infos to jobs matching a regex pattern in their name or id.", action = "store_true" )
+    _info.add_argument( "-p", "--pattern", help = "Show infos to jobs matching a query (e.g. 'state=PENDING partition=long runtime>2h') or a regex pattern in their name or id.", action = "store_true" )
+    _info.add_argument( "-s", "--state", help = "When showing 'all' jobs or jobs matching a pattern, only show the jobs in these (comma separated) states (e.g. PENDING).", default = None )
+    _info.add_argument( "--partition", help = "When showing 'all' jobs or jobs matching a pattern, only show the jobs on these (comma separated) partitions.", default = None )
+    _info.add_argument( "--output", help = "Export the jobs as a table in this format instead of showing them.", choices = [ "csv", "parquet" ], default = None )
+    _info.add_argument( "--file", help = "The file to export the jobs to (required for parquet). By default CSV is printed.", default = None )
+
+    _history = _command.add_parser( 'history', help = 'Show finished jobs from the SLURM accounting database' )
+    _history.add_argument( "jobids", help = "The job-ids to show. By default all jobs in the time window are shown.", nargs = "*" )
+    _history.add_argument( "-S", "--since", help = "The start of the time window (e.g. 2024-01-31T12:00 or now-2days). By default jobs since midnight are shown.", default = None )
+    _history.add_argument( "-E", "--until", help = "The end of the time window.", default = None )
+    _history.add_argument( "-d","--details", help = "Show detailed job info. By default a shortened summary is shown.", action = "store_true" )
+    _history.add_argument( "-a", "--all", help = "Show all jobs (including ones not from the user)", action = "store_true" )
+    _history.add_argument( "--output", help = "Export the jobs as a table in this format instead of showing them.", choices = [ "csv", "parquet" ], default = None )
+    _history.add_argument( "--file", help = "The file to export the jobs to (required for parquet). By default CSV is printed.", default = None )
 
     _read = _command.add_parser( 'read', help = "Read a job's stdout or stderr" )
     _read.add_argument( "-o", "--stdout", action  = 'store_true', help = "Read the stdout of the job (default)", default = None )
     _read.add_argument( "-e", "--stderr", action  = 'store_true', help = "Read the stderr of the job", default = False )
+    _read.add_argument( "--head", type = int, help = "Only read the first N lines (or bytes).", default = None )
+    _read.add_argument( "--tail", type = int, help = "Only read the last N lines (or bytes).", default = None )
+    _read.add_argument( "--range", type = _range, help = "Only read a range of lines (or bytes) given as START:END (either may be omitted).", default = None )
+    _read.add_argument( "-b", "--bytes", action = "store_true", help = "Interpret --head, --tail, and --range as bytes rather than lines." )
+    _read.add_argument( "-f", "--follow", action = "store_true", help = "Keep printing new output while the job is running." )
     _read.add_argument( "jobid", help = "The job-id whose stdout or stderr to read, or 'last' to read from the last submitted job." )
 
     _interactive = _command.add_parser( 'session', help = 'Start an interactive session' )
@@ -46,7 +107,7 @@ def setup_parser():
     srun_command.add_argument( "-r", "--R", help = "Activate an R terminal session.", action = "store_true", default = False )
     srun_command.add_argument( "-cmd", "--command", dest = "srun_cmd", help = "The command to run in the srun session. By default 'bash' is used.", default = "bash" )
 
-    for p in ( _new, _interactive ) :
+    for p in ( _new, _bulk, _feed, _flow, _interactive ) :
         p.add_argument( "-t", "--time", help = "The time limit of the job.", default = None )
         p.add_argument( "-n", "--nodes", type = int, help = "The number of nodes to use.", default = None )
         p.add_argument( "-c", "--cores", type = int, help = "The number of cores (CPUs) to use.", default = None )
@@ -56,15 +117,89 @@ def setup_parser():
     _queue = _command.add_parser( 'queue', help = 'Show the queue' )
     _queue.add_argument( "-a", "--all", action = "store_true", help = "Show all jobs. By default only the user's jobs are shown.", default = False )
     _queue.add_argument( "-v", "--view", action = "store_true", help = "Keep the queue open as a self-refreshing view" )
-    _queue.add_argument( "-t", "--time", type = int, help = "The number of seconds to wait between refreshs (default = 5s)", default = 5 )
+    _queue.add_argument( "-t", "--time", type = int, help = "The minimal number of seconds to wait between refreshs (default = 5s). While the queue does not change, the interval grows up to --max-time.", default = 5 )
+    _queue.add_argument( "--max-time", type = int, help = "The maximal number of seconds to wait between refreshs (default = 60s)", default = 60 )
     _queue.add_argument( "-n", "--njobs", type = int, help = "The number of jobs to show at once. Default is 20. The window is scrollable.", default = 20 )
+    _queue.add_argument( "-s", "--state", help = "Only show the jobs in these (comma separated) states (e.g. PENDING).", default = None )
+    _queue.add_argument( "--partition", help = "Only show the jobs on these (comma separated) partitions.", default = None )
+    _queue.add_argument( "--output", help = "Export the queue as a table in this format instead of showing it.", choices = [ "csv", "parquet" ], default = None )
+    _queue.add_argument( "--file", help = "The file to export the queue to (required for parquet). By default CSV is printed.", default = None )
+
+    _agent = _command.add_parser( 'agent', help = 'Start or stop the background agent that polls SLURM once for all slurmtools processes of the user' )
+    _agent.add_argument( "action", help = "Start the agent in the background, stop it, show its status, or run it in the foreground.", choices = [ "start", "stop", "status", "run" ] )
+    _agent.add_argument( "-i", "--interval", type = float, help = "The number of seconds between two polls of SLURM (default 5s).", default = 5 )
+    _agent.add_argument( "--keep", type = float, help = "The number of seconds a snapshot keeps being polled after it was last requested (default 300s).", default = 300 )
     return parser
 
-def main():
+def _range( value : str ) -> tuple:
+    """
+    Parse the `--range` argument (`START:END`, either may be omitted) into a (start, end) tuple.
+    """
+    bounds = value.split( ":" )
+    try:
+        if len( bounds ) != 2:
+            raise ValueError()
+        return tuple( int(i) if i.strip() else None for i in bounds )
+    except ValueError:
+        raise argparse.ArgumentTypeError( f"Invalid range '{value}'. Use START:END with integers (either may be omitted, e.g. 100:200 or :50)." )
+
+def _export( jobs, args ):
+    """
+    Export jobs in the format of the `--output` argument, either to the `--file` or printed (CSV only).
+    """
+    if jobs is None:
+        return
+    if args.output == "parquet" and not args.file:
+        print( "Exporting to parquet requires a file. Use '--file' to specify one." )
+        return
+    try:
+        out = export( jobs, args.output, args.file )
+    except ImportError as e:
+        print( e )
+        return
+    if out is not None:
+        sys.stdout.write( out )
+
+def main( argv : list = None ):
+    """
+    Run the slurmtools CLI.
+
+    Parameters
+    ----------
+    argv : list
+        The command line arguments (without the program name).
+        By default `sys.argv[1:]` is used.
+    """
 
     # setup the args by default
     parser = setup_parser()
-    args = parser.parse_args()
+    args = parser.parse_args( argv )
+
+    try:
+        if not args.profile:
+            run_command( args )
+            return
+
+        # record all SLURM calls of the command and report them per command
+        with profile() as calls:
+            try:
+                run_command( args )
+            finally:
+                print( calls.table(), file = sys.stderr )
+
+    except TimeoutError as e:
+        print( f"SLURM did not respond: {e}", file = sys.stderr )
+        sys.exit( 1 )
+
+def run_command( args ):
+    """
+    Run a CLI command.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
 
     # ----------------------------------------------------
     # New Job Submission
@@ -75,6 +210,96 @@ def main():
         newjob = submit( args.file, args )
         print( f"New job submitted with id {newjob}" )
 
+    # ----------------------------------------------------
+    # Bulk Job Submission
+    # ----------------------------------------------------
+    if args.command == "bulk" :
+
+        if args.params:
+            with open( args.params, "r" ) as f:
+                params = list( csv.DictReader( f ) )
+            newjobs = submit_template( args.files[0], params, args, throttle = args.throttle, array = args.array )
+        else:
+            newjobs = submit_many( args.files, args, throttle = args.throttle, array = args.array )
+        print( f"{len(newjobs)} new jobs submitted with ids {', '.join( newjobs )}" )
+
+    # ----------------------------------------------------
+    # Throttled Submission Feeder
+    # ----------------------------------------------------
+    if args.command == "feed" :
+
+        files = args.files
+        if args.listfile:
+            with open( args.listfile, "r" ) as f:
+                files = files + [ i.strip() for i in f if i.strip() ]
+        if args.params:
+            with open( args.params, "r" ) as f:
+                params = list( csv.DictReader( f ) )
+            files = render_template( files[0], params )
+
+        try:
+            feeder = Feeder( args.name, files or None, limit = args.limit, chunk = args.chunk, args = args, array = args.array, throttle = args.throttle )
+        except ( FileNotFoundError, FileExistsError ) as e:
+            print( e )
+            return
+        if not args.status:
+            try:
+                feeder.run( interval = args.interval, verbose = True )
+            except KeyboardInterrupt:
+                print( f"Feeder interrupted. Resume it via 'slurmtools feed {args.name}'." )
+        status = feeder.status()
+        print( f"Feeder '{args.name}': {status['submitted']} of {status['total']} jobs submitted, {status['remaining']} remaining, {status['failed']} failed" )
+
+    # ----------------------------------------------------
+    # Workflows
+    # ----------------------------------------------------
+    if args.command == "flow" :
+
+        if args.action == "submit":
+            if not args.workflow:
+                print( "Submitting a workflow requires a workflow spec file." )
+                return
+            run = submit_workflow( args.workflow, args )
+            print( f"Workflow '{run.name}' submitted with id {run.id}" )
+            for step, jobid in run.jobids.items():
+                print( f"  {step:<20} {jobid}" )
+
+        elif args.action == "list":
+            for run in ledger().workflows( args.last ):
+                submitted = datetime.fromtimestamp( run.submitted ).strftime( "%Y-%m-%d %H:%M:%S" )
+                print( f"{submitted}  {run.id:<6} {run.name} ({len( run.jobids )} steps)" )
+
+        elif args.action == "status":
+            run = ledger().workflow( args.workflow )
+            if run is None:
+                print( "No such workflow was submitted via slurmtools." )
+                return
+            states = workflow_status( run.id )
+            print( f"Workflow '{run.name}' (id {run.id})" )
+            for step, jobid in run.jobids.items():
+                after = ", ".join( f"{kind}:{i}" for i, kind in run.after[ step ].items() )
+                print( f"  {step:<20} {jobid:<12} {states[ step ]:<20} {after}" )
+
+        else:
+            if ledger().workflow( args.workflow ) is None:
+                print( "No such workflow was submitted via slurmtools." )
+                return
+            cancel_workflow( args.workflow )
+
+    # ----------------------------------------------------
+    # Submission Ledger
+    # ----------------------------------------------------
+    if args.command == "ledger" :
+
+        if args.script:
+            submissions = ledger().by_script( args.script )[ :args.last ]
+        else:
+            submissions = ledger().last_n( args.last )
+        for i in submissions:
+            submitted = datetime.fromtimestamp( i.submitted ).strftime( "%Y-%m-%d %H:%M:%S" )
+            cancelled = " (cancelled)" if i.cancelled else ""
+            print( f"{submitted}  {i.jobid:<12} {i.script}{cancelled}" )
+
     # ----------------------------------------------------
     # Kill Jobs
     # ----------------------------------------------------
@@ -88,26 +313,52 @@ def main():
                 }
         clear = clear[ args.clear ]
         if args.pattern:
-            kill_by_pattern( args.jobid, *clear )
+            kill_by_pattern( args.jobid, *clear, states = args.state, partition = args.partition )
         else:
             last = args.jobid == "last"
             all = args.jobid == "all"
-            kill_job( args.jobid, all, last, *clear )
+            kill_job( args.jobid, all, last, *clear, state = args.state )
+
+    # ----------------------------------------------------
+    # Remove Job Outputs
+    # ----------------------------------------------------
+    if args.command == "clean" :
+
+        from .func_api.clean import clean, format_bytes
+        try:
+            report = clean( args.jobids or None, args.pattern, args.older_than, args.state, args.since,
+                            stdout = "s" in args.clear, stderr = "e" in args.clear, dry_run = args.dry_run, workers = args.workers )
+        except ValueError as e:
+            print( e )
+            return
+        if args.dry_run:
+            for path in report["removed"]:
+                print( path )
+        for path, msg in report["failed"].items():
+            print( f"Could not remove {path}: {msg}" )
+        action = "Would remove" if args.dry_run else "Removed"
+        print( f"{action} {report['files']} files of {report['jobs']} jobs ({format_bytes( report['bytes'] )}), {report['missing']} files were already gone" )
 
     # ----------------------------------------------------
     # Show Job Information
     # ----------------------------------------------------
     if args.command == "info" :
-        
+
+        select = dict( mine = not args.all, states = args.state, partition = args.partition )
+        if args.output and ( args.pattern or args.jobid == "all" ):
+            raw = info_by_pattern( args.jobid, raw = True, **select ) if args.pattern else show_all( raw = True, **select )
+            _export( raw, args )
+            return
+
         if args.pattern:
-            raw = info_by_pattern( args.jobid, mine = not args.all, raw = args.details )
+            raw = info_by_pattern( args.jobid, raw = args.details, **select )
             if not args.details:
                 raw = "\n\n".join( [ i._make_summary() for i in raw ] )
             print( raw )
             return            
 
         if args.jobid == "all":
-            raw = show_all( mine = not args.all, raw = args.details )
+            raw = show_all( raw = args.details, **select )
             if not args.details:
                 raw = "\n\n".join( [ i._make_summary() for i in raw ] )
             print( raw )
@@ -121,6 +372,10 @@ def main():
                 print( "No last job was found. Make sure that you submit jobs using 'slurmtools new' because 'sbatch' submitted jobs are not recorded!" )
                 return
 
+        if args.output:
+            _export( raw_job_info( jobid ), args )
+            return
+
         if args.details:
             raw = raw_job_info( jobid )
         else:
@@ -129,16 +384,54 @@ def main():
        
         print( raw )
         
+    # ----------------------------------------------------
+    # Show Finished Jobs
+    # ----------------------------------------------------
+    if args.command == "history" :
+
+        if args.output:
+            _export( history( jobids = args.jobids or None, start = args.since, end = args.until, mine = not args.all, raw = True ), args )
+            return
+
+        jobs = history( jobids = args.jobids or None, start = args.since, end = args.until, mine = not args.all, raw = args.details )
+        if not args.details:
+            jobs = "\n\n".join( [ i._make_summary() for i in jobs ] )
+        print( jobs )
+
     # ----------------------------------------------------
     # Show Queue
     # ----------------------------------------------------
     if args.command == "queue" :
 
-        if not args.view:
-            raw = queue( all = args.all )
+        select = dict( all = args.all, states = args.state, partition = args.partition )
+        if args.output:
+            _export( snapshot( **select ), args )
+        elif not args.view:
+            raw = queue( **select )
             print( raw )
         else:
-            view_queue( all = args.all, refresh = args.time, n = args.njobs )
+            view_queue( refresh = args.time, max_refresh = args.max_time, n = args.njobs, **select )
+
+    # ----------------------------------------------------
+    # Background Agent
+    # ----------------------------------------------------
+    if args.command == "agent" :
+
+        from .func_api import agent
+        if args.action == "run":
+            agent.Agent( interval = args.interval, keep = args.keep ).serve()
+        elif args.action == "start":
+            started = agent.start( interval = args.interval, keep = args.keep )
+            print( f"Agent started (serving at {agent.socket_path()})" if started else "The agent is already running" )
+        elif args.action == "stop":
+            print( "Agent stopped" if agent.stop() else "The agent is not running" )
+        else:
+            status = agent.status()
+            if status is None:
+                print( "The agent is not running" )
+            else:
+                started = datetime.fromtimestamp( status["started"] ).strftime( "%Y-%m-%d %H:%M:%S" )
+                print( f"The agent is running (pid {status['pid']}, since {started}, polling every {status['interval']}s, {status['snapshots']} snapshots)" )
 
     # ----------------------------------------------------
     # Interactive srun Session
@@ -178,12 +471,23 @@ def main():
                 print( "No last job was found. Make sure that you submit jobs using 'slurmtools new' because 'sbatch' submitted jobs are not recorded!" )
                 return
     
+        options = dict( 
+                        head = args.head, 
+                        tail = args.tail, 
+                        window = args.range, 
+                        unit = "bytes" if args.bytes else "lines", 
+                        follow = args.follow,
+                    )
+
+        # the outputs are streamed in chunks so that large logs are never loaded at once
         if args.stdout or ( args.stdout is None and not args.stderr ):
-            raw = read_stdout( jobid )
-            print( raw )
+            for chunk in iter_stdout( jobid, **options ):
+                sys.stdout.write( chunk )
+                sys.stdout.flush()
         if args.stderr:
-            raw = read_stderr( jobid )
-            print( raw )
+            for chunk in iter_stderr( jobid, **options ):
+                sys.stdout.write( chunk )
+                sys.stdout.flush()
 
 
 
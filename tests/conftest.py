@@ -0,0 +1,46 @@
+"""
+Fixtures of the tests that run slurmtools against the SLURM stand-in of `benchmarks/fakeslurm.py`.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "benchmarks" ) )
+
+import fakeslurm
+
+import slurmtools.func_api.ledger
+
+@pytest.fixture
+def cluster( tmp_path, monkeypatch ):
+    """
+    A fresh simulated cluster (with 200 jobs in arrays of up to 10 tasks, about half of them of the current user) that slurmtools is pointed at,
+    with a data directory (ledger, feeder checkpoints) and runtime directory (cache) of its own.
+    """
+    bindir = fakeslurm.create( str( tmp_path / "cluster" ), jobs = 200, array_size = 10, seed = 1 )
+    monkeypatch.setenv( "SLURMTOOLS_SLURM_BIN", bindir )
+    monkeypatch.setenv( "PATH", os.pathsep.join( [ bindir, os.environ.get( "PATH", "" ) ] ) )
+    monkeypatch.setenv( "SLURMTOOLS_DATA_DIR", str( tmp_path / "data" ) )
+    monkeypatch.setenv( "SLURMTOOLS_RUNTIME_DIR", str( tmp_path / "runtime" ) )
+    monkeypatch.delenv( "SLURMTOOLS_CACHE_TTL", raising = False )
+    # the default ledger is opened on first use (in the data directory of the test)
+    monkeypatch.setattr( sys.modules["slurmtools.func_api.ledger"], "_ledger", [ None ] )
+    return fakeslurm.Cluster( str( tmp_path / "cluster" ) )
+
+@pytest.fixture
+def job_files( tmp_path ):
+    """
+    Write n job files (into `tmp_path/jobs`) and get their paths.
+    """
+    def write( n : int, directives : str = "", name : str = "task" ) -> list:
+        directory = tmp_path / "jobs"
+        directory.mkdir( exist_ok = True )
+        files = []
+        for i in range( n ):
+            path = directory / f"{name}_{i}.slurm"
+            path.write_text( f"#!/bin/bash\n#SBATCH --time=00:10:00\n{directives}echo {i}\n" )
+            files.append( str( path ) )
+        return files
+    return write
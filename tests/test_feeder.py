@@ -0,0 +1,58 @@
+"""
+Tests of feeding campaigns of jobs (slurmtools.func_api.feeder), against the SLURM stand-in.
+"""
+
+import time
+
+import pytest
+
+from slurmtools.func_api import Feeder, ledger, profile
+
+def test_chunks_are_split_into_arrays_of_at_most_max_array_size( cluster, job_files ):
+    cluster.set_meta( max_array_size = 3 )
+    feeder = Feeder( "campaign", job_files( 7 ), limit = 10000 )
+    with profile() as calls:
+        assert feeder.feed( 7 ) == 7
+    commands = [ call.cmd for call in calls.calls ]
+    assert sum( i.startswith( "scontrol show config" ) for i in commands ) == 1
+    assert sum( i.startswith( "sbatch" ) for i in commands ) == 3
+    assert len( { i.array_id for i in ledger().last_n( 7 ) } ) == 3
+    assert feeder.done and feeder.status()["submitted"] == 7
+
+def test_the_limit_is_kept( cluster, job_files ):
+    feeder = Feeder( "campaign", job_files( 5 ), limit = 10000 )
+    feeder.limit = feeder.queued() + 2
+    free = feeder.limit - feeder.queued()
+    assert feeder.feed( free ) == 2
+    assert feeder.limit - feeder.queued() == 0
+    assert feeder.remaining == 3
+
+def test_resume_from_the_checkpoint( cluster, job_files ):
+    files = job_files( 5 )
+    feeder = Feeder( "campaign", files, limit = 10000, array = False )
+    feeder.feed( 2 )
+    with pytest.raises( FileExistsError ):
+        Feeder( "campaign", files )
+    resumed = Feeder( "campaign" )
+    assert ( resumed.next, resumed.submitted, resumed.remaining ) == ( 2, 2, 3 )
+    resumed.feed( 10 )
+    assert resumed.done and resumed.submitted == 5
+    assert sorted( i.script for i in ledger().last_n( 5 ) ) == files
+
+def test_an_interrupted_chunk_is_reconciled_with_the_ledger( cluster, job_files ):
+    files = job_files( 4 )
+    feeder = Feeder( "campaign", files, limit = 10000, array = False )
+    # the feeder was killed while submitting files 0 and 1, and only the sbatch call of file 0 returned
+    feeder.next = 2
+    feeder.inflight = { "indices" : [ 0, 1 ], "since" : time.time() }
+    feeder.checkpoint()
+    ledger().record( "1", files[0] )
+    resumed = Feeder( "campaign" )
+    assert resumed.inflight is None
+    assert ( resumed.submitted, resumed.retry, resumed.remaining ) == ( 1, [ 1 ], 3 )
+    resumed.feed( 10 )
+    assert resumed.done and sorted( i.script for i in ledger().last_n( 3 ) ) == files[1:]
+
+def test_run( cluster, job_files ):
+    feeder = Feeder( "campaign", job_files( 6 ), limit = 10000, chunk = 4 )
+    assert feeder.run( interval = 0.01 ) == { "total" : 6, "submitted" : 6, "remaining" : 0, "failed" : 0 }
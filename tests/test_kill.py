@@ -0,0 +1,32 @@
+"""
+Tests of killing jobs (slurmtools.func_api.kill), against the SLURM stand-in.
+"""
+
+import os
+
+from slurmtools.func_api import SlurmJob, kill_jobs, submit_many
+
+def test_kill_jobs_and_clear_their_outputs( cluster, job_files, tmp_path, capsys ):
+    files = job_files( 3, f"#SBATCH --output={tmp_path}/out_%j.log\n", name = "logged" )
+    jobids = submit_many( files, array = False )
+    outputs = [ SlurmJob( i ).stdout for i in jobids ]
+    for path in outputs[:2]:
+        with open( path, "w" ) as f:
+            f.write( "output\n" )
+    # the output of the last job cannot be removed
+    os.makedirs( outputs[2] )
+
+    killed, failed = kill_jobs( jobids, clear_stdout = True )
+    assert sorted( killed ) == sorted( jobids ) and not failed
+    assert not any( os.path.isfile( i ) for i in outputs )
+    out = capsys.readouterr().out
+    assert "Killed 3 of 3 jobs, cleared the outputs of 2" in out
+    assert f"Could not clear the output of job {jobids[2]}: " in out
+    assert all( state == "CANCELLED" for state in [ SlurmJob( i ).state for i in jobids ] )
+
+def test_jobs_that_cannot_be_killed_are_reported( cluster, job_files, capsys ):
+    jobids = submit_many( job_files( 1 ), array = False )
+    killed, failed = kill_jobs( jobids + [ "999999999" ] )
+    assert killed == jobids and list( failed ) == [ "999999999" ]
+    out = capsys.readouterr().out
+    assert "Killed 1 of 2 jobs" in out and "Could not kill job 999999999: " in out
@@ -0,0 +1,59 @@
+"""
+Tests of pushing job filters down to squeue (slurmtools.func_api.pushdown), against the SLURM stand-in.
+"""
+
+import asyncio
+import getpass
+
+import pytest
+
+from slurmtools.func_api import AsyncSlurmClient, pushdown, profile, show_all
+from slurmtools.func_api.info import parse_record
+from slurmtools.func_api.pushdown import Selection, scontrol_batches
+
+def all_jobs() -> list:
+    return [ job.fields for job in show_all( mine = False ) ]
+
+def test_squeue_args():
+    selection = Selection( "state=PENDING partition=long runtime>2h", mine = False )
+    assert selection.squeue_args() == [ "--states=PENDING", "--partition=long" ]
+    assert [ i.field for i in selection.residual.conditions ] == [ "RunTime" ]
+
+def test_mine_runs_squeue_then_scontrol( cluster ):
+    with profile() as calls:
+        records = Selection( mine = True ).records()
+    commands = [ call.cmd.split()[0] for call in calls.calls ]
+    assert commands == [ "squeue", "scontrol" ]
+    assert "show job -dd " in calls.calls[1].cmd
+    expected = [ i for i in all_jobs() if i["UserId"].split( "(" )[0] == getpass.getuser() ]
+    assert len( records ) == len( expected ) > 0
+
+def test_records_are_fetched_in_batches( cluster, monkeypatch ):
+    monkeypatch.setattr( pushdown, "_batch", 10 )
+    jobids = Selection( mine = True ).jobids()
+    with profile() as calls:
+        records = Selection( mine = True ).records()
+    # array tasks whose ids are in different batches are listed by each of them
+    assert sorted( parse_record( i )["JobId"] for i in records ) == sorted( int(i) for i in jobids )
+    assert sum( call.cmd.startswith( "scontrol" ) for call in calls.calls ) == len( scontrol_batches( jobids ) ) == -( -len( jobids ) // 10 )
+
+def test_without_filters_the_whole_dump_is_read( cluster ):
+    with profile() as calls:
+        records = Selection( mine = False ).records()
+    assert [ call.cmd for call in calls.calls ] == [ "scontrol show job -dd" ]
+    assert len( records ) == len( all_jobs() )
+
+@pytest.mark.parametrize( "states", [ "R", "r", "running", "RUNNING" ] )
+def test_state_codes( cluster, states ):
+    expected = sorted( i["JobId"] for i in all_jobs() if i["JobState"] == "RUNNING" )
+    assert sorted( job.id for job in show_all( mine = False, states = states ) ) == expected
+
+def test_residual_query( cluster ):
+    records = Selection( "state=RUNNING numnodes>1", mine = False ).records()
+    assert records and all( "JobState=RUNNING" in i for i in records )
+    assert all( int( parse_record( i )["NumNodes"] ) > 1 for i in records )
+
+def test_async_show_all_agrees( cluster, monkeypatch ):
+    monkeypatch.setattr( pushdown, "_batch", 10 )
+    jobs = asyncio.run( AsyncSlurmClient().show_all( mine = True ) )
+    assert sorted( job.id for job in jobs ) == sorted( job.id for job in show_all( mine = True ) )
@@ -0,0 +1,168 @@
+"""
+Tests of the job query language (slurmtools.func_api.query).
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from slurmtools.func_api.info import parse_record
+from slurmtools.func_api.query import Query, compile_query, extract, state_name
+from slurmtools.func_api.timeparse import span_seconds
+
+def record( jobid = 1001, name = "sweep_1", user = "alice(1000)", account = "lab", state = "RUNNING",
+            partition = "long", runtime = "02:30:00", nodes = "1", exit = "0:0", end = "Unknown" ):
+    return (
+                f"JobId={jobid} JobName={name}\n"
+                f"   UserId={user} GroupId=lab(100) MCS_label=N/A\n"
+                f"   Priority=100 Nice=0 Account={account} QOS=normal\n"
+                f"   JobState={state} Reason=None Dependency=(null)\n"
+                f"   RunTime={runtime} TimeLimit=1-00:00:00 TimeMin=N/A\n"
+                f"   SubmitTime=2024-01-30T10:00:00 EligibleTime=2024-01-30T10:00:00\n"
+                f"   StartTime=2024-01-30T10:05:00 EndTime={end} Deadline=N/A\n"
+                f"   Partition={partition} AllocNode:Sid=login:1\n"
+                f"   NumNodes={nodes} NumCPUs=4 NumTasks=1 CPUs/Task=4\n"
+                f"   ExitCode={exit}\n"
+                f"   StdOut=/home/alice/sweep_{jobid}.out\n"
+            )
+
+def test_compile_query_returns_compiled_queries():
+    query = compile_query( "state=RUNNING" )
+    assert isinstance( query, Query )
+    assert compile_query( query ) is query
+
+def test_aliases():
+    query = Query( "id=1 name=a user=alice account=lab state=RUNNING runtime>1h numnodes>1" )
+    fields = [ i.field for i in query.conditions ]
+    assert sorted( fields ) == sorted( [ "JobId", "JobName", "UserId", "Account", "JobState", "RunTime", "NumNodes" ] )
+
+@pytest.mark.parametrize( "query, expected", [
+                                ( "state=RUNNING", True ),
+                                ( "state=PENDING,RUNNING", True ),
+                                ( "state=PENDING", False ),
+                                ( "state!=PENDING", True ),
+                                ( "name~^sweep_", True ),
+                                ( "name!~^sweep_", False ),
+                                ( "partition=long state=RUNNING", True ),
+                                ( "partition=long state=PENDING", False ),
+                                ( "id=1001", True ),
+                                ( "id>1001", False ),
+                                ( "cores>=4", True ),
+                                ( "exit=0", True ),
+                            ] )
+def test_match_record( query, expected ):
+    assert Query( query ).match_record( record() ) is expected
+
+def test_match_fields_agrees_with_match_record():
+    for query in ( "state=RUNNING", "runtime>2h", "name~sweep", "user=alice", "numnodes>1" ):
+        query = Query( query )
+        assert query.match_fields( parse_record( record() ) ) is query.match_record( record() )
+
+def test_user_matches_the_user_and_not_the_account():
+    assert Query( "user=alice" ).match_record( record() )
+    assert not Query( "user=lab" ).match_record( record() )
+    assert Query( "account=lab" ).match_record( record() )
+    assert not Query( "user=ali" ).match_record( record() )
+    assert Query( "user!=bob" ).match_record( record() )
+
+def test_user_matches_sacct_records_without_uid():
+    assert Query( "user=alice" ).match_record( record( user = "alice" ) )
+
+@pytest.mark.parametrize( "query, expected", [
+                                ( "runtime>2h", True ),
+                                ( "runtime>3h", False ),
+                                ( "runtime<=150m", True ),
+                                ( "runtime>0-02:00:00", True ),
+                                ( "limit=1d", True ),
+                            ] )
+def test_durations( query, expected ):
+    assert Query( query ).match_record( record() ) is expected
+
+def test_undefined_durations_match_no_comparison():
+    assert not Query( "runtime>0s" ).match_record( record( runtime = "INVALID" ) )
+
+def test_timestamps():
+    assert Query( "submit<2024-01-31" ).match_record( record() )
+    assert Query( "submit>now-1d" ).match_record( record() ) is False
+    # a job that has not ended yet matches no comparison of its end time
+    assert not Query( "end<now" ).match_record( record() )
+    assert Query( "end<now" ).match_record( record( end = "2024-01-30T11:00:00" ) )
+
+@pytest.mark.parametrize( "query", [ "numnodes>1", "numnodes<3", "numnodes>=1", "numnodes=2" ] )
+def test_non_integer_values_of_int_fields_do_not_match( query ):
+    # e.g. the requested node range of a pending job
+    assert not Query( query ).match_record( record( nodes = "1-2" ) )
+    assert not Query( query ).match_fields( parse_record( record( nodes = "1-2" ) ) )
+
+def test_non_integer_values_of_int_fields_are_not_equal():
+    assert Query( "numnodes!=2" ).match_record( record( nodes = "1-2" ) )
+
+def test_invalid_values():
+    with pytest.raises( ValueError ):
+        Query( "numnodes>two" )
+    with pytest.raises( ValueError ):
+        Query( "runtime>soon" )
+
+def test_missing_fields():
+    assert not Query( "Reservation=x" ).match_record( record() )
+    assert Query( "Reservation!=x" ).match_record( record() )
+    assert not Query( "Reservation~x" ).match_record( record() )
+    assert Query( "Reservation!~x" ).match_record( record() )
+
+def test_quoted_values():
+    assert Query( "name='my job'" ).match_record( record( name = "my job" ) )
+
+def test_regex_pattern():
+    query = Query( "^sweep_" )
+    assert query.pattern is not None and not query.conditions
+    assert query.match_record( record() )
+    assert Query( "^100" ).match_record( record() )
+    assert not Query( "^other" ).match_record( record() )
+
+def test_filter_records():
+    records = [ record( jobid = 1, state = "PENDING" ), record( jobid = 2 ), record( jobid = 3, state = "PENDING" ) ]
+    assert [ extract( i, "JobId" ) for i in Query( "state=PENDING" ).filter_records( records ) ] == [ 1, 3 ]
+
+def test_without():
+    query = Query( "state=RUNNING runtime>2h" )
+    exact = [ i for i in query.conditions if i.field == "JobState" ]
+    residual = query.without( exact )
+    assert [ i.field for i in residual.conditions ] == [ "RunTime" ]
+    assert residual.match_record( record() )
+    assert query.without( query.conditions ) is None
+    pattern = Query( "^sweep_" )
+    assert pattern.without( [] ) is pattern
+
+def test_extract():
+    assert extract( record(), "JobId" ) == 1001
+    assert extract( record(), "JobName" ) == "sweep_1"
+    assert extract( record(), "NumNodes" ) == 1
+    assert extract( record(), "ExitCode" ) == 0
+    assert extract( record(), "Dependency" ) is None
+    assert extract( record(), "Missing" ) is None
+    # keys that end with another key are not confused with it
+    assert extract( record(), "Id" ) is None
+
+@pytest.mark.parametrize( "state", [ "RUNNING", "running", "R", "r", "PD,R" ] )
+def test_state_codes_and_case( state ):
+    assert Query( f"state={state}" ).match_record( record() )
+    assert Query( f"state={state}" ).match_fields( parse_record( record() ) )
+    assert not Query( f"state!={state}" ).match_record( record() )
+
+def test_state_name():
+    assert state_name( "pd" ) == "PENDING"
+    assert state_name( "CG" ) == "COMPLETING"
+    assert state_name( "out_of_memory" ) == "OUT_OF_MEMORY"
+
+@pytest.mark.parametrize( "partition, expected", [ ( "long", True ), ( "short", True ), ( "gpu", False ), ( "gpu,short", True ) ] )
+def test_jobs_on_several_partitions( partition, expected ):
+    assert Query( f"partition={partition}" ).match_record( record( partition = "long,short" ) ) is expected
+    assert Query( f"partition!={partition}" ).match_record( record( partition = "long,short" ) ) is not expected
+
+@pytest.mark.parametrize( "value, expected", [
+                                ( "90s", 90 ), ( "30m", 1800 ), ( "1.5h", 5400 ), ( "7d", 604800 ),
+                                ( "1-00:00:00", 86400 ), ( "02:30:00", 9000 ), ( 60, 60 ), ( timedelta( hours = 1 ), 3600 ),
+                                ( "soon", None ), ( "1.2.3h", None ),
+                            ] )
+def test_span_seconds( value, expected ):
+    assert span_seconds( value ) == expected
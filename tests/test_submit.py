@@ -0,0 +1,59 @@
+"""
+Tests of submitting many jobs (slurmtools.func_api.submit), against the SLURM stand-in.
+"""
+
+import getpass
+import glob
+import os
+
+import pytest
+
+from slurmtools.func_api import ledger, profile, submit_many
+from slurmtools.func_api.submit import can_submit_array, submit_array
+
+def drivers( files : list ) -> list:
+    return glob.glob( os.path.join( os.path.dirname( files[0] ), "*.array.slurm" ) )
+
+def test_files_with_the_same_directives_are_submitted_as_an_array( cluster, job_files ):
+    files = job_files( 5 )
+    with profile() as calls:
+        jobids = submit_many( files )
+    assert sum( call.cmd.startswith( "sbatch" ) for call in calls.calls ) == 1
+    array_id = jobids[0].split( "_" )[0]
+    assert jobids == [ f"{array_id}_{i}" for i in range( 5 ) ]
+    assert len( cluster.jobs( "array_job_id = ?", ( int( array_id ), ) ) ) == 5
+    assert [ i.script for i in reversed( ledger().last_n( 5 ) ) ] == files
+    assert all( i.array_id == int( array_id ) for i in ledger().last_n( 5 ) )
+    assert not drivers( files )
+
+def test_files_with_different_directives_are_submitted_one_by_one( cluster, job_files ):
+    files = job_files( 2 ) + job_files( 1, "#SBATCH --mem=4G\n", name = "large" )
+    assert not can_submit_array( files )
+    with profile() as calls:
+        jobids = submit_many( files )
+    assert sum( call.cmd.startswith( "sbatch" ) for call in calls.calls ) == len( files )
+    assert sorted( ledger().by_jobids( jobids ) ) == sorted( jobids )
+
+def test_failed_submissions_are_reported( cluster, job_files ):
+    files = job_files( 1, "#SBATCH --mem=4G\n", name = "large" ) + job_files( 2 )
+    queued = len( cluster.jobs( "user = ? AND state IN ( 'PENDING', 'RUNNING' )", ( getpass.getuser(), ) ) )
+    cluster.set_meta( max_submit = queued + 1 )
+    with pytest.raises( RuntimeError, match = "2 of 3 jobs could not be submitted" ):
+        submit_many( files, workers = 1 )
+    # the submitted job is recorded nonetheless
+    assert ledger().last().script == files[0]
+
+def test_the_array_driver_is_removed_if_sbatch_fails( cluster, job_files ):
+    files = job_files( 4 )
+    cluster.set_meta( max_array_size = 2 )
+    with pytest.raises( RuntimeError ):
+        submit_array( files )
+    assert not drivers( files )
+
+def test_the_array_driver_is_removed_if_sbatch_times_out( cluster, job_files, monkeypatch ):
+    files = job_files( 4 )
+    monkeypatch.setenv( "FAKESLURM_LATENCY", "2" )
+    monkeypatch.setenv( "SLURMTOOLS_TIMEOUT", "0.5" )
+    with pytest.raises( TimeoutError ):
+        submit_array( files )
+    assert not drivers( files )